@@ -0,0 +1,57 @@
+import argparse
+import sys
+from typing import Optional
+
+from benchmarks.run import BenchmarkRun
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="CompareBenchmarks", description="Compare two runs of the benchmark suite")
+
+    parser.add_argument("baseline", help="JSON results of the baseline run, e.g. from the main branch", type=str)
+
+    parser.add_argument("candidate", help="JSON results of the run to check", type=str)
+
+    parser.add_argument("--tolerance", help="Slowdown reported as a regression, as a fraction", type=float, default=0.1)
+
+    return parser
+
+
+def compare(baseline: BenchmarkRun, candidate: BenchmarkRun, tolerance: float) -> list[str]:
+    """Print the change in median time of every stage and size in both runs
+
+    Returns:
+        list[str]: stages and sizes that are slower than the baseline by more than `tolerance`
+    """
+    base = {(result.stage, result.rows): result.seconds for result in baseline.results}
+    regressions = []
+
+    print(f"{'stage':<15} {'rows':>10} {baseline.git_sha:>10} {candidate.git_sha:>10} {'change':>8}")
+    for result in candidate.results:
+        before = base.get((result.stage, result.rows))
+        if before is None:
+            continue
+
+        change = result.seconds / before - 1
+        flag = ""
+        if change > tolerance:
+            regressions.append(f"{result.stage} ({result.rows} rows)")
+            flag = " regression"
+        print(f"{result.stage:<15} {result.rows:>10} {before:10.3f} {result.seconds:10.3f} {change:+8.0%}{flag}")
+
+    return regressions
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = BenchmarkRun.model_validate_json(f.read())
+    with open(args.candidate) as f:
+        candidate = BenchmarkRun.model_validate_json(f.read())
+
+    return 1 if compare(baseline, candidate, args.tolerance) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
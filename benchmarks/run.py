@@ -0,0 +1,203 @@
+import argparse
+import gc
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Optional
+
+from pydantic import BaseModel, computed_field
+
+from benchmarks.synthetic import make_model_output, make_reference_library, parse_size
+from config.app import DataLakeConfig, WorkerConfig
+from precalculator.fetcher import LocalPredictionFetcher
+from precalculator.instrumentation import current_rss, peak_rss, reset_peak_rss
+from precalculator.models import validate_predictions
+from precalculator.writer import INPUT_FILE_NAME, PredictionWriter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_ID = "eos0bench"
+REQUEST_ROWS = 1000  # rows per fetch request, as sent by a typical client
+STAGES = ["split_csv", "postprocess", "validate", "write_parquet", "fetch"]
+
+# never used to reach AWS: every stage reads and writes local files
+CONFIG = DataLakeConfig(
+    s3_bucket_name="benchmark",
+    s3_input_prefix="input",
+    s3_output_prefix="output",
+    s3_upload_prefix="upload",
+    athena_database="benchmark",
+    athena_prediction_table="predictions",
+    athena_request_table="requests",
+)
+
+
+class StageResult(BaseModel):
+    """Timings of one benchmark stage at one size"""
+
+    stage: str
+    rows: int
+    runs: list[float]  # seconds
+    peak_rss: int = 0  # bytes, highest resident memory of the process during any run
+    memory: int = 0  # bytes, largest increase of resident memory over its level before a run
+
+    @computed_field  # type: ignore[misc]
+    @property
+    def seconds(self) -> float:
+        return statistics.median(self.runs)
+
+
+class BenchmarkRun(BaseModel):
+    """Results of a run of the suite, stored as JSON to compare between commits"""
+
+    timestamp: int
+    git_sha: str
+    python: str
+    machine: str
+    results: list[StageResult]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="Benchmarks", description="Time the pipeline stages offline on synthetic reference libraries"
+    )
+
+    parser.add_argument(
+        "--sizes", help="Comma-separated numbers of rows, e.g. 10k,100k,2M", type=str, default="10k,100k,2M"
+    )
+
+    parser.add_argument("--stages", help="Comma-separated stages to run", type=str, default=",".join(STAGES))
+
+    parser.add_argument("--outputs", help="Number of model output columns", type=int, default=1)
+
+    parser.add_argument("--repeat", help="Runs per stage and size, the median is compared", type=int, default=3)
+
+    parser.add_argument("--output", help="JSON file the results are written to", type=str, default=None)
+
+    return parser
+
+
+def git_sha() -> str:
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=ROOT)
+    return result.stdout.strip()
+
+
+def timed(fn: Callable[[], object], repeat: int) -> tuple[list[float], int, int]:
+    """Run times of `fn`, and the peak and increase of resident memory over the runs"""
+    runs = []
+    peak, memory = 0, 0
+    for _ in range(repeat):
+        gc.collect()
+        reset_peak_rss()
+        before = current_rss()
+
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+
+        peak = max(peak, peak_rss())
+        memory = max(memory, peak_rss() - before)
+    return runs, peak, memory
+
+
+def run_size(n_rows: int, stages: list[str], n_outputs: int, repeat: int, workdir: str) -> list[StageResult]:
+    """Run the stages on synthetic data of `n_rows` rows, generated in `workdir`"""
+    library = make_reference_library(n_rows)
+    output = make_model_output(n_rows, n_outputs, inputs=library["smiles"].to_numpy())
+
+    library.to_csv(os.path.join(workdir, INPUT_FILE_NAME), index=False)
+    output_path = os.path.join(workdir, "output.csv")
+    output.to_csv(output_path, index=False)
+
+    worker_config = WorkerConfig(git_sha="benchmark", denominator=4, numerator=1)
+    writer = PredictionWriter(CONFIG, worker_config, MODEL_ID, dev=False)
+    predictions = writer.postprocess(output_path)
+
+    request_path = os.path.join(workdir, "request.csv")
+    output["key"].sample(min(REQUEST_ROWS, n_rows), random_state=0).to_csv(request_path, index=False, header=False)
+
+    def split_csv() -> None:
+        # _split_csv works on the reference library in the working directory, as in the GitHub Actions workers
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            writer._split_csv()  # noqa: SLF001
+        finally:
+            os.chdir(cwd)
+
+    # the writers write local datasets with pyarrow instead of awswrangler, and register no Glue partitions
+    lake_writer = PredictionWriter(
+        CONFIG, worker_config, MODEL_ID, dev=False, dataset_path=os.path.join(workdir, "lake")
+    )
+
+    def write_parquet() -> None:
+        lake_writer.write_to_lake(predictions)
+
+    dataset_path = os.path.join(workdir, "dataset")
+    dataset_writer = PredictionWriter(CONFIG, worker_config, MODEL_ID, dev=False, dataset_path=dataset_path)
+    fetcher = LocalPredictionFetcher(CONFIG, "benchmark", MODEL_ID, engine="arrow", dataset_path=dataset_path)
+
+    def fetch() -> None:
+        found = fetcher.fetch(request_path)
+        assert len(found) == min(REQUEST_ROWS, n_rows)
+
+    benchmarks = {
+        "split_csv": split_csv,
+        "postprocess": lambda: writer.postprocess(output_path),
+        "validate": lambda: validate_predictions(predictions, MODEL_ID),
+        "write_parquet": write_parquet,
+        "fetch": fetch,
+    }
+
+    results = []
+    for stage in stages:
+        if stage == "fetch" and not os.path.exists(dataset_path):
+            dataset_writer.write_to_lake(predictions)
+
+        runs, peak, memory = timed(benchmarks[stage], repeat)
+        result = StageResult(stage=stage, rows=n_rows, runs=runs, peak_rss=peak, memory=memory)
+        print(
+            f"{stage:<15} {n_rows:>10} rows {result.seconds:10.3f} s "
+            f"{result.memory / 1024**2:8.1f} MiB (peak {result.peak_rss / 1024**2:.1f} MiB)",
+            flush=True,
+        )
+        results.append(result)
+
+    return results
+
+
+def run(sizes: list[int], stages: list[str], n_outputs: int = 1, repeat: int = 3) -> BenchmarkRun:
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise ValueError(f"Unknown stages {sorted(unknown)}, expected some of {STAGES}")
+
+    results = []
+    for n_rows in sizes:
+        with tempfile.TemporaryDirectory(prefix="precalculator-benchmark-") as workdir:
+            results += run_size(n_rows, stages, n_outputs, repeat, workdir)
+
+    return BenchmarkRun(
+        timestamp=int(time.time()),
+        git_sha=git_sha(),
+        python=sys.version.split()[0],
+        machine=f"{platform.machine()} {os.cpu_count()} cores",
+        results=results,
+    )
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+    benchmark_run = run(sizes, args.stages.split(","), args.outputs, args.repeat)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            f.write(benchmark_run.model_dump_json(indent=2))
+
+
+if __name__ == "__main__":
+    main()
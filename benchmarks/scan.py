@@ -0,0 +1,112 @@
+import argparse
+import bisect
+import os
+import tempfile
+from typing import Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+from pydantic import BaseModel, computed_field
+
+from benchmarks.synthetic import make_model_output, parse_size
+from precalculator.compaction import DEFAULT_ROW_GROUP_SIZE, compact_partition
+from precalculator.generations import current_path, list_data_files
+from precalculator.layout import KEY_BUCKET_COLUMN, key_buckets
+from precalculator.writer import to_prediction_frame
+
+MODEL_ID = "eos0bench"
+DEFAULT_REQUESTS = "1,100,300,1000"
+
+
+class ScanResult(BaseModel):
+    """Data a lookup of a request's keys reads from a model partition, pruned by key bucket and row-group statistics"""
+
+    keys: int
+    buckets: int  # key buckets the request touches
+    row_groups: int  # row groups whose key range holds a requested key
+    bytes: int  # compressed size of those row groups
+    partition_bytes: int  # compressed size of every row group of the partition
+
+    @computed_field  # type: ignore[misc]
+    @property
+    def fraction(self) -> float:
+        return self.bytes / self.partition_bytes if self.partition_bytes else 0.0
+
+
+def scanned_bytes(partition_path: str, keys: list[str], filesystem: pafs.FileSystem) -> ScanResult:
+    """Bytes of a compacted model partition that a lookup of `keys` reads, as Athena and pyarrow prune it.
+
+    Only the key buckets of the keys are listed, and in their files only the row groups whose `key` statistics could
+    hold a requested key are read. Footers are not counted.
+    """
+    buckets = set(key_buckets(keys))
+    keys = sorted(set(keys))
+    result = ScanResult(keys=len(keys), buckets=len(buckets), row_groups=0, bytes=0, partition_bytes=0)
+
+    for info in list_data_files(filesystem, current_path(filesystem, partition_path)):
+        metadata = pq.read_metadata(info.path, filesystem=filesystem)
+        bucket = os.path.basename(os.path.dirname(info.path)).removeprefix(f"{KEY_BUCKET_COLUMN}=")
+        key_column = metadata.schema.names.index("key")
+
+        for i in range(metadata.num_row_groups):
+            row_group = metadata.row_group(i)
+            size = sum(row_group.column(j).total_compressed_size for j in range(row_group.num_columns))
+            result.partition_bytes += size
+            if bucket not in buckets:
+                continue
+
+            statistics = row_group.column(key_column).statistics
+            if statistics is not None and statistics.has_min_max:
+                first = bisect.bisect_left(keys, statistics.min)
+                if first == len(keys) or keys[first] > statistics.max:
+                    continue
+            result.row_groups += 1
+            result.bytes += size
+
+    return result
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="ScanBenchmark", description="Bytes a key lookup reads from a compacted synthetic model partition"
+    )
+
+    parser.add_argument("--size", help="Rows of the partition, e.g. 100k or 2M", type=str, default="2M")
+
+    parser.add_argument(
+        "--requests", help="Comma-separated numbers of keys per request", type=str, default=DEFAULT_REQUESTS
+    )
+
+    parser.add_argument("--row-group-size", help="Rows per Parquet row group", type=int, default=DEFAULT_ROW_GROUP_SIZE)
+
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+    n_rows = parse_size(args.size)
+    filesystem = pafs.LocalFileSystem()
+
+    with tempfile.TemporaryDirectory(prefix="precalculator-scan-") as workdir:
+        output = make_model_output(n_rows)
+        predictions = to_prediction_frame(output, MODEL_ID).drop(columns=["model_id"])
+        partition_path = os.path.join(workdir, f"model_id={MODEL_ID}")
+        os.makedirs(partition_path)
+        pq.write_table(pa.Table.from_pandas(predictions, preserve_index=False), f"{partition_path}/part.parquet")
+        compact_partition(partition_path, filesystem=filesystem, row_group_size=args.row_group_size)
+
+        rng = np.random.default_rng(0)
+        print(f"{'keys':>6} {'buckets':>8} {'row groups':>11} {'MiB read':>9} {'of MiB':>8} {'fraction':>9}")
+        for n_keys in [parse_size(size) for size in args.requests.split(",")]:
+            keys = rng.choice(output["key"].to_numpy(), size=min(n_keys, n_rows), replace=False).tolist()
+            result = scanned_bytes(partition_path, keys, filesystem)
+            print(
+                f"{result.keys:>6} {result.buckets:>8} {result.row_groups:>11} {result.bytes / 1024**2:>9.1f} "
+                f"{result.partition_bytes / 1024**2:>8.1f} {result.fraction:>9.1%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
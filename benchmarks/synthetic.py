@@ -0,0 +1,85 @@
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Fragments joined into SMILES-like inputs. They are not valid molecules, but have the length and alphabet of the
+# reference library, which is what CSV parsing and Parquet encoding costs depend on.
+FRAGMENTS = np.array(["C", "CC", "O", "N", "c1ccccc1", "C(=O)", "Cl", "F", "S(=O)(=O)", "[N+](=O)[O-]", "C1CCNCC1"])
+LETTERS = np.frombuffer(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ", dtype=np.uint8)
+
+
+def parse_size(size: str) -> int:
+    """Number of rows from a size such as 10k, 100k or 2M"""
+    multipliers = {"k": 1_000, "m": 1_000_000}
+    size = size.strip().lower()
+    if size[-1] in multipliers:
+        return int(float(size[:-1]) * multipliers[size[-1]])
+    return int(size)
+
+
+def make_keys(n_rows: int, rng: np.random.Generator) -> np.ndarray:
+    """Distinct random InChIKey-shaped keys, e.g. PCQFQFRJSWBMEL-UHFFFAOYSA-N"""
+    # random leading letters spread keys over the key buckets, and the row number in base 26 makes them distinct
+    chars = np.empty((n_rows, 27), dtype=np.uint8)
+    chars[:, :4] = LETTERS[rng.integers(0, 26, size=(n_rows, 4))]
+    chars[:, 4:14] = LETTERS[_digits(np.arange(n_rows), 10)]
+    chars[:, 14] = ord("-")
+    chars[:, 15:23] = LETTERS[rng.integers(0, 26, size=(n_rows, 8))]
+    chars[:, 23:] = np.frombuffer(b"SA-N", dtype=np.uint8)
+    return chars.view("S27").ravel().astype(str)
+
+
+def _digits(values: np.ndarray, width: int) -> np.ndarray:
+    digits = np.empty((len(values), width), dtype=np.int64)
+    for i in range(width - 1, -1, -1):
+        digits[:, i] = values % 26
+        values = values // 26
+    return digits
+
+
+def make_inputs(n_rows: int, rng: np.random.Generator) -> np.ndarray:
+    """Distinct SMILES-like inputs of 5 to 12 fragments"""
+    lengths = rng.integers(5, 13, size=n_rows)
+    picks = rng.integers(0, len(FRAGMENTS), size=(n_rows, 12))
+
+    fragments = pa.array(FRAGMENTS)
+    columns = [pc.take(fragments, pa.array(picks[:, i], mask=i >= lengths)) for i in range(12)]
+    # a unique suffix, like the ring closures and stereo markers that tell real molecules apart
+    columns.append(pa.array(np.char.add("C", np.arange(n_rows).astype(str))))
+
+    return pc.binary_join_element_wise(*columns, "", null_handling="skip").to_numpy(zero_copy_only=False)
+
+
+def make_reference_library(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """Synthetic reference library with a single `smiles` column"""
+    return pd.DataFrame({"smiles": make_inputs(n_rows, np.random.default_rng(seed))})
+
+
+def make_model_output(
+    n_rows: int, n_outputs: int = 1, seed: int = 0, inputs: Optional[np.ndarray] = None
+) -> pd.DataFrame:
+    """Synthetic Ersilia output shaped like tests/fixtures/test_output.csv: key, input and one column per output
+
+    Args:
+        n_rows (int): number of rows
+        n_outputs (int): number of model output columns, named like the fixture's `mw` for a single output
+        seed (int): random seed, so runs at the same size are comparable
+        inputs (Optional[np.ndarray]): inputs to predict, e.g. a reference library, generated if not given
+
+    Returns:
+        pd.DataFrame: model output
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        {
+            "key": make_keys(n_rows, rng),
+            "input": inputs if inputs is not None else make_inputs(n_rows, rng),
+        }
+    )
+    names = ["mw"] if n_outputs == 1 else [f"feat_{i}" for i in range(n_outputs)]
+    for name in names:
+        df[name] = np.round(rng.uniform(50, 800, n_rows), 3)
+    return df
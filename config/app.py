@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Literal, Optional
 
 from pydantic import BaseModel
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -16,9 +16,24 @@ class DataLakeConfig(BaseSettings):
     athena_prediction_table: str
     athena_request_table: str
 
+    s3_meta_prefix: str = "meta"
+
+    dynamodb_table_name: str = "precalculations"  # table served by the precalculations API
+
+    local_fetch_max_rows: int = 10000  # requests up to this size are read from Parquet directly instead of Athena
+
 
 class WorkerConfig(BaseModel):
     git_sha: str
     denominator: int  # the total number of workers to split data over
     numerator: int  # the number assigned to this worker
     sample: Optional[str] = None  # sample size of reference library (in number of rows)
+    delta: bool = False  # only predict inputs that are not yet in the data lake for this model
+    chunk_size: Optional[int] = None  # if set, run the model and upload outputs chunk by chunk in a pipeline
+    queue_depth: int = 2  # maximum number of finished chunks waiting to be uploaded in pipelined mode
+    processes: int = 1  # number of concurrent model processes, 0 to size from CPU cores and available memory
+    batch_size: int = 1000  # batch size passed to the Ersilia CLI, 0 to autotune (or reuse a previously tuned size)
+    scheduler: Literal["static", "dynamic"] = "static"  # fixed numerator/denominator slice, or claim work units
+    unit_size: int = 10000  # number of inputs per work unit with the dynamic scheduler
+    lease_seconds: int = 600  # how long a claimed work unit is reserved for this worker without being renewed
+    run_id: Optional[str] = None  # ID shared by all workers of a pipeline run, used to coordinate work units
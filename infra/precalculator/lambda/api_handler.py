@@ -1,17 +1,127 @@
+import functools
 import json
 import logging
 import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
 
 import boto3
+from boto3.dynamodb.types import TypeDeserializer
 
+from cache import MISSING, TTLCache
+
+MAX_BATCH_KEYS = 100  # DynamoDB limit per batch_get_item call
+MAX_WORKERS = 16
+MAX_ATTEMPTS = 8
+BASE_DELAY = 0.05  # seconds, doubled on every retry of unprocessed keys
+MAX_DELAY = 2.0
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+deserializer = TypeDeserializer()
+
+# (model_id, key) -> {"smiles", "value"}, or None for keys without a precalculation; reused by warm invocations
+prediction_cache = TTLCache(
+    max_size=int(os.environ.get("PREDICTION_CACHE_SIZE", 100000)),
+    ttl=float(os.environ.get("PREDICTION_CACHE_TTL", 300)),
+)
+
+
+@functools.cache
+def dynamodb_client():
+    """Client shared by all invocations of a container (and all threads, as clients are thread-safe)"""
+    return boto3.client("dynamodb")
+
+
+def get_batch(client, table_name: str, keys: list[dict]) -> list[dict]:
+    """Read one batch of at most 100 keys, retrying unprocessed keys with jittered exponential backoff
+
+    Args:
+        client: boto3 DynamoDB client (thread-safe, unlike the resource)
+        table_name (str): name of the table
+        keys (list[dict]): serialized primary keys
+
+    Returns:
+        list[dict]: deserialized items with the PK, Smiles and Precalculation attributes
+    """
+    request = {
+        table_name: {
+            "Keys": keys,
+            "ProjectionExpression": "#pk, #smiles, #precalculation",
+            "ExpressionAttributeNames": {"#pk": "PK", "#smiles": "Smiles", "#precalculation": "Precalculation"},
+        }
+    }
+    items = []
+
+    for attempt in range(MAX_ATTEMPTS):
+        response = client.batch_get_item(RequestItems=request)
+        items += response.get("Responses", {}).get(table_name, [])
+
+        request = response.get("UnprocessedKeys") or {}
+        if not request:
+            return [{name: deserializer.deserialize(value) for name, value in item.items()} for item in items]
+
+        # full jitter, so that throttled batches don't retry in lockstep
+        time.sleep(random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2**attempt)))
+
+    raise RuntimeError(f"{len(request[table_name]['Keys'])} keys still unprocessed after {MAX_ATTEMPTS} attempts")
 
-def handler(event, context):
-    # init dynamodb table
-    logger = logging.getLogger(__name__)
-    dynamodb = boto3.resource("dynamodb")
 
+def get_precalculations(
+    client, table_name: str, model_id: str, input_keys: list[str], max_workers: int = MAX_WORKERS, cache=None
+) -> list[dict]:
+    """Look up the precalculations of a model for a list of input keys
+
+    Keys are deduplicated, looked up in the cache if one is given, and the rest read in batches of 100 on a bounded
+    thread pool.
+
+    Returns:
+        list[dict]: smiles and value of every key that was found, in the order of `input_keys`
+    """
+    found = {}
+    missing_keys = []
+    for key in dict.fromkeys(input_keys):
+        cached = cache.get((model_id, key)) if cache is not None else MISSING
+        if cached is MISSING:
+            missing_keys.append(key)
+        elif cached is not None:
+            found[key] = cached
+
+    batches = [
+        [
+            {"PK": {"S": f"INPUTKEY#{key}"}, "SK": {"S": f"MODELID#{model_id}"}}
+            for key in missing_keys[i : i + MAX_BATCH_KEYS]
+        ]
+        for i in range(0, len(missing_keys), MAX_BATCH_KEYS)
+    ]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        responses = executor.map(lambda batch: get_batch(client, table_name, batch), batches)
+        items = {item["PK"].removeprefix("INPUTKEY#"): item for batch_items in responses for item in batch_items}
+
+    logger.info("Found %s of %s uncached keys in %s batches.", len(items), len(missing_keys), len(batches))
+
+    for key in missing_keys:
+        item = items.get(key)
+        found[key] = {"smiles": item["Smiles"].replace("\n", ""), "value": item["Precalculation"]} if item else None
+        if cache is not None:
+            cache.put((model_id, key), found[key])
+
+    return [found[key] for key in input_keys if found.get(key) is not None]
+
+
+def _to_json(value):
+    # numbers are deserialized as Decimal
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def handler(event, context):
+    client = dynamodb_client()
     table_name = os.environ.get("TABLE_NAME")
-    table = dynamodb.Table(table_name)
 
     if event["body"]:
         item = json.loads(event["body"])
@@ -21,16 +131,10 @@ def handler(event, context):
         model_id = item["modelId"]
         input_keys = item["inputKeyArray"]
 
-        # define keys to be searched for batch query
-        batch_keys = {
-            table.name: {
-                "Keys": [{"PK": f"INPUTKEY#{key}", "SK": f"MODELID#{model_id}"} for key in input_keys],
-            },
-        }
-
         try:
-            dynamo_response = dynamodb.batch_get_item(RequestItems=batch_keys)
+            output = get_precalculations(client, table_name, model_id, input_keys, cache=prediction_cache)
         except Exception:
+            logger.exception("Failed to read precalculations")
             return {
                 "isBase64Encoded": False,
                 "statusCode": 500,
@@ -38,23 +142,15 @@ def handler(event, context):
                 "body": json.dumps({}),
             }  # catch-all internal server error for any exceptions
 
-        for response_table, response_items in dynamo_response.items():
-            logger.info("Got %s items from %s.", len(response_items), response_table)
+        logger.info("Prediction cache: %s", prediction_cache.stats())
 
-        # parse smiles and precalc value from response
-        results = {
-            "model_id": model_id,
-            "output": [
-                {"smiles": item["Smiles"].replace("\n", ""), "value": item["Precalculation"]}
-                for item in dynamo_response["Responses"][table.name]
-            ],
-        }
+        results = {"model_id": model_id, "output": output}
 
         return {
             "isBase64Encoded": False,
             "statusCode": 200,
             "headers": {"Content-Type": "application/json"},
-            "body": json.dumps(results),
+            "body": json.dumps(results, default=_to_json),
         }
     else:
         logging.info("## Received request without a payload")
@@ -0,0 +1,61 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, max_size: int = 10000, ttl: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        """Bounded least-recently-used cache whose entries expire `ttl` seconds after they were stored.
+
+        Meant to live at module level in a Lambda, so that warm invocations reuse lookups of earlier ones. The TTL
+        bounds how stale an entry can get, e.g. how long a newly precalculated model is still reported as missing.
+
+        Args:
+            max_size (int): maximum number of entries, the least recently used one is evicted beyond that
+            ttl (float): seconds an entry stays valid
+            clock (Callable[[], float]): monotonic time source, replaceable in tests
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:  # noqa: ANN401
+        """Cached value of `key`, or `default` if it is absent or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:  # noqa: ANN401
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict[str, int]:
+        """Counters since the cache was created, i.e. since the Lambda container started"""
+        return {"size": len(self), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
@@ -0,0 +1,91 @@
+import functools
+import json
+import logging
+import os
+
+from jobs import FAILED, QUEUED, SUCCEEDED, JobConflict, is_expired, job_store, new_job, update_job
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+@functools.cache
+def aws_client(service: str):
+    """Client shared by all invocations of a container"""
+    import boto3
+
+    return boto3.client(service)
+
+
+def _response(status_code: int, body: dict) -> dict:
+    return {"statusCode": status_code, "headers": {"Content-Type": "application/json"}, "body": json.dumps(body)}
+
+
+def submit_handler(event: dict, context: dict) -> dict:
+    """Start fetching predictions in the background
+
+    Args:
+        event (dict): request with `modelid` and `requestid` query string parameters, for an uploaded input CSV
+        context (dict): _description_
+
+    Returns:
+        job (dict): the queued job, whose `job_id` is polled with the status endpoint
+    """
+    params = event.get("queryStringParameters") or {}
+    request_id = params.get("requestid")
+    model_id = params.get("modelid")
+
+    if not request_id or not model_id:
+        return _response(400, {"error": "modelid and requestid are required"})
+
+    job = new_job(model_id, request_id)
+    if job_store().create(job) is None:
+        return _response(409, {"error": f"Job {job['job_id']} already exists"})
+
+    # the worker runs with its own, much longer timeout, while this request returns right away
+    aws_client("lambda").invoke(
+        FunctionName=os.environ.get("FETCH_WORKER_FUNCTION"),
+        InvocationType="Event",
+        Payload=json.dumps({"job_id": job["job_id"]}),
+    )
+    logger.info(f"Queued job {job['job_id']} for request {request_id} of model {model_id}")
+
+    return _response(202, job)
+
+
+def status_handler(event: dict, context: dict) -> dict:
+    """Report the progress of a fetch job
+
+    Args:
+        event (dict): request with a `jobid` query string parameter
+        context (dict): _description_
+
+    Returns:
+        job (dict): status and stage of the job, with a pre-signed `result_url` to download the CSV once it succeeded
+    """
+    job_id = (event.get("queryStringParameters") or {}).get("jobid")
+    store = job_store()
+    current = store.read(job_id) if job_id else None
+
+    if current is None:
+        return _response(404, {"error": f"No job {job_id}"})
+    job = current[0]
+
+    if is_expired(job):
+        # the job would otherwise stay queued or running forever, as no worker is left to record its outcome
+        if job["status"] == QUEUED:
+            error = "The job was not started before its deadline"
+        else:
+            error = "The worker timed out or ran out of memory"
+        try:
+            job, _ = update_job(store, *current, status=FAILED, error=error)
+        except JobConflict:
+            job = store.get(job_id)
+
+    if job["status"] == SUCCEEDED:
+        # generated on each poll, so the URL is valid for an hour from when the client asks for it
+        job["result_url"] = aws_client("s3").generate_presigned_url(
+            "get_object", Params={"Bucket": os.environ.get("BUCKET_NAME"), "Key": job["output_key"]}, ExpiresIn=3600
+        )
+
+    return _response(200, job)
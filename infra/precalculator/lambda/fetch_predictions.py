@@ -1,8 +1,38 @@
-import boto3
+import csv
+import functools
+import io
+import json
 import logging
 import os
 import sys
-import awswrangler as wr
+import time
+
+# shared with the local fetcher, shipped in the precalculator layer (standard library only)
+from precalculator.layout import request_keys
+from precalculator.membership import MEMBERSHIP_FILE, BloomFilter, split_request
+from precalculator.query import PREDICTION_COLUMNS, build_prediction_query, uses_request_table
+
+from cache import TTLCache
+from jobs import (
+    FAILED,
+    QUEUED,
+    RUNNING,
+    SUCCEEDED,
+    WORKER_TIMEOUT_SECONDS,
+    JobConflict,
+    is_expired,
+    job_store,
+    update_job,
+)
+
+# boto3, pandas and awswrangler are imported where they are needed, so that a cold start only pays for the
+# dependencies of the path a request takes: invalid requests need none of them and small requests no pandas.
+
+QUERY_POLL_SECONDS = 0.25
+
+# model_id -> ETag and membership filter of the model's partition (or None if there is none); revalidated by every
+# invocation that reuses it, so the TTL only bounds how long an unused filter is kept
+membership_cache = TTLCache(max_size=8, ttl=float(os.environ.get("MEMBERSHIP_CACHE_TTL", 3600)))
 
 
 def handler(event: dict, context: dict) -> dict:
@@ -15,8 +45,16 @@ def handler(event: dict, context: dict) -> dict:
     Returns:
         pd.DataFrame: predictions
     """
-    request_id = event["queryStringParameters"]["requestid"]
-    model_id = event["queryStringParameters"]["modelid"]
+    params = event.get("queryStringParameters") or {}
+    request_id = params.get("requestid")
+    model_id = params.get("modelid")
+
+    if not request_id or not model_id:
+        return {
+            "statusCode": 400,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps({"error": "modelid and requestid are required"}),
+        }
 
     fetcher = PredictionFetcher(request_id, model_id)
     path_to_input = fetcher.get_s3_input_location()
@@ -24,13 +62,70 @@ def handler(event: dict, context: dict) -> dict:
     return {"statusCode": 200, "headers": {"Content-Type": "application/json"}, "body": output_s3_url}
 
 
-# TODO: merge PredictionFetchers in model-inference-pipeline repo and
-# maybe create deployment package
+def job_handler(event: dict, context: dict) -> None:
+    """Run a fetch job queued by fetch_jobs.submit_handler, recording its progress in the job store
+
+    Args:
+        event (dict): asynchronous invocation payload with the `job_id`
+        context (dict): Lambda context, whose remaining time is recorded as the job's deadline
+    """
+    store = job_store()
+    current = store.read(event["job_id"])
+
+    # asynchronous invocations can be delivered more than once, and only one of them may run the job
+    if current is None or current[0]["status"] != QUEUED:
+        logging.info(f"## Skipping job {event['job_id']}, which is not queued")
+        return
+    if is_expired(current[0]):
+        # the status endpoint fails it, possibly while this invocation would run it
+        logging.info(f"## Skipping job {event['job_id']}, which was queued past its deadline")
+        return
+
+    if hasattr(context, "get_remaining_time_in_millis"):
+        timeout = context.get_remaining_time_in_millis() / 1000
+    else:
+        timeout = WORKER_TIMEOUT_SECONDS
+    try:
+        job, version = update_job(store, *current, status=RUNNING, deadline_at=int(time.time() + timeout))
+    except JobConflict:
+        logging.info(f"## Skipping job {event['job_id']}, which another invocation started")
+        return
+
+    def report(stage: str) -> None:
+        nonlocal job, version
+        job, version = update_job(store, job, version, stage=stage)
+
+    fetcher = PredictionFetcher(job["request_id"], job["model_id"], progress=report)
+    try:
+        fetcher.fetch(fetcher.get_s3_input_location())
+    except JobConflict:
+        # only the status endpoint writes a running job besides its worker, when it has already expired it
+        fetcher.logger.exception(f"Job {job['job_id']} was failed while running")
+        return
+    except Exception as e:
+        # the job is marked as failed rather than re-raising, so that the invocation is not retried
+        fetcher.logger.exception(f"Job {job['job_id']} failed")
+        update_job(store, job, version, status=FAILED, error=str(e))
+        return
+
+    update_job(store, job, version, status=SUCCEEDED, stage=None, output_key=fetcher.get_output_key())
+
+
+@functools.cache
+def aws_client(service: str):
+    """Client shared by all invocations of a container"""
+    import boto3
+
+    return boto3.client(service)
+
+
 class PredictionFetcher:
-    def __init__(self, request_id: str, model_id: str, dev: bool = False):
+    def __init__(self, request_id: str, model_id: str, dev: bool = False, progress=None):
         self.request_id = request_id
         self.model_id = model_id
         self.dev = dev
+        self.progress = progress  # called with the name of each stage the fetch enters
+        self.request_keys = None
 
         self.logger = logging.getLogger("PredictionFetcher")
         self.logger.setLevel(logging.INFO)
@@ -48,58 +143,120 @@ class PredictionFetcher:
             f"{self.request_id}.csv",
         )
 
+    def get_output_key(self) -> str:
+        return f"{os.environ.get('S3_OUTPUT_PREFIX')}/{self.model_id}/{self.request_id}.csv"
+
+    def _enter_stage(self, stage: str) -> None:
+        if self.progress is not None:
+            self.progress(stage)
+
     def fetch(self, path_to_input: str):
         logger = self.logger
 
         logger.info("reading and formatting input data")
-        input_df = self._read_input_data(path_to_input)
-        logger.info(input_df.head())
+        self._enter_stage("reading_input")
+        inputs = self._read_input_data(path_to_input)
+        logger.info(inputs[:5])
+
+        column, values = self._get_request_values(inputs)
+
+        membership = self._load_membership()
+        if membership is not None:
+            values, missing = split_request(membership, values)
+            logger.info(f"{len(values)} inputs may have precalculations, {len(missing)} certainly don't")
 
-        logger.info("writing input to athena")
-        self._write_inputs_s3(input_df)
+        if len(values) == 0:
+            logger.info("no precalculations for this request, skipping the query")
+            self._write_empty_output_s3()
+            return self._get_output_presigned_url()
+
+        # small requests are inlined in the query, so only large ones need to be written to the requests table
+        if uses_request_table(len(values)):
+            logger.info("writing input to athena")
+            self._enter_stage("writing_request")
+            self._write_inputs_s3(values)
 
         logger.info("fetching outputs from athena")
-        output_df = self._read_predictions_from_s3()
+        self._enter_stage("querying")
+        result_location = self._read_predictions_from_s3(column, values)
 
         logger.info("storing outputs into s3")
-        self._write_outputs_s3(output_df)
+        self._enter_stage("writing_output")
+        self._write_outputs_s3(result_location)
 
         logger.info("returning presigned url")
         output_presigned_url = self._get_output_presigned_url()
 
         return output_presigned_url
 
-    def _read_input_data(self, path_to_input: str):
-        """Reads input CSV from user and processes it for writing to the data lake
+    def _read_input_data(self, path_to_input: str) -> list[str]:
+        """Reads input CSV from user
 
         Args:
             path_to_input (str): location of input CSV
 
         Returns:
-            pd.DataFrame: formatted data frame
+            list[str]: inputs of the request
         """
+        bucket, key = path_to_input.removeprefix("s3://").split("/", 1)
+        body = aws_client("s3").get_object(Bucket=bucket, Key=key)["Body"].read().decode("utf-8")
 
         # expect just a list of input with no header
-        df = wr.s3.read_csv(path=path_to_input, header=None)
-        df.rename(columns={0: "input"}, inplace=True)
+        inputs = [row[0] for row in csv.reader(io.StringIO(body)) if row and row[0]]
 
         # TODO: validate input?
         ## for example -----------------------------------------
         # cid = CompoundIdentifier()
-        # valid_input = df.apply(lambda x: cid._is_input(x))
+        # valid_input = [cid._is_input(x) for x in inputs]
+        # ------------------------------------------------------
 
-        # df_invalid = df[~valid_input]
-        # # generate invalid request summary
+        # requests made of InChIKeys only touch the key buckets of those keys
+        self.request_keys = request_keys(inputs)
 
-        # df = df[valid_input]
-        # ------------------------------------------------------
+        return inputs
+
+    def _get_request_values(self, inputs: list[str]):
+        """Column of the predictions table a request is matched on, and its distinct values"""
+        if self.request_keys is not None:
+            return "key", list(dict.fromkeys(self.request_keys))
+        return "input", list(dict.fromkeys(inputs))
+
+    def _load_membership(self):
+        """Membership filter written by the last compaction of the model's partition, if it is still current.
 
-        df["request_id"] = self.request_id
+        Every write to the partition deletes its filter, so a filter cached by an earlier invocation is only reused
+        after a conditional GET on its ETag confirms it is still there and unchanged.
+        """
+        s3 = aws_client("s3")
+        etag, membership = membership_cache.get(self.model_id, (None, None))
+        table = os.environ.get("ATHENA_PREDICTION_TABLE", "predictions")
+        request = {
+            "Bucket": os.environ.get("BUCKET_NAME"),
+            "Key": f"{table}/model_id={self.model_id}/{MEMBERSHIP_FILE}",
+        }
+        if etag is not None:
+            request["IfNoneMatch"] = etag
+
+        try:
+            response = s3.get_object(**request)
+        except s3.exceptions.NoSuchKey:
+            membership_cache.put(self.model_id, (None, None))
+            return None
+        except s3.exceptions.ClientError as e:
+            if etag is None or e.response["ResponseMetadata"]["HTTPStatusCode"] != 304:
+                raise
+            return membership  # not modified
+
+        membership = BloomFilter.from_bytes(response["Body"].read())
+        membership_cache.put(self.model_id, (response["ETag"], membership))
+        return membership
+
+    def _write_inputs_s3(self, values: list[str]) -> None:
+        import awswrangler as wr
+        import pandas as pd
 
-        return df[["input", "request_id"]]
+        input_df = pd.DataFrame({"input": values, "request_id": self.request_id})
 
-    def _write_inputs_s3(self, input_df) -> None:
-        # TODO: deduplicate repeated inputs
         wr.s3.to_parquet(
             df=input_df,
             path=os.path.join(
@@ -113,55 +270,61 @@ class PredictionFetcher:
             partition_cols=["request_id"],
         )
 
-    def _read_predictions_from_s3(self):
-        # TODO: remove DISTINCT after inputs have been deduplicated (see TODO in _write_inputs_s3)
-        query = f"""
-            with request as (
-                select distinct
-                    *
-                from
-                    requests
-                where
-                    request_id = '{self.request_id}'
-            )
-            select distinct
-                p.model_id,
-                p.key,
-                p.input,
-                p.output
-            from
-                predictions p
-                left join request r
-                    on p.input = r.input
-            where
-                p.model_id = '{self.model_id}'
+    def _read_predictions_from_s3(self, column: str, values: list[str]) -> str:
+        """Runs the prediction query in Athena
+
+        Returns:
+            str: S3 location of the query's CSV result
         """
+        query, params = build_prediction_query(
+            self.model_id,
+            self.request_id,
+            values,
+            column=column,
+            prediction_table=os.environ.get("ATHENA_PREDICTION_TABLE", "predictions"),
+            request_table=os.environ.get("ATHENA_REQUEST_TABLE", "requests"),
+            json_outputs=True,  # the CSV result is the output file of the request
+        )
 
-        df_out = wr.athena.read_sql_query(query, database=os.environ.get("ATHENA_DATABASE"))
+        athena = aws_client("athena")
+        execution_id = athena.start_query_execution(
+            QueryString=query,
+            QueryExecutionContext={"Database": os.environ.get("ATHENA_DATABASE")},
+            WorkGroup=os.environ.get("ATHENA_WORKGROUP", "primary"),
+            ExecutionParameters=params,
+        )["QueryExecutionId"]
 
-        return df_out
+        while True:
+            execution = athena.get_query_execution(QueryExecutionId=execution_id)["QueryExecution"]
+            state = execution["Status"]["State"]
 
-    def _write_outputs_s3(self, output_df):
-        """Writes outputs to S3
+            if state == "SUCCEEDED":
+                return execution["ResultConfiguration"]["OutputLocation"]
+            if state in ("FAILED", "CANCELLED"):
+                raise RuntimeError(
+                    f"Athena query {execution_id} {state}: {execution['Status'].get('StateChangeReason')}"
+                )
 
-        Args:
-            output_df (pd.DataFrame)
+            time.sleep(QUERY_POLL_SECONDS)
 
-        Returns:
-            pd.DataFrame: formatted data frame
+    def _write_outputs_s3(self, result_location: str) -> None:
+        """Copies the CSV result of the Athena query to the output location of the request
+
+        Args:
+            result_location (str): S3 location of the query result
         """
-        wr.s3.to_csv(
-            df=output_df,
-            path=os.path.join(
-                "s3://",
-                os.environ.get("BUCKET_NAME"),
-                os.environ.get("S3_OUTPUT_PREFIX"),
-                f"{self.model_id}",
-                f"{self.request_id}.csv",
-            ),
-            index=False,
+        bucket, key = result_location.removeprefix("s3://").split("/", 1)
+        aws_client("s3").copy_object(
+            Bucket=os.environ.get("BUCKET_NAME"),
+            Key=self.get_output_key(),
+            CopySource={"Bucket": bucket, "Key": key},
         )
 
+    def _write_empty_output_s3(self) -> None:
+        """Writes an output with only the header, as the Athena query would for a request without matches"""
+        header = ",".join(f'"{column}"' for column in PREDICTION_COLUMNS) + "\n"
+        aws_client("s3").put_object(Bucket=os.environ.get("BUCKET_NAME"), Key=self.get_output_key(), Body=header)
+
     def _get_output_presigned_url(self):
         """Writes outputs to S3
 
@@ -171,13 +334,12 @@ class PredictionFetcher:
         Returns:
             presigned_url (str): Pre-signed URL to download precalculations as csv
         """
-        s3_client = boto3.client("s3")
         try:
-            presigned_url = s3_client.generate_presigned_url(
+            presigned_url = aws_client("s3").generate_presigned_url(
                 "get_object",
                 Params={
                     "Bucket": os.environ.get("BUCKET_NAME"),
-                    "Key": f"{os.environ.get('S3_OUTPUT_PREFIX')}/{self.model_id}/{self.request_id}.csv",
+                    "Key": self.get_output_key(),
                 },
                 ExpiresIn=3600,
             )
@@ -1,6 +1,80 @@
+import functools
+import json
+import logging
 import os
 import boto3
 
+from cache import MISSING, TTLCache
+
+MAX_MODELS = 100  # model IDs per batch request
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# model_id -> whether precalculations exist; reused by warm invocations
+model_cache = TTLCache(max_size=1000, ttl=float(os.environ.get("MODEL_CACHE_TTL", 300)))
+# the manifest of available models written by the pipeline (see precalculator.manifest)
+manifest_cache = TTLCache(max_size=1, ttl=float(os.environ.get("MANIFEST_CACHE_TTL", 60)))
+
+
+@functools.cache
+def glue_client():
+    """Client shared by all invocations of a container"""
+    return boto3.client("glue")
+
+
+@functools.cache
+def s3_client():
+    return boto3.client("s3")
+
+
+def has_precalculations(model_id: str) -> bool:
+    # the table is partitioned by model_id and key_bucket, so look for any partition of the model
+    model_id = model_id.replace("'", "")
+    response = glue_client().get_partitions(
+        DatabaseName=os.environ.get("ATHENA_DATABASE"),
+        TableName=os.environ.get("ATHENA_PREDICTION_TABLE"),
+        Expression=f"model_id = '{model_id}'",
+        MaxResults=1,
+    )
+    return len(response["Partitions"]) > 0
+
+
+def load_manifest() -> dict:
+    """Entries of the model manifest by model ID, empty if the pipeline hasn't written one yet"""
+    models = manifest_cache.get("models")
+
+    if models is MISSING:
+        try:
+            response = s3_client().get_object(
+                Bucket=os.environ.get("BUCKET_NAME"), Key=f"{os.environ.get('S3_META_PREFIX', 'meta')}/models.json"
+            )
+            models = json.loads(response["Body"].read())["models"]
+        except s3_client().exceptions.NoSuchKey:
+            models = {}
+        manifest_cache.put("models", models)
+
+    return models
+
+
+def check_model(model_id: str, manifest: dict) -> bool:
+    """Whether a model has precalculations, from the manifest or, for models not in it, from Glue"""
+    if model_id in manifest:
+        return True
+
+    has_model = model_cache.get(model_id)
+    if has_model is MISSING:
+        has_model = False
+        try:
+            has_model = has_precalculations(model_id)
+            model_cache.put(model_id, has_model)
+        except glue_client().exceptions.EntityNotFoundException:
+            print(f"Model {model_id} not found")
+        except Exception as e:
+            print(f"An error occurred: {str(e)}")
+
+    return has_model
+
 
 def handler(event: dict, context: dict) -> bool:
     """Check model exists
@@ -13,18 +87,45 @@ def handler(event: dict, context: dict) -> bool:
         has_model (bool): whether or not precalculations for the model exist
     """
     model_id = event["queryStringParameters"]["modelid"]
-    glue_client = boto3.client("glue")
-    has_model = False
-
-    try:
-        response = glue_client.get_partition(
-            DatabaseName=os.environ.get("ATHENA_DATABASE"),
-            TableName=os.environ.get("ATHENA_PREDICTION_TABLE"),
-            PartitionValues=[model_id],
-        )
-        has_model = len(response["Partition"]["Values"]) > 0
-    except glue_client.exceptions.EntityNotFoundException:
-        print(f"Model {model_id} not found")
-    except Exception as e:
-        print(f"An error occurred: {str(e)}")
+    has_model = check_model(model_id, load_manifest())
+
+    logger.info("Model cache: %s", model_cache.stats())
     return {"statusCode": 200, "headers": {"Content-Type": "application/json"}, "body": has_model}
+
+
+def batch_handler(event: dict, context: dict) -> dict:
+    """Check which of several models have precalculations
+
+    Args:
+        event (dict): request with a comma-separated `modelids` query string parameter
+        context (dict): _description_
+
+    Returns:
+        models (dict): availability of each model, with the row count and last update time of available models
+    """
+    params = event.get("queryStringParameters") or {}
+    model_ids = list(dict.fromkeys(m.strip() for m in (params.get("modelids") or "").split(",") if m.strip()))
+
+    if not model_ids or len(model_ids) > MAX_MODELS:
+        return {
+            "statusCode": 400,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps({"error": f"modelids must list between 1 and {MAX_MODELS} model IDs"}),
+        }
+
+    manifest = load_manifest()
+    models = {}
+    for model_id in model_ids:
+        entry = manifest.get(model_id)
+        if entry is not None:
+            models[model_id] = {
+                "available": True,
+                "total_unique_preds": entry["total_unique_preds"],
+                "preds_last_updated": entry["preds_last_updated"],
+            }
+        else:
+            # e.g. a model precalculated before the manifest existed
+            models[model_id] = {"available": check_model(model_id, manifest)}
+
+    logger.info("Model cache: %s, manifest cache: %s", model_cache.stats(), manifest_cache.stats())
+    return {"statusCode": 200, "headers": {"Content-Type": "application/json"}, "body": json.dumps({"models": models})}
@@ -0,0 +1,181 @@
+import fcntl
+import functools
+import hashlib
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+# Job lifecycle: queued -> running -> succeeded | failed. While running, `stage` tells which step the worker is on.
+# A queued job whose invocation was dropped, or a running job whose worker was killed, e.g. by its timeout or for
+# running out of memory, is failed once its deadline has passed.
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+# maximum age of the fetch_predictions_worker's asynchronous invocations, after which Lambda drops them unrun
+QUEUE_TIMEOUT_SECONDS = 60 * 60
+# timeout of the fetch_predictions_worker Lambda, used as the deadline of jobs run outside of Lambda
+WORKER_TIMEOUT_SECONDS = 15 * 60
+
+
+class JobConflict(Exception):
+    """The job was written by someone else since it was read"""
+
+
+class JobStore:
+    """Store of fetch jobs. Writes are conditional on the version of the job they were based on, so that concurrent
+    writers, e.g. a redelivered worker invocation or the status endpoint expiring a job, cannot overwrite each other.
+    """
+
+    def create(self, job: dict) -> Optional[str]:
+        """Write a new job, only if no job with its ID exists. Returns its version, or None."""
+        raise NotImplementedError
+
+    def read(self, job_id: str) -> Optional[tuple[dict, str]]:
+        """Job and its version, or None if there is no such job"""
+        raise NotImplementedError
+
+    def replace(self, job: dict, version: str) -> Optional[str]:
+        """Overwrite a job only if it is still at `version`. Returns the new version, or None."""
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[dict]:
+        current = self.read(job_id)
+        return current[0] if current is not None else None
+
+
+class S3JobStore(JobStore):
+    def __init__(self, s3, bucket: str, prefix: str):
+        self.s3 = s3
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, job_id: str) -> str:
+        return f"{self.prefix}/{job_id}.json"
+
+    def _put(self, job: dict, **condition: str) -> Optional[str]:
+        try:
+            response = self.s3.put_object(
+                Bucket=self.bucket, Key=self._key(job["job_id"]), Body=json.dumps(job), **condition
+            )
+        except self.s3.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ("PreconditionFailed", "ConditionalRequestConflict", "412", "409"):
+                return None
+            raise
+        return response["ETag"]
+
+    def create(self, job: dict) -> Optional[str]:
+        return self._put(job, IfNoneMatch="*")
+
+    def read(self, job_id: str) -> Optional[tuple[dict, str]]:
+        try:
+            response = self.s3.get_object(Bucket=self.bucket, Key=self._key(job_id))
+        except self.s3.exceptions.NoSuchKey:
+            return None
+        return json.loads(response["Body"].read()), response["ETag"]
+
+    def replace(self, job: dict, version: str) -> Optional[str]:
+        return self._put(job, IfMatch=version)
+
+
+class LocalJobStore(JobStore):
+    """Job store in a local directory, standing in for S3 in tests"""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    @contextmanager
+    def _lock(self) -> Iterator[None]:
+        with open(os.path.join(self.root, ".lock"), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.root, f"{job_id}.json")
+
+    def _write(self, job: dict) -> str:
+        path = self._path(job["job_id"])
+        body = json.dumps(job).encode("utf-8")
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(body)
+        os.replace(f"{path}.tmp", path)
+        return hashlib.md5(body).hexdigest()
+
+    def create(self, job: dict) -> Optional[str]:
+        with self._lock():
+            if os.path.exists(self._path(job["job_id"])):
+                return None
+            return self._write(job)
+
+    def _read(self, job_id: str) -> Optional[tuple[dict, str]]:
+        try:
+            with open(self._path(job_id), "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        return json.loads(body), hashlib.md5(body).hexdigest()
+
+    def read(self, job_id: str) -> Optional[tuple[dict, str]]:
+        return self._read(job_id)
+
+    def replace(self, job: dict, version: str) -> Optional[str]:
+        with self._lock():
+            current = self._read(job["job_id"])
+            if current is None or current[1] != version:
+                return None
+            return self._write(job)
+
+
+@functools.cache
+def job_store() -> JobStore:
+    """Store shared by all invocations of a container"""
+    import boto3
+
+    return S3JobStore(
+        boto3.client("s3"), os.environ.get("BUCKET_NAME"), f"{os.environ.get('S3_META_PREFIX', 'meta')}/jobs"
+    )
+
+
+def new_job(model_id: str, request_id: str) -> dict:
+    now = int(time.time())
+    return {
+        "job_id": uuid.uuid4().hex,
+        "model_id": model_id,
+        "request_id": request_id,
+        "status": QUEUED,
+        "stage": None,
+        "output_key": None,
+        "error": None,
+        "deadline_at": now + QUEUE_TIMEOUT_SECONDS,  # unix time the job is dropped at, then the worker is killed at
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def update_job(store: JobStore, job: dict, version: str, **changes) -> tuple[dict, str]:
+    """Write changes to a job read at `version`
+
+    Returns:
+        tuple[dict, str]: the updated job and its new version
+
+    Raises:
+        JobConflict: if the job was written by someone else since it was read
+    """
+    job = {**job, **changes, "updated_at": int(time.time())}
+    version = store.replace(job, version)
+    if version is None:
+        raise JobConflict(f"Job {job['job_id']} was changed by another writer")
+    return job, version
+
+
+def is_expired(job: dict, now: Optional[float] = None) -> bool:
+    """Whether a queued job was never started, or a running job's worker was killed before finishing"""
+    deadline = job.get("deadline_at")
+    if job["status"] not in (QUEUED, RUNNING) or deadline is None:
+        return False
+    return (time.time() if now is None else now) > deadline
@@ -1,5 +1,7 @@
 from aws_cdk import (
+    BundlingOptions,
     Duration,
+    ILocalBundling,
     Stack,
     aws_lambda as lambda_,
     aws_apigateway as apigateway,
@@ -11,7 +13,9 @@ from aws_cdk import (
 
 from constructs import Construct
 
+import jsii
 import os
+import shutil
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -22,11 +26,32 @@ BUCKET_NAME = str(os.getenv("S3_BUCKET_NAME"))
 S3_UPLOAD_PREFIX = str(os.getenv("S3_UPLOAD_PREFIX"))
 S3_INPUT_PREFIX = str(os.getenv("S3_INPUT_PREFIX"))
 S3_OUTPUT_PREFIX = str(os.getenv("S3_OUTPUT_PREFIX"))
+S3_META_PREFIX = str(os.getenv("S3_META_PREFIX"))
 HANDLER_NAME = str(os.getenv("API_HANDLER_LAMBDA_NAME"))
 ENDPOINT_NAME = str(os.getenv("API_ENDPOINT_NAME"))
 ATHENA_DATABASE = str(os.getenv("ATHENA_DATABASE"))
 ATHENA_PREDICTION_TABLE = str(os.getenv("ATHENA_PREDICTION_TABLE"))
 ATHENA_REQUEST_TABLE = str(os.getenv("ATHENA_REQUEST_TABLE"))
+ATHENA_WORKGROUP = "precalculations"
+# version of the AWSSDKPandas-Python312 layer published by AWS for aws-sdk-pandas 3.9.1 (pandas, pyarrow and
+# awswrangler), see https://aws-sdk-pandas.readthedocs.io/en/3.9.1/layers.html
+AWS_SDK_PANDAS_LAYER_VERSION = str(os.getenv("AWS_SDK_PANDAS_LAYER_VERSION"))
+
+# modules of the precalculator package (repo root) shared with the Lambdas; they only use the standard library
+PRECALCULATOR_PACKAGE = Path(__file__).resolve().parents[3] / "precalculator"
+SHARED_MODULES = ["__init__.py", "layout.py", "membership.py", "query.py"]
+
+
+@jsii.implements(ILocalBundling)
+class SharedModulesBundling:
+    """Copies the shared modules into the layout of a Lambda layer without needing Docker"""
+
+    def try_bundle(self, output_dir: str, options: BundlingOptions) -> bool:
+        target = Path(output_dir) / "python" / "precalculator"
+        target.mkdir(parents=True, exist_ok=True)
+        for name in SHARED_MODULES:
+            shutil.copy(PRECALCULATOR_PACKAGE / name, target / name)
+        return True
 
 
 class PrecalculatorStack(Stack):
@@ -121,6 +146,32 @@ class PrecalculatorStack(Stack):
         glue_role.add_to_policy(iam.PolicyStatement(actions=["athena:*"], resources=["*"], effect=iam.Effect.ALLOW))
 
         ### Lambda ###
+        precalculator_layer = lambda_.LayerVersion(
+            self,
+            id="precalculator_layer",
+            code=lambda_.Code.from_asset(
+                str(PRECALCULATOR_PACKAGE),
+                bundling=BundlingOptions(
+                    image=lambda_.Runtime.PYTHON_3_12.bundling_image,
+                    local=SharedModulesBundling(),
+                    command=[
+                        "bash",
+                        "-c",
+                        f"mkdir -p /asset-output/python/precalculator && "
+                        f"cp {' '.join(SHARED_MODULES)} /asset-output/python/precalculator/",
+                    ],
+                ),
+            ),
+            compatible_runtimes=[lambda_.Runtime.PYTHON_3_12],
+            description="Modules of the precalculator package shared with the Lambdas",
+        )
+
+        model_environment = {
+            "ATHENA_DATABASE": ATHENA_DATABASE,
+            "ATHENA_PREDICTION_TABLE": ATHENA_PREDICTION_TABLE,
+            "BUCKET_NAME": BUCKET_NAME,
+            "S3_META_PREFIX": S3_META_PREFIX,
+        }
         get_model = lambda_.Function(
             self,
             id="get_model",
@@ -128,7 +179,20 @@ class PrecalculatorStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_12,
             code=lambda_.Code.from_asset("lambda"),
             handler="get_model.handler",
-            environment={"ATHENA_DATABASE": ATHENA_DATABASE, "ATHENA_PREDICTION_TABLE": ATHENA_PREDICTION_TABLE},
+            environment=model_environment,
+            memory_size=512,
+            timeout=Duration.seconds(30),
+            role=glue_role,
+        )
+
+        get_models = lambda_.Function(
+            self,
+            id="get_models",
+            function_name="get_models",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            code=lambda_.Code.from_asset("lambda"),
+            handler="get_model.batch_handler",
+            environment=model_environment,
             memory_size=512,
             timeout=Duration.seconds(30),
             role=glue_role,
@@ -147,8 +211,24 @@ class PrecalculatorStack(Stack):
             role=glue_role,
         )
 
-        # TODO: add aws-swk-pandas 3.9.1 as a layer via CDK:
-        # https://github.com/aws/aws-sdk-pandas/releases/tag/3.9.1
+        # only requests too large to inline in the Athena query import pandas and awswrangler
+        aws_sdk_pandas_layer = lambda_.LayerVersion.from_layer_version_arn(
+            self,
+            id="aws_sdk_pandas_layer",
+            layer_version_arn=(
+                f"arn:aws:lambda:{self.region}:336392948345:layer:AWSSDKPandas-Python312:{AWS_SDK_PANDAS_LAYER_VERSION}"
+            ),
+        )
+        fetch_environment = {
+            "BUCKET_NAME": BUCKET_NAME,
+            "S3_UPLOAD_PREFIX": S3_UPLOAD_PREFIX,
+            "S3_INPUT_PREFIX": S3_INPUT_PREFIX,
+            "S3_OUTPUT_PREFIX": S3_OUTPUT_PREFIX,
+            "ATHENA_DATABASE": ATHENA_DATABASE,
+            "ATHENA_PREDICTION_TABLE": ATHENA_PREDICTION_TABLE,
+            "ATHENA_REQUEST_TABLE": ATHENA_REQUEST_TABLE,
+            "ATHENA_WORKGROUP": ATHENA_WORKGROUP,
+        }
         fetch_predictions = lambda_.Function(
             self,
             id="fetch_predictions",
@@ -156,19 +236,59 @@ class PrecalculatorStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_12,
             code=lambda_.Code.from_asset("lambda"),
             handler="fetch_predictions.handler",
-            environment={
-                "BUCKET_NAME": BUCKET_NAME,
-                "S3_UPLOAD_PREFIX": S3_UPLOAD_PREFIX,
-                "S3_INPUT_PREFIX": S3_INPUT_PREFIX,
-                "S3_OUTPUT_PREFIX": S3_OUTPUT_PREFIX,
-                "ATHENA_DATABASE": ATHENA_DATABASE,
-                "ATHENA_REQUEST_TABLE": ATHENA_REQUEST_TABLE,
-            },
+            layers=[precalculator_layer, aws_sdk_pandas_layer],
+            environment=fetch_environment,
             memory_size=512,
             timeout=Duration.seconds(120),
             role=glue_role,
         )
 
+        # Requests too large to answer within the API Gateway timeout are submitted as jobs: fetch_submit queues the
+        # job and invokes the worker asynchronously, and clients poll fetch_status until the result is ready.
+        fetch_predictions_worker = lambda_.Function(
+            self,
+            id="fetch_predictions_worker",
+            function_name="fetch_predictions_worker",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            code=lambda_.Code.from_asset("lambda"),
+            handler="fetch_predictions.job_handler",
+            layers=[precalculator_layer, aws_sdk_pandas_layer],
+            environment={**fetch_environment, "S3_META_PREFIX": S3_META_PREFIX},
+            memory_size=2048,
+            timeout=Duration.minutes(15),
+            # QUEUE_TIMEOUT_SECONDS in lambda/jobs.py: queued jobs are failed once their invocation can't run anymore
+            max_event_age=Duration.hours(1),
+            role=glue_role,
+        )
+
+        jobs_environment = {"BUCKET_NAME": BUCKET_NAME, "S3_META_PREFIX": S3_META_PREFIX}
+        fetch_submit = lambda_.Function(
+            self,
+            id="fetch_submit",
+            function_name="fetch_submit",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            code=lambda_.Code.from_asset("lambda"),
+            handler="fetch_jobs.submit_handler",
+            environment={**jobs_environment, "FETCH_WORKER_FUNCTION": fetch_predictions_worker.function_name},
+            memory_size=512,
+            timeout=Duration.seconds(30),
+            role=glue_role,
+        )
+        fetch_predictions_worker.grant_invoke(fetch_submit)
+
+        fetch_status = lambda_.Function(
+            self,
+            id="fetch_status",
+            function_name="fetch_status",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            code=lambda_.Code.from_asset("lambda"),
+            handler="fetch_jobs.status_handler",
+            environment=jobs_environment,
+            memory_size=512,
+            timeout=Duration.seconds(30),
+            role=glue_role,
+        )
+
         ### API Gateway ###
 
         # NOTE: apigateway.LambdaRestApi is unsuitable for cases where
@@ -202,6 +322,21 @@ class PrecalculatorStack(Stack):
             source_arn=f"arn:aws:execute-api:{self.region}:{self.account}:{api.arn_for_execute_api()}/*/GET/precalculations/model",
         )
 
+        # GET /precalculations/models
+        models = precalculations.add_resource("models")
+        models.add_method(
+            "GET",
+            apigateway.LambdaIntegration(get_models),
+            request_parameters={"method.request.querystring.modelids": True},
+        )
+        # Allow API Gateway to invoke the Lambda
+        get_models.add_permission(
+            "apigateway",
+            principal=iam.ServicePrincipal("apigateway.amazonaws.com"),
+            action="lambda:InvokeFunction",
+            source_arn=f"arn:aws:execute-api:{self.region}:{self.account}:{api.arn_for_execute_api()}/*/GET/precalculations/models",
+        )
+
         # POST /precalculations/predictions
         predictions = precalculations.add_resource("predictions")
         predictions.add_method(
@@ -239,11 +374,43 @@ class PrecalculatorStack(Stack):
             source_arn=f"arn:aws:execute-api:{self.region}:{self.account}:{api.arn_for_execute_api()}/*/GET/precalculations/upload-destination",
         )
 
+        # POST /precalculations/jobs
+        jobs = precalculations.add_resource("jobs")
+        jobs.add_method(
+            "POST",
+            apigateway.LambdaIntegration(fetch_submit),
+            request_parameters={
+                "method.request.querystring.modelid": True,
+                "method.request.querystring.requestid": True,
+            },
+        )
+        # Allow API Gateway to invoke the Lambda
+        fetch_submit.add_permission(
+            "apigateway",
+            principal=iam.ServicePrincipal("apigateway.amazonaws.com"),
+            action="lambda:InvokeFunction",
+            source_arn=f"arn:aws:execute-api:{self.region}:{self.account}:{api.arn_for_execute_api()}/*/POST/precalculations/jobs",
+        )
+
+        # GET /precalculations/jobs
+        jobs.add_method(
+            "GET",
+            apigateway.LambdaIntegration(fetch_status),
+            request_parameters={"method.request.querystring.jobid": True},
+        )
+        # Allow API Gateway to invoke the Lambda
+        fetch_status.add_permission(
+            "apigateway",
+            principal=iam.ServicePrincipal("apigateway.amazonaws.com"),
+            action="lambda:InvokeFunction",
+            source_arn=f"arn:aws:execute-api:{self.region}:{self.account}:{api.arn_for_execute_api()}/*/GET/precalculations/jobs",
+        )
+
         ### Athena ###
         athena_workgroup = athena.CfnWorkGroup(
             self,
             id="precalculations",
-            name="precalculations",
+            name=ATHENA_WORKGROUP,
             state="ENABLED",
             work_group_configuration=athena.CfnWorkGroup.WorkGroupConfigurationProperty(
                 result_configuration=athena.CfnWorkGroup.ResultConfigurationProperty(
@@ -269,12 +436,16 @@ class PrecalculatorStack(Stack):
                 name=ATHENA_PREDICTION_TABLE,
                 table_type="EXTERNAL_TABLE",
                 parameters={"classification": "parquet"},
-                partition_keys=[glue.CfnTable.ColumnProperty(name="model_id")],
+                partition_keys=[
+                    glue.CfnTable.ColumnProperty(name="model_id"),
+                    glue.CfnTable.ColumnProperty(name="key_bucket"),
+                ],
                 storage_descriptor=glue.CfnTable.StorageDescriptorProperty(
                     columns=[
                         glue.CfnTable.ColumnProperty(name="key", type="string"),
                         glue.CfnTable.ColumnProperty(name="input", type="string"),
-                        glue.CfnTable.ColumnProperty(name="output", type="string"),
+                        glue.CfnTable.ColumnProperty(name="output", type="map<string,double>"),
+                        glue.CfnTable.ColumnProperty(name="output_text", type="map<string,string>"),
                         glue.CfnTable.ColumnProperty(name="model_id", type="string"),
                     ],
                     location=f"s3://{BUCKET_NAME}/{ATHENA_PREDICTION_TABLE}",
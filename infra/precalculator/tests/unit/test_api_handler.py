@@ -0,0 +1,115 @@
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "lambda"))
+
+import api_handler
+from cache import TTLCache
+
+TABLE_NAME = "precalculations"
+MODEL_ID = "eos3b5e"
+
+
+class FakeDynamoDBClient:
+    """In-memory stand-in for the DynamoDB client that leaves some keys unprocessed, like a throttled table"""
+
+    def __init__(self, keys: list[str], unprocessed_calls: int = 0, latency: float = 0.0):
+        self.items = {
+            (f"INPUTKEY#{key}", f"MODELID#{MODEL_ID}"): {
+                "PK": {"S": f"INPUTKEY#{key}"},
+                "SK": {"S": f"MODELID#{MODEL_ID}"},
+                "Smiles": {"S": f"smiles-{key}\n"},
+                "Precalculation": {"N": str(i)},
+                "Extra": {"S": "not projected"},
+            }
+            for i, key in enumerate(keys)
+        }
+        self.unprocessed_calls = unprocessed_calls
+        self.latency = latency
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def batch_get_item(self, RequestItems: dict) -> dict:  # noqa: N803
+        request = RequestItems[TABLE_NAME]
+        assert len(request["Keys"]) <= 100
+        time.sleep(self.latency)
+
+        with self.lock:
+            self.calls += 1
+            throttled = self.calls <= self.unprocessed_calls
+
+        keys = [(key["PK"]["S"], key["SK"]["S"]) for key in request["Keys"]]
+        processed, unprocessed = (keys[: len(keys) // 2], keys[len(keys) // 2 :]) if throttled else (keys, [])
+
+        names = request["ExpressionAttributeNames"]
+        projection = [names[name.strip()] for name in request["ProjectionExpression"].split(",")]
+        items = [{name: self.items[key][name] for name in projection} for key in processed if key in self.items]
+
+        response: dict = {"Responses": {TABLE_NAME: items}, "UnprocessedKeys": {}}
+        if unprocessed:
+            response["UnprocessedKeys"] = {
+                TABLE_NAME: {**request, "Keys": [{"PK": {"S": pk}, "SK": {"S": sk}} for pk, sk in unprocessed]}
+            }
+        return response
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(api_handler, "BASE_DELAY", 0.0)
+
+
+def test_results_in_request_order_with_retries():
+    keys = [f"KEY{i:05d}" for i in range(450)]
+    client = FakeDynamoDBClient(keys, unprocessed_calls=3)
+
+    requested = ["MISSING", *reversed(keys), keys[0]]
+    output = api_handler.get_precalculations(client, TABLE_NAME, MODEL_ID, requested)
+
+    assert [row["smiles"] for row in output] == [f"smiles-{key}" for key in [*reversed(keys), keys[0]]]
+    assert output[-1]["value"] == 0
+    assert set(output[0]) == {"smiles", "value"}
+    assert client.calls == 5 + 3
+
+
+def test_unprocessed_keys_are_not_dropped(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(api_handler, "MAX_ATTEMPTS", 2)
+    client = FakeDynamoDBClient(["A", "B"], unprocessed_calls=10)
+
+    with pytest.raises(RuntimeError):
+        api_handler.get_precalculations(client, TABLE_NAME, MODEL_ID, ["A", "B"])
+
+
+def test_large_request_runs_concurrently(monkeypatch: pytest.MonkeyPatch):
+    keys = [f"KEY{i:05d}" for i in range(10000)]
+    client = FakeDynamoDBClient(keys, latency=0.05)
+    monkeypatch.setattr(api_handler, "dynamodb_client", lambda: client)
+    monkeypatch.setenv("TABLE_NAME", TABLE_NAME)
+
+    start = time.perf_counter()
+    response = api_handler.handler({"body": json.dumps({"modelId": MODEL_ID, "inputKeyArray": keys})}, {})
+
+    # 100 batches of 50 ms each take 5 seconds one after the other
+    assert time.perf_counter() - start < 2
+    assert response["statusCode"] == 200
+    assert len(json.loads(response["body"])["output"]) == 10000
+
+
+def test_cached_keys_are_not_read_again():
+    keys = [f"KEY{i:05d}" for i in range(150)]
+    client = FakeDynamoDBClient(keys)
+    cache = TTLCache(max_size=1000, ttl=60)
+
+    first = api_handler.get_precalculations(client, TABLE_NAME, MODEL_ID, [*keys[:100], "MISSING"], cache=cache)
+    assert client.calls == 2
+
+    # only the 50 keys not seen before are read; the missing key is cached as missing
+    second = api_handler.get_precalculations(client, TABLE_NAME, MODEL_ID, ["MISSING", *keys], cache=cache)
+    assert client.calls == 3
+    assert second[:100] == first
+    assert len(second) == 150
+    assert cache.hits == 101
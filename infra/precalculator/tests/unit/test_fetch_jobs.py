@@ -0,0 +1,122 @@
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "lambda"))
+
+import fetch_jobs
+from jobs import JobConflict, LocalJobStore, new_job, update_job
+
+
+class FakeLambda:
+    def __init__(self):
+        self.invocations: list[dict] = []
+
+    def invoke(self, **kwargs: str) -> None:
+        self.invocations.append(kwargs)
+
+
+class FakeS3:
+    def generate_presigned_url(self, method: str, Params: dict, **kwargs: Any) -> str:  # noqa: ARG002, N803
+        return f"https://{Params['Bucket']}/{Params['Key']}"
+
+
+@pytest.fixture
+def store(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> LocalJobStore:
+    store = LocalJobStore(str(tmp_path))
+    monkeypatch.setattr(fetch_jobs, "job_store", lambda: store)
+    monkeypatch.setenv("BUCKET_NAME", "bucket")
+    monkeypatch.setenv("FETCH_WORKER_FUNCTION", "fetch_predictions_worker")
+    return store
+
+
+def test_submit_queues_job_and_invokes_worker(monkeypatch: pytest.MonkeyPatch, store: LocalJobStore):
+    lambda_client = FakeLambda()
+    monkeypatch.setattr(fetch_jobs, "aws_client", lambda service: {"lambda": lambda_client}[service])
+
+    response = fetch_jobs.submit_handler({"queryStringParameters": {"modelid": "eos3b5e", "requestid": "r1"}}, {})
+
+    assert response["statusCode"] == 202
+    job = json.loads(response["body"])
+    assert job["status"] == "queued"
+    assert store.get(job["job_id"]) == job
+
+    (invocation,) = lambda_client.invocations
+    assert invocation["FunctionName"] == "fetch_predictions_worker"
+    assert invocation["InvocationType"] == "Event"
+    assert json.loads(invocation["Payload"]) == {"job_id": job["job_id"]}
+
+
+def test_submit_requires_model_and_request(store: LocalJobStore):  # noqa: ARG001
+    response = fetch_jobs.submit_handler({"queryStringParameters": {"modelid": "eos3b5e"}}, {})
+
+    assert response["statusCode"] == 400
+
+
+def test_status_reports_progress_and_result(monkeypatch: pytest.MonkeyPatch, store: LocalJobStore):
+    monkeypatch.setattr(fetch_jobs, "aws_client", lambda service: {"lambda": FakeLambda(), "s3": FakeS3()}[service])
+    submitted = json.loads(
+        fetch_jobs.submit_handler({"queryStringParameters": {"modelid": "eos3b5e", "requestid": "r1"}}, {})["body"]
+    )
+    event = {"queryStringParameters": {"jobid": submitted["job_id"]}}
+
+    job, version = update_job(store, *store.read(submitted["job_id"]), status="running", stage="querying")
+    body = json.loads(fetch_jobs.status_handler(event, {})["body"])
+    assert (body["status"], body["stage"]) == ("running", "querying")
+    assert "result_url" not in body
+
+    update_job(store, job, version, status="succeeded", stage=None, output_key="out/eos3b5e/r1.csv")
+    body = json.loads(fetch_jobs.status_handler(event, {})["body"])
+    assert body["result_url"] == "https://bucket/out/eos3b5e/r1.csv"
+
+
+def test_status_fails_job_whose_worker_was_killed(store: LocalJobStore):
+    job = new_job("eos3b5e", "r1")
+    version = store.create(job)
+    deadline = int(time.time()) + 60
+    job, version = update_job(store, job, version, status="running", stage="querying", deadline_at=deadline)
+    event = {"queryStringParameters": {"jobid": job["job_id"]}}
+
+    assert json.loads(fetch_jobs.status_handler(event, {})["body"])["status"] == "running"
+
+    # the worker timed out at its deadline without recording an outcome
+    update_job(store, job, version, deadline_at=deadline - 120)
+    body = json.loads(fetch_jobs.status_handler(event, {})["body"])
+    assert (body["status"], body["stage"]) == ("failed", "querying")
+    assert body["error"] == "The worker timed out or ran out of memory"
+    assert store.get(job["job_id"])["status"] == "failed"
+
+
+def test_status_fails_job_that_was_never_started(store: LocalJobStore):
+    job = new_job("eos3b5e", "r1")
+    version = store.create(job)
+    event = {"queryStringParameters": {"jobid": job["job_id"]}}
+
+    assert job["deadline_at"] > job["created_at"]
+    assert json.loads(fetch_jobs.status_handler(event, {})["body"])["status"] == "queued"
+
+    # the worker's invocation was dropped before it started the job
+    update_job(store, job, version, deadline_at=int(time.time()) - 1)
+    body = json.loads(fetch_jobs.status_handler(event, {})["body"])
+    assert (body["status"], body["error"]) == ("failed", "The job was not started before its deadline")
+
+
+def test_job_is_written_at_the_version_it_was_read(store: LocalJobStore):
+    job = new_job("eos3b5e", "r1")
+    version = store.create(job)
+    assert store.create(job) is None
+
+    update_job(store, job, version, status="running")
+    with pytest.raises(JobConflict):
+        update_job(store, job, version, status="failed")
+    assert store.get(job["job_id"])["status"] == "running"
+
+
+def test_status_of_unknown_job(store: LocalJobStore):  # noqa: ARG001
+    response = fetch_jobs.status_handler({"queryStringParameters": {"jobid": "unknown"}}, {})
+
+    assert response["statusCode"] == 404
@@ -0,0 +1,271 @@
+import hashlib
+import io
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+import pytest
+
+LAMBDA_DIR = Path(__file__).resolve().parents[2] / "lambda"
+# the precalculator package, shipped to the Lambda in a layer. It shares its name with the package of the CDK app,
+# so it is only importable while the Lambda is imported, and the CDK app's package is restored afterwards.
+PACKAGE_DIR = Path(__file__).resolve().parents[4]
+
+
+def _is_precalculator(name: str) -> bool:
+    return name == "precalculator" or name.startswith("precalculator.")
+
+
+cdk_modules = {name: module for name, module in sys.modules.items() if _is_precalculator(name)}
+for name in cdk_modules:
+    del sys.modules[name]
+sys.path[:0] = [str(LAMBDA_DIR), str(PACKAGE_DIR)]
+
+import fetch_predictions
+from cache import TTLCache
+from jobs import LocalJobStore, new_job, update_job
+
+from precalculator.layout import key_buckets
+from precalculator.membership import MEMBERSHIP_FILE, BloomFilter
+
+sys.path.remove(str(PACKAGE_DIR))
+for name in [name for name in sys.modules if _is_precalculator(name)]:
+    del sys.modules[name]
+sys.modules.update(cdk_modules)
+
+KEYS = ["AAAAAAAAAAAAAA-UHFFFAOYSA-N", "BBBBBBBBBBBBBB-UHFFFAOYSA-N"]
+REQUEST = "uploads/eos3b5e/r1.csv"
+
+
+class ClientError(Exception):
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.response = {"ResponseMetadata": {"HTTPStatusCode": status}}
+
+
+class FakeS3:
+    class exceptions:  # noqa: N801
+        ClientError = ClientError
+
+        class NoSuchKey(ClientError):  # noqa: N818
+            def __init__(self):
+                super().__init__(404)
+
+    def __init__(self, objects: dict[str, bytes]):
+        self.objects = objects
+        self.copies: list[dict] = []
+        self.gets: list[str] = []
+
+    def get_object(self, Key: str, IfNoneMatch: Optional[str] = None, **kwargs: str) -> dict:  # noqa: ARG002, N803
+        self.gets.append(Key)
+        if Key not in self.objects:
+            raise self.exceptions.NoSuchKey()
+        etag = f'"{hashlib.md5(self.objects[Key]).hexdigest()}"'
+        if IfNoneMatch == etag:
+            raise ClientError(304)
+        return {"Body": io.BytesIO(self.objects[Key]), "ETag": etag}
+
+    def put_object(self, Key: str, Body: str, **kwargs: str) -> None:  # noqa: ARG002, N803
+        self.objects[Key] = Body.encode("utf-8")
+
+    def copy_object(self, **kwargs: str) -> None:
+        self.copies.append(kwargs)
+
+    def generate_presigned_url(self, method: str, Params: dict, **kwargs: Any) -> str:  # noqa: ARG002, N803
+        return f"https://{Params['Bucket']}/{Params['Key']}"
+
+
+class FakeAthena:
+    def __init__(self):
+        self.queries: list[dict] = []
+        self.polls = 0
+
+    def start_query_execution(self, **kwargs: str) -> dict:
+        self.queries.append(kwargs)
+        return {"QueryExecutionId": "q1"}
+
+    def get_query_execution(self, **kwargs: str) -> dict:  # noqa: ARG002
+        self.polls += 1
+        state = "SUCCEEDED" if self.polls > 1 else "RUNNING"
+        return {
+            "QueryExecution": {
+                "Status": {"State": state},
+                "ResultConfiguration": {"OutputLocation": "s3://results/q1.csv"},
+            }
+        }
+
+
+def test_invalid_request_imports_no_heavy_dependencies():
+    code = (
+        "import sys, fetch_predictions;"
+        "response = fetch_predictions.handler({'queryStringParameters': {'modelid': 'eos3b5e'}}, {});"
+        "assert response['statusCode'] == 400;"
+        "print(sorted({'boto3', 'pandas', 'awswrangler'} & set(sys.modules)))"
+    )
+    env = {"PYTHONPATH": f"{LAMBDA_DIR}:{PACKAGE_DIR}"}
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, env=env, cwd=PACKAGE_DIR, check=True
+    )
+
+    assert result.stdout.strip() == "[]"
+
+
+def setup_fetcher(monkeypatch: pytest.MonkeyPatch, s3: FakeS3, athena: FakeAthena) -> None:
+    monkeypatch.setattr(fetch_predictions, "aws_client", lambda service: {"s3": s3, "athena": athena}[service])
+    monkeypatch.setattr(fetch_predictions, "membership_cache", TTLCache(max_size=1, ttl=60))
+    monkeypatch.setattr(fetch_predictions, "QUERY_POLL_SECONDS", 0)
+    monkeypatch.setattr(fetch_predictions.PredictionFetcher, "_write_inputs_s3", None)  # must not be called
+    for name, value in {"BUCKET_NAME": "bucket", "S3_UPLOAD_PREFIX": "uploads", "S3_OUTPUT_PREFIX": "out"}.items():
+        monkeypatch.setenv(name, value)
+
+
+def test_small_request_is_inlined_without_pandas(monkeypatch: pytest.MonkeyPatch):
+    s3 = FakeS3({REQUEST: "\n".join([KEYS[1], KEYS[0], KEYS[1]]).encode("utf-8")})
+    athena = FakeAthena()
+    setup_fetcher(monkeypatch, s3, athena)
+
+    event = {"queryStringParameters": {"modelid": "eos3b5e", "requestid": "r1"}}
+    response = fetch_predictions.handler(event, {})
+
+    assert response["statusCode"] == 200
+    assert response["body"] == "https://bucket/out/eos3b5e/r1.csv"
+
+    (query,) = athena.queries
+    # the CSV result is returned as is, so the output maps are written as JSON
+    assert "json_format(cast(output as json)) as output" in query["QueryString"]
+    buckets = [f"'{bucket}'" for bucket in key_buckets(KEYS)]
+    assert query["ExecutionParameters"] == ["'eos3b5e'", *buckets, f"'{KEYS[1]}'", f"'{KEYS[0]}'"]
+    assert s3.copies == [
+        {"Bucket": "bucket", "Key": "out/eos3b5e/r1.csv", "CopySource": {"Bucket": "results", "Key": "q1.csv"}}
+    ]
+    assert json.loads(json.dumps(response))  # serializable API response
+
+
+def test_request_without_precalculations_skips_query(monkeypatch: pytest.MonkeyPatch):
+    membership = BloomFilter.for_capacity(10)
+    membership.add("CCCCCCCCCCCCCC-UHFFFAOYSA-N")
+    s3 = FakeS3(
+        {
+            REQUEST: "\n".join(KEYS).encode("utf-8"),
+            f"predictions/model_id=eos3b5e/{MEMBERSHIP_FILE}": membership.to_bytes(),
+        }
+    )
+    athena = FakeAthena()
+    setup_fetcher(monkeypatch, s3, athena)
+
+    event = {"queryStringParameters": {"modelid": "eos3b5e", "requestid": "r1"}}
+    response = fetch_predictions.handler(event, {})
+
+    assert response["statusCode"] == 200
+    assert athena.queries == []
+    assert s3.objects["out/eos3b5e/r1.csv"] == b'"model_id","key","input","output","output_text"\n'
+
+
+def test_cached_membership_filter_is_revalidated(monkeypatch: pytest.MonkeyPatch):
+    membership = BloomFilter.for_capacity(10)
+    membership.add("CCCCCCCCCCCCCC-UHFFFAOYSA-N")
+    membership_key = f"predictions/model_id=eos3b5e/{MEMBERSHIP_FILE}"
+    s3 = FakeS3({REQUEST: "\n".join(KEYS).encode("utf-8"), membership_key: membership.to_bytes()})
+    athena = FakeAthena()
+    setup_fetcher(monkeypatch, s3, athena)
+    event = {"queryStringParameters": {"modelid": "eos3b5e", "requestid": "r1"}}
+
+    assert fetch_predictions.handler(event, {})["statusCode"] == 200
+    # an unchanged filter is not downloaded again by a warm container
+    monkeypatch.setattr(fetch_predictions.BloomFilter, "from_bytes", None)
+    assert fetch_predictions.handler(event, {})["statusCode"] == 200
+    assert s3.gets.count(membership_key) == 2
+    assert athena.queries == []
+
+    # a write to the partition deletes its filter, which must not be used any longer
+    del s3.objects[membership_key]
+    assert fetch_predictions.handler(event, {})["statusCode"] == 200
+    assert len(athena.queries) == 1
+
+
+def test_job_records_progress_and_result(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    s3 = FakeS3({REQUEST: "\n".join(KEYS).encode("utf-8")})
+    setup_fetcher(monkeypatch, s3, FakeAthena())
+    store = LocalJobStore(str(tmp_path))
+    monkeypatch.setattr(fetch_predictions, "job_store", lambda: store)
+
+    stages = []
+    original_replace = store.replace
+
+    def replace(job: dict, version: str) -> Optional[str]:
+        stages.append((job["status"], job["stage"]))
+        return original_replace(job, version)
+
+    monkeypatch.setattr(store, "replace", replace)
+
+    job = new_job("eos3b5e", "r1")
+    store.create(job)
+    fetch_predictions.job_handler({"job_id": job["job_id"]}, {})
+
+    done = store.get(job["job_id"])
+    assert done["status"] == "succeeded"
+    assert done["output_key"] == "out/eos3b5e/r1.csv"
+    assert done["deadline_at"] >= done["created_at"] + 15 * 60
+    assert stages == [
+        ("running", None),
+        ("running", "reading_input"),
+        ("running", "querying"),
+        ("running", "writing_output"),
+        ("succeeded", None),
+    ]
+
+    # a redelivered invocation leaves the finished job alone
+    fetch_predictions.job_handler({"job_id": job["job_id"]}, {})
+    assert len(stages) == 5
+
+
+def test_failed_job_records_error(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    setup_fetcher(monkeypatch, FakeS3({}), FakeAthena())
+    store = LocalJobStore(str(tmp_path))
+    monkeypatch.setattr(fetch_predictions, "job_store", lambda: store)
+
+    job = new_job("eos3b5e", "missing")
+    store.create(job)
+    fetch_predictions.job_handler({"job_id": job["job_id"]}, {})
+
+    failed = store.get(job["job_id"])
+    assert failed["status"] == "failed"
+    assert failed["stage"] == "reading_input"
+    assert failed["error"]
+
+
+def test_job_is_run_by_one_invocation(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    setup_fetcher(monkeypatch, FakeS3({REQUEST: "\n".join(KEYS).encode("utf-8")}), FakeAthena())
+    store = LocalJobStore(str(tmp_path))
+    monkeypatch.setattr(fetch_predictions, "job_store", lambda: store)
+    job = new_job("eos3b5e", "r1")
+    store.create(job)
+
+    # a redelivered invocation starts the job between the first invocation's read and write
+    original_read = store.read
+
+    def read_then_start(job_id: str) -> Optional[tuple[dict, str]]:
+        current = original_read(job_id)
+        update_job(store, *original_read(job_id), status="running")
+        return current
+
+    monkeypatch.setattr(store, "read", read_then_start)
+    monkeypatch.setattr(fetch_predictions, "PredictionFetcher", None)  # must not be constructed
+    fetch_predictions.job_handler({"job_id": job["job_id"]}, {})
+
+    assert original_read(job["job_id"])[0]["deadline_at"] == job["deadline_at"]
+
+
+def test_job_queued_past_its_deadline_is_not_started(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    store = LocalJobStore(str(tmp_path))
+    monkeypatch.setattr(fetch_predictions, "job_store", lambda: store)
+    job = new_job("eos3b5e", "r1")
+    update_job(store, job, store.create(job), deadline_at=int(time.time()) - 1)
+
+    monkeypatch.setattr(fetch_predictions, "PredictionFetcher", None)  # must not be constructed
+    fetch_predictions.job_handler({"job_id": job["job_id"]}, {})
+
+    assert store.get(job["job_id"])["status"] == "queued"
@@ -0,0 +1,86 @@
+import io
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "lambda"))
+
+import get_model
+from cache import TTLCache
+
+MANIFEST = {
+    "updated_at": 1700000000,
+    "models": {"eos3b5e": {"model_id": "eos3b5e", "total_unique_preds": 10, "preds_last_updated": 1700000000}},
+}
+
+
+class FakeS3:
+    class exceptions:  # noqa: N801
+        NoSuchKey = KeyError
+
+    def __init__(self):
+        self.reads = 0
+
+    def get_object(self, **kwargs: str) -> dict:  # noqa: ARG002
+        self.reads += 1
+        return {"Body": io.BytesIO(json.dumps(MANIFEST).encode("utf-8"))}
+
+
+class FakeGlue:
+    class exceptions:  # noqa: N801
+        EntityNotFoundException = LookupError
+
+    def __init__(self, models: set[str]):
+        self.models = models
+        self.calls = 0
+
+    def get_partitions(self, Expression: str, **kwargs: str) -> dict:  # noqa: ARG002, N803
+        self.calls += 1
+        model_id = Expression.split("'")[1]
+        return {"Partitions": [{"Values": [model_id, "A"]}] if model_id in self.models else []}
+
+
+@pytest.fixture()
+def clients(monkeypatch: pytest.MonkeyPatch) -> tuple[FakeS3, FakeGlue]:
+    s3, glue = FakeS3(), FakeGlue({"eos4e40"})
+    monkeypatch.setattr(get_model, "s3_client", lambda: s3)
+    monkeypatch.setattr(get_model, "glue_client", lambda: glue)
+    monkeypatch.setattr(get_model, "model_cache", TTLCache(max_size=10, ttl=60))
+    monkeypatch.setattr(get_model, "manifest_cache", TTLCache(max_size=1, ttl=60))
+    return s3, glue
+
+
+def test_batch_handler(clients: tuple[FakeS3, FakeGlue]):
+    s3, glue = clients
+    event = {"queryStringParameters": {"modelids": "eos3b5e, eos4e40,eos0000,eos3b5e"}}
+
+    for _ in range(2):
+        response = get_model.batch_handler(event, {})
+        models = json.loads(response["body"])["models"]
+
+        assert response["statusCode"] == 200
+        assert models == {
+            "eos3b5e": {"available": True, "total_unique_preds": 10, "preds_last_updated": 1700000000},
+            "eos4e40": {"available": True},
+            "eos0000": {"available": False},
+        }
+
+    # warm invocations answer from memory; Glue is only asked about models missing from the manifest
+    assert s3.reads == 1
+    assert glue.calls == 2
+
+
+@pytest.mark.usefixtures("clients")
+def test_batch_handler_rejects_empty_requests():
+    response = get_model.batch_handler({"queryStringParameters": {"modelids": " , "}}, {})
+
+    assert response["statusCode"] == 400
+
+
+def test_handler_uses_manifest(clients: tuple[FakeS3, FakeGlue]):
+    response = get_model.handler({"queryStringParameters": {"modelid": "eos3b5e"}}, {})
+
+    assert response["body"] is True
+    assert clients[1].calls == 0
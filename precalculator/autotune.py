@@ -0,0 +1,158 @@
+import os
+import subprocess
+import time
+from typing import Callable, Optional
+
+from pydantic import BaseModel
+
+from precalculator.parallel import available_memory
+from precalculator.profiling import descendants, matching_processes, read_process_table
+
+DEFAULT_CANDIDATES = (100, 250, 500, 1000, 2000)
+DEFAULT_BATCH_SIZE = 1000
+MEMORY_HEADROOM = 0.8  # fraction of available memory that a probe may use
+SAMPLE_INTERVAL = 0.1  # seconds between samples of the RSS of a probe and the model server
+
+
+class BatchSizeProbe(BaseModel):
+    """Measurement of a single model run with a given batch size"""
+
+    batch_size: int
+    rows: int
+    seconds: float
+    peak_rss: int  # bytes, of the Ersilia CLI and the model server together
+    returncode: int
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+
+class TuningResult(BaseModel):
+    """Batch size chosen for a model, stored so that later runs can reuse it"""
+
+    model_id: str
+    batch_size: int
+    memory_ceiling: int
+    tuned_at: int
+    probes: list[BatchSizeProbe]
+
+
+def server_rss(server_pattern: Optional[str]) -> int:
+    """Current RSS in bytes of the model server, found by `server_pattern` (see matching_processes)"""
+    if server_pattern is None:
+        return 0
+    table = read_process_table()
+    return sum(table[pid][2] for pid in matching_processes(server_pattern, table) if pid in table)
+
+
+def run_measured(
+    command: list[str], server_pattern: Optional[str] = None, interval: float = SAMPLE_INTERVAL
+) -> tuple[float, int, int]:
+    """Run a command to completion and measure it
+
+    An `ersilia run` client only sends inputs to the served model, which holds and computes the batches in
+    processes of its own. So while the command runs, the RSS of its process tree together with the model server's
+    processes (those matching `server_pattern`) is sampled every `interval` seconds. The peak is the highest sample,
+    or the command's own peak RSS if higher. Peaks shorter than `interval` may be missed.
+
+    Args:
+        command (list[str]): command to run
+        server_pattern (Optional[str]): part of the command line of the model server, e.g. its model ID
+        interval (float): seconds between samples
+
+    Returns:
+        tuple[float, int, int]: wall time in seconds, peak RSS of the command and the server in bytes and its
+            return code
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(command)
+
+    sampled = 0
+    while True:
+        pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+        if pid != 0:
+            break
+
+        table = read_process_table()
+        pids = {process.pid, *descendants(process.pid, table)}
+        if server_pattern is not None:
+            pids.update(matching_processes(server_pattern, table))
+        sampled = max(sampled, sum(table[pid][2] for pid in pids if pid in table))
+        time.sleep(interval)
+
+    seconds = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    # ru_maxrss is reported in kilobytes on Linux
+    return seconds, max(sampled, rusage.ru_maxrss * 1024), process.returncode
+
+
+def choose_batch_size(probes: list[BatchSizeProbe], memory_ceiling: int) -> int:
+    """Fastest batch size among successful probes that stayed under the memory ceiling
+
+    Falls back to the smallest probed size if no probe qualifies.
+    """
+    eligible = [probe for probe in probes if probe.returncode == 0 and probe.peak_rss <= memory_ceiling]
+
+    if not eligible:
+        return min(probe.batch_size for probe in probes)
+
+    return max(eligible, key=lambda probe: probe.rows_per_second).batch_size
+
+
+class BatchSizeTuner:
+    def __init__(
+        self,
+        run_command: Callable[[int], list[str]],
+        rows: int,
+        candidates: tuple[int, ...] = DEFAULT_CANDIDATES,
+        memory_ceiling: Optional[int] = None,
+        server_pattern: Optional[str] = None,
+    ):
+        """Probe batch sizes for a model on a small sample of inputs
+
+        Args:
+            run_command (Callable[[int], list[str]]): builds the model command for a given batch size
+            rows (int): number of inputs in the sample the command runs on
+            candidates (tuple[int, ...]): batch sizes to probe; sizes above `rows` are skipped
+            memory_ceiling (Optional[int]): maximum peak RSS in bytes, defaults to a share of the available memory
+                and of the memory the model server already holds
+            server_pattern (Optional[str]): part of the command line of the served model, whose RSS is measured
+                together with the command's (see run_measured)
+        """
+        self.run_command = run_command
+        self.rows = rows
+        self.candidates = [size for size in candidates if size <= rows] or [min(candidates)]
+        self.server_pattern = server_pattern
+
+        if memory_ceiling is None:
+            memory = available_memory()
+            # the server's current RSS is part of every probe's peak, but not of the available memory
+            memory_ceiling = (
+                int((memory + server_rss(server_pattern)) * MEMORY_HEADROOM) if memory is not None else 2**63 - 1
+            )
+        self.memory_ceiling = memory_ceiling
+
+    def probe(self, batch_size: int) -> BatchSizeProbe:
+        seconds, peak_rss, returncode = run_measured(self.run_command(batch_size), self.server_pattern)
+
+        return BatchSizeProbe(
+            batch_size=batch_size, rows=self.rows, seconds=seconds, peak_rss=peak_rss, returncode=returncode
+        )
+
+    def tune(self) -> tuple[int, list[BatchSizeProbe]]:
+        """Probe each candidate, smallest first, stopping once a probe fails or exceeds the memory ceiling
+
+        Returns:
+            tuple[int, list[BatchSizeProbe]]: chosen batch size and all probe measurements
+        """
+        probes = []
+        for batch_size in sorted(self.candidates):
+            probe = self.probe(batch_size)
+            probes.append(probe)
+
+            if probe.returncode != 0 or probe.peak_rss > self.memory_ceiling:
+                break
+
+        return choose_batch_size(probes, self.memory_ceiling), probes
@@ -0,0 +1,77 @@
+from typing import Optional
+
+import awswrangler as wr
+import boto3
+
+from precalculator.layout import KEY_BUCKET_COLUMN
+
+GLUE_BATCH_SIZE = 100  # Glue limit per batch_update_partition call
+GLUE_DELETE_BATCH_SIZE = 25  # Glue limit per batch_delete_partition call
+
+
+def register_partitions(
+    database: str,
+    table: str,
+    model_id: str,
+    path: str,
+    buckets: list[str],
+    replace: bool = False,
+    exclusive: bool = False,
+    boto3_session: Optional[boto3.Session] = None,
+) -> None:
+    """Register the key buckets of a generation of a model partition as partitions of the predictions table
+
+    Args:
+        database (str): Glue database of the predictions table
+        table (str): predictions table
+        model_id (str): ID of the model
+        path (str): s3:// URI of the generation (see precalculator.generations), holding the key bucket directories
+        buckets (list[str]): key buckets to register
+        replace (bool): whether partitions already registered elsewhere, e.g. in an older generation, are pointed at
+            this one; otherwise only missing partitions are added
+        exclusive (bool): whether the model's partitions of other buckets, e.g. of an older bucketing of the keys,
+            are dropped; only with `replace`
+        boto3_session (Optional[boto3.Session]): session of the Glue client, the default session if not given
+    """
+    session = boto3_session or boto3.Session()
+    locations = {bucket: f"{path.rstrip('/')}/{KEY_BUCKET_COLUMN}={bucket}/" for bucket in buckets}
+
+    if replace:
+        glue = session.client("glue")
+        entries, stale = [], []
+        pages = glue.get_paginator("get_partitions").paginate(
+            DatabaseName=database, TableName=table, Expression=f"model_id = '{model_id}'"
+        )
+        for page in pages:
+            for partition in page["Partitions"]:
+                if partition["Values"][1] not in locations:
+                    if exclusive and partition["Values"][1] not in buckets:
+                        stale.append({"Values": partition["Values"]})
+                    continue
+                location = locations.pop(partition["Values"][1])
+                if partition["StorageDescriptor"]["Location"] == location:
+                    continue
+                partition_input = {
+                    "Values": partition["Values"],
+                    "StorageDescriptor": {**partition["StorageDescriptor"], "Location": location},
+                    "Parameters": partition.get("Parameters", {}),
+                }
+                entries.append({"PartitionValueList": partition["Values"], "PartitionInput": partition_input})
+
+        for i in range(0, len(entries), GLUE_BATCH_SIZE):
+            glue.batch_update_partition(
+                DatabaseName=database, TableName=table, Entries=entries[i : i + GLUE_BATCH_SIZE]
+            )
+        for i in range(0, len(stale), GLUE_DELETE_BATCH_SIZE):
+            glue.batch_delete_partition(
+                DatabaseName=database, TableName=table, PartitionsToDelete=stale[i : i + GLUE_DELETE_BATCH_SIZE]
+            )
+
+    if locations:
+        # partitions that already exist are left as they are
+        wr.catalog.add_parquet_partitions(
+            database=database,
+            table=table,
+            partitions_values={location: [model_id, bucket] for bucket, location in locations.items()},
+            boto3_session=session,
+        )
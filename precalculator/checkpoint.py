@@ -0,0 +1,85 @@
+import hashlib
+import logging
+
+from pydantic import BaseModel
+
+from precalculator.scheduler import LeaseStore
+
+
+class Checkpoint(BaseModel):
+    """Progress marker for one shard of a model run"""
+
+    model_id: str
+    shard: str
+    git_sha: str
+    chunk_size: int
+    input_hash: str  # hash of the input file the chunks were read from
+    completed: list[str]  # IDs of chunks whose outputs are in the data lake
+
+
+def hash_file(path: str) -> str:
+    """MD5 hex digest of a file's content"""
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CheckpointTracker:
+    def __init__(self, store: LeaseStore, model_id: str, shard: str, git_sha: str, chunk_size: int, input_hash: str):
+        """Tracks which chunks of a shard have been written to the data lake, so a re-run can skip them.
+
+        A checkpoint is only resumed if it was written for the same model, shard, git SHA, chunk size and input file
+        (e.g. not after delta mode removed inputs), because chunk IDs refer to different rows otherwise.
+
+        Args:
+            store (LeaseStore): store holding the progress markers
+            model_id (str): ID of the model being run
+            shard (str): ID of the worker's shard or work unit
+            git_sha (str): commit the pipeline runs at
+            chunk_size (int): number of inputs per chunk
+            input_hash (str): hash of the input file that is split into chunks
+        """
+        self.store = store
+        self.key = f"{git_sha}/{shard}.json"
+
+        self.logger = logging.getLogger("CheckpointTracker")
+        self.logger.setLevel(logging.INFO)
+
+        self.checkpoint = Checkpoint(
+            model_id=model_id, shard=shard, git_sha=git_sha, chunk_size=chunk_size, input_hash=input_hash, completed=[]
+        )
+        self._version = None
+
+        current = store.read(self.key)
+        if current is not None:
+            saved = Checkpoint.model_validate_json(current[0])
+            self._version = current[1]
+
+            if saved.chunk_size == chunk_size and saved.input_hash == input_hash:
+                self.checkpoint = saved
+                self.logger.info(f"Resuming {shard} with {len(saved.completed)} chunks already completed")
+            else:
+                self.logger.info(f"Ignoring checkpoint of {shard} written for a different chunk size or input")
+
+        self._completed = set(self.checkpoint.completed)
+
+    def is_done(self, chunk_id: str) -> bool:
+        return chunk_id in self._completed
+
+    def mark_done(self, chunk_id: str) -> None:
+        """Record that a chunk's outputs have been written. Call only after the write succeeded."""
+        self.checkpoint.completed.append(chunk_id)
+        self._completed.add(chunk_id)
+
+        body = self.checkpoint.model_dump_json().encode("utf-8")
+        if self._version is None:
+            version = self.store.create(self.key, body)
+        else:
+            version = self.store.replace(self.key, body, self._version)
+
+        if version is None:
+            raise RuntimeError(f"Checkpoint {self.key} was modified by another worker")
+
+        self._version = version
@@ -0,0 +1,232 @@
+import logging
+import os
+from collections import defaultdict
+from typing import Callable, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+from pydantic import BaseModel
+
+from precalculator.dataset import bucket_keys, deduplicate_keys, file_bucket, has_legacy_output
+from precalculator.generations import (
+    KEY_COUNTS_FILE,
+    file_sequence,
+    generation_path,
+    list_data_files,
+    read_generation,
+    sequence_prefix,
+    write_generation,
+)
+from precalculator.layout import KEY_BUCKET_COLUMN
+from precalculator.membership import MEMBERSHIP_FILE, BloomFilter
+
+DEFAULT_FILE_ROWS = 1_000_000
+DEFAULT_ROW_GROUP_SIZE = 100_000
+COMPACTED_SUFFIX = "compacted"  # compacted files are named <sequence>_compacted-<i>.parquet
+STAGING_DIR = "_staging"  # rows of unbucketed files, split by key bucket during compaction
+
+logger = logging.getLogger("Compaction")
+logger.setLevel(logging.INFO)
+
+
+class CompactionResult(BaseModel):
+    """Summary of a partition compaction"""
+
+    files_before: int
+    files_after: int
+    rows_before: int
+    rows_after: int
+    buckets: list[str] = []  # key buckets of the new generation
+    generation: int = 0  # generation the partition was switched to
+
+
+def _delete_generation(filesystem: pafs.FileSystem, partition_path: str, generation: int) -> None:
+    if generation > 0:
+        filesystem.delete_dir(generation_path(partition_path, generation))
+        return
+
+    # generation 0 is the partition directory itself, which holds the later generations and the pointer too
+    for info in filesystem.get_file_info(pafs.FileSelector(partition_path)):
+        if os.path.basename(info.path).startswith(("_", ".")) and os.path.basename(info.path) != KEY_COUNTS_FILE:
+            continue
+        if info.type == pafs.FileType.Directory:
+            filesystem.delete_dir(info.path)
+        else:
+            filesystem.delete_file(info.path)
+
+
+def _split_by_bucket(
+    filesystem: pafs.FileSystem, old_path: str, new_path: str, files: list[pafs.FileInfo]
+) -> dict[str, list[tuple[int, str]]]:
+    """Files to compact per key bucket, with the order they were written in.
+
+    Files written before key bucketing, or in the buckets of an earlier layout, hold keys of any bucket, so their
+    rows are first written per bucket to the staging directory of the new generation, for each bucket to be compacted
+    on its own.
+    """
+    bucket_files: dict[str, list[tuple[int, str]]] = defaultdict(list)
+    for order, info in enumerate(files):
+        bucket = file_bucket(old_path, info.path)
+        if bucket is not None:
+            bucket_files[bucket].append((order, info.path))
+            continue
+
+        table = pq.read_table(info.path, filesystem=filesystem, partitioning=None)
+        buckets = bucket_keys(table["key"])
+        filesystem.create_dir(f"{new_path}/{STAGING_DIR}", recursive=True)
+        for bucket in pc.unique(buckets).to_pylist():
+            piece_path = f"{new_path}/{STAGING_DIR}/{order:08d}-{bucket}.parquet"
+            pq.write_table(table.filter(pc.equal(buckets, bucket)), piece_path, filesystem=filesystem)
+            bucket_files[bucket].append((order, piece_path))
+
+    return bucket_files
+
+
+def compact_partition(
+    partition_path: str,
+    filesystem: Optional[pafs.FileSystem] = None,
+    file_rows: int = DEFAULT_FILE_ROWS,
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+    compression: str = "zstd",
+    on_switch: Optional[Callable[[int, list[str]], None]] = None,
+) -> CompactionResult:
+    """Rewrite the Parquet files of a model's predictions partition into a few large files sorted by `key`.
+
+    Files are written per key bucket (see precalculator.layout), so compacting a partition written before key
+    bucketing was introduced also migrates it to the bucketed layout. Rows with duplicate keys are dropped,
+    keeping the row from the file with the highest sequence number (see precalculator.generations).
+
+    The compacted files are written to the next generation of the partition, which readers and writers switch to in
+    a single write of the generation pointer, so they see either the old files or the new ones, never both or
+    neither. Files written to the old generation while it was being compacted are then copied to the new one, and
+    `on_switch` is called, e.g. to point the Glue partitions at the new generation. The membership filter of the
+    partition's keys and inputs is written for the fetchers to check requests against, unless more files were
+    written in the meantime, and the generation before the old one, which no reader has used since the previous
+    compaction, is deleted. Compactions of the same partition must not run concurrently.
+
+    Args:
+        partition_path (str): model partition, e.g. s3://bucket/predictions/model_id=eos3b5e or a local path
+        filesystem (Optional[pafs.FileSystem]): filesystem of the path, inferred from the path if not given
+        file_rows (int): maximum number of rows per output file
+        row_group_size (int): number of rows per Parquet row group
+        compression (str): Parquet compression codec
+        on_switch (Optional[Callable[[int, list[str]], None]]): called with the new generation and its key buckets
+            once it is current and complete
+
+    Returns:
+        CompactionResult: number of files and rows before and after compaction, the buckets and generation written
+    """
+    if filesystem is None:
+        filesystem, partition_path = pafs.FileSystem.from_uri(partition_path)
+
+    partition_path = partition_path.rstrip("/")
+    generation = read_generation(filesystem, partition_path)
+    old_path = generation_path(partition_path, generation)
+    files = list_data_files(filesystem, old_path)
+
+    if len(files) == 0:
+        logger.info(f"No files to compact in {partition_path}")
+        return CompactionResult(files_before=0, files_after=0, rows_before=0, rows_after=0, generation=generation)
+
+    rows_before = 0
+    for info in files:
+        metadata = pq.read_metadata(info.path, filesystem=filesystem)
+        if has_legacy_output(metadata.schema.to_arrow_schema()):
+            raise ValueError(
+                f"{info.path} has outputs in the legacy string format, migrate the partition with "
+                "scripts/migrate_outputs.py before compacting it"
+            )
+        rows_before += metadata.num_rows
+
+    new_generation = generation + 1
+    new_path = generation_path(partition_path, new_generation)
+    # left over by an interrupted compaction, which never switched to it
+    filesystem.delete_dir_contents(new_path, missing_dir_ok=True)
+
+    # the compacted files take the place of the newest file they replace, before any file written since
+    prefix = sequence_prefix(max(file_sequence(files[-1].path), 0))
+
+    # sized for every row before deduplication, so that the files written meanwhile fit in it too
+    membership = BloomFilter.for_capacity(2 * rows_before)
+    bucket_files = _split_by_bucket(filesystem, old_path, new_path, files)
+    bucket_values = sorted(bucket_files)
+
+    rows_after = 0
+    files_after = 0
+    for bucket in bucket_values:
+        # one bucket in memory at a time, its files in the order they were written
+        tables = []
+        for order, path in bucket_files[bucket]:
+            table = pq.read_table(path, filesystem=filesystem, partitioning=None)
+            if KEY_BUCKET_COLUMN in table.column_names:
+                table = table.drop_columns([KEY_BUCKET_COLUMN])
+            tables.append(table.append_column("__order", pa.array([order] * table.num_rows, pa.int32())))
+
+        bucket_table = deduplicate_keys(pa.concat_tables(tables, promote_options="default"))
+        for column in ("key", "input"):
+            membership.update(bucket_table[column].to_pylist())
+        rows_after += bucket_table.num_rows
+
+        bucket_path = f"{new_path}/{KEY_BUCKET_COLUMN}={bucket}"
+        filesystem.create_dir(bucket_path, recursive=True)
+        for i, offset in enumerate(range(0, bucket_table.num_rows, file_rows)):
+            pq.write_table(
+                bucket_table.slice(offset, file_rows),
+                f"{bucket_path}/{prefix}{COMPACTED_SUFFIX}-{i:05d}.parquet",
+                filesystem=filesystem,
+                row_group_size=row_group_size,
+                compression=compression,
+            )
+            files_after += 1
+
+    staging_path = f"{new_path}/{STAGING_DIR}"
+    if filesystem.get_file_info(staging_path).type != pafs.FileType.NotFound:
+        filesystem.delete_dir(staging_path)
+
+    write_generation(filesystem, partition_path, new_generation)
+
+    # writers that read the pointer before the switch wrote to the old generation
+    compacted_paths = {info.path for info in files}
+    late_files = [info for info in list_data_files(filesystem, old_path) if info.path not in compacted_paths]
+    for info in late_files:
+        relative_path = os.path.relpath(info.path, old_path)
+        filesystem.create_dir(os.path.dirname(f"{new_path}/{relative_path}"), recursive=True)
+        filesystem.copy_file(info.path, f"{new_path}/{relative_path}")
+        late_table = pq.read_table(info.path, columns=["key", "input"], filesystem=filesystem, partitioning=None)
+        for column in ("key", "input"):
+            membership.update(late_table[column].to_pylist())
+        bucket = os.path.dirname(relative_path).removeprefix(f"{KEY_BUCKET_COLUMN}=")
+        if bucket and bucket not in bucket_values:
+            bucket_values.append(bucket)
+
+    if on_switch is not None:
+        on_switch(new_generation, sorted(bucket_values))
+
+    membership_path = f"{partition_path}/{MEMBERSHIP_FILE}"
+    with filesystem.open_output_stream(membership_path) as f:
+        f.write(membership.to_bytes())
+    if len(list_data_files(filesystem, new_path)) > files_after + len(late_files):
+        # written since the late files were listed, so the filter doesn't cover them
+        filesystem.delete_file(membership_path)
+
+    if generation > 0:
+        _delete_generation(filesystem, partition_path, generation - 1)
+
+    result = CompactionResult(
+        files_before=len(files),
+        files_after=files_after,
+        rows_before=rows_before,
+        rows_after=rows_after,
+        buckets=sorted(bucket_values),
+        generation=new_generation,
+    )
+
+    logger.info(
+        f"Compacted {partition_path} into generation {new_generation}: {result.files_before} files -> "
+        f"{result.files_after} files, {result.rows_before - result.rows_after} duplicate keys dropped, "
+        f"{len(late_files)} files written meanwhile copied"
+    )
+
+    return result
@@ -0,0 +1,132 @@
+import os
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+
+from precalculator.generations import current_path, file_sequence
+from precalculator.layout import KEY_BUCKET_COLUMN, is_key_bucket, key_bucket, key_buckets
+from precalculator.query import PREDICTION_COLUMNS
+
+# numeric outputs of a model are stored in `output`, any others (e.g. labels) as text in `output_text`
+OUTPUT_TYPE = pa.map_(pa.string(), pa.float64())
+OUTPUT_TEXT_TYPE = pa.map_(pa.string(), pa.string())
+PREDICTION_SCHEMA = pa.schema(
+    [("key", pa.string()), ("input", pa.string()), ("output", OUTPUT_TYPE), ("output_text", OUTPUT_TEXT_TYPE)]
+)
+
+
+def has_legacy_output(schema: pa.Schema) -> bool:
+    """Whether a file stores outputs as the comma-joined string written before `output` became a map"""
+    if "output" not in schema.names:
+        return False
+    output_type = schema.field("output").type
+    return pa.types.is_string(output_type) or pa.types.is_large_string(output_type)
+
+
+def bucket_keys(keys: pa.Array | pa.ChunkedArray) -> pa.Array:
+    """Key bucket of every key of an array (see precalculator.layout), hashing each distinct key once"""
+    if isinstance(keys, pa.ChunkedArray):
+        keys = keys.combine_chunks()
+    unique_keys = pc.unique(keys)
+    buckets = pa.array([key_bucket(key) for key in unique_keys.to_pylist()], pa.string())
+    return buckets.take(pc.index_in(keys, value_set=unique_keys))
+
+
+def deduplicate_keys(table: pa.Table) -> pa.Table:
+    """Sort a table by `key` and keep one row per key, preferring rows with a higher `__order`"""
+    table = table.sort_by([("key", "ascending"), ("__order", "descending")])
+
+    keys = table["key"]
+    if len(keys) < 2:
+        return table.drop_columns(["__order"])
+
+    is_first = pc.not_equal(keys.slice(1), keys.slice(0, len(keys) - 1))
+    mask = pa.concat_arrays([pa.array([True]), *is_first.chunks])
+
+    return table.filter(mask).drop_columns(["__order"])
+
+
+def deduplicate_by_sequence(table: pa.Table) -> pa.Table:
+    """Keep one row per key of a table read with `__filename`, from the file with the highest sequence number"""
+    files = table["__filename"].combine_chunks()
+    names = pc.unique(files)
+    sequences = pa.array([file_sequence(name) for name in names.to_pylist()], pa.int64())
+    order = pc.take(sequences, pc.index_in(files, value_set=names))
+    return deduplicate_keys(table.drop_columns(["__filename"]).append_column("__order", order))
+
+
+def file_bucket(generation_path: str, file_path: str) -> Optional[str]:
+    """Key bucket of a data file of a generation, or None if the file is outside the current key buckets, e.g. written
+    before key bucketing"""
+    bucket = os.path.dirname(os.path.relpath(file_path, generation_path)).removeprefix(f"{KEY_BUCKET_COLUMN}=")
+    return bucket if is_key_bucket(bucket) else None
+
+
+def open_model_partition(partition_path: str, filesystem: pafs.FileSystem) -> ds.Dataset:
+    """Dataset over the current generation of a model's partition of the predictions dataset, with its key buckets as
+    a column.
+
+    The schema is given rather than inferred from the first file, so files written before `output_text` was added
+    are read with a null `output_text`.
+    """
+    partitioning = ds.partitioning(pa.schema([(KEY_BUCKET_COLUMN, pa.string())]), flavor="hive")
+    return ds.dataset(
+        current_path(filesystem, partition_path),
+        schema=PREDICTION_SCHEMA.append(pa.field(KEY_BUCKET_COLUMN, pa.string())),
+        filesystem=filesystem,
+        format="parquet",
+        partitioning=partitioning,
+    )
+
+
+def read_model_predictions(
+    dataset_path: str,
+    model_id: str,
+    values: list[str],
+    column: str = "input",
+    filesystem: Optional[pafs.FileSystem] = None,
+) -> pd.DataFrame:
+    """Read the predictions of a model for a set of inputs or keys straight from the Parquet dataset.
+
+    The filter on `column` is pushed down into the scan, so row groups whose statistics exclude every requested
+    value are skipped. Lookups by `key` also skip every key bucket the request does not touch (files written before
+    key bucketing, which have no bucket, are always read). Like the Athena query, a single row is returned per key.
+
+    Args:
+        dataset_path (str): root of the predictions dataset, an s3:// URI or a local directory
+        model_id (str): ID of the model whose partition is read
+        values (list[str]): inputs or keys to look up
+        column (str): column the values are matched against, "input" or "key"
+        filesystem (Optional[pafs.FileSystem]): filesystem of the path, inferred from the path if not given
+
+    Returns:
+        pd.DataFrame: matching predictions with the same columns as the Athena query
+    """
+    if filesystem is None:
+        filesystem, dataset_path = pafs.FileSystem.from_uri(dataset_path)
+
+    partition_path = f"{dataset_path.rstrip('/')}/model_id={model_id}"
+    if filesystem.get_file_info(partition_path).type != pafs.FileType.Directory:
+        return pd.DataFrame(columns=PREDICTION_COLUMNS)
+
+    dataset = open_model_partition(partition_path, filesystem)
+
+    values = list(dict.fromkeys(values))
+    expression = ds.field(column).isin(values)
+    if column == "key":
+        bucket = ds.field(KEY_BUCKET_COLUMN)
+        expression = expression & (bucket.isin(key_buckets(values)) | bucket.is_null())
+
+    table = dataset.to_table(columns=[*PREDICTION_SCHEMA.names, "__filename"], filter=expression)
+
+    # keys written more than once since the last compaction are read from the file with the highest sequence number
+    table = deduplicate_by_sequence(table)
+
+    df = table.to_pandas(maps_as_pydicts="strict")
+    df.insert(0, "model_id", model_id)
+
+    return df
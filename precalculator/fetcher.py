@@ -1,19 +1,48 @@
 import logging
 import os
 import sys
+from typing import Literal, Optional
 
 import awswrangler as wr
 import pandas as pd
+import pyarrow.fs as pafs
 
 from config.app import DataLakeConfig
+from precalculator.dataset import read_model_predictions
+from precalculator.layout import request_keys
+from precalculator.membership import MEMBERSHIP_FILE, BloomFilter, split_request
+from precalculator.query import PREDICTION_COLUMNS, build_prediction_query, uses_request_table
 
 
 class LocalPredictionFetcher:
-    def __init__(self, config: DataLakeConfig, request_id: str, model_id: str, dev: bool = False):
+    def __init__(
+        self,
+        config: DataLakeConfig,
+        request_id: str,
+        model_id: str,
+        dev: bool = False,
+        engine: Literal["auto", "arrow", "athena"] = "auto",
+        dataset_path: Optional[str] = None,
+    ):
+        """Fetch a model's predictions for a request of inputs
+
+        Args:
+            config (DataLakeConfig): data lake configuration
+            request_id (str): ID of the request
+            model_id (str): ID of the model whose predictions are fetched
+            dev (bool): log to stdout
+            engine (Literal["auto", "arrow", "athena"]): "arrow" reads the Parquet dataset directly, "athena" joins
+                the request in Athena, "auto" uses arrow for requests of up to `config.local_fetch_max_rows` inputs
+            dataset_path (Optional[str]): root of the predictions dataset read by the arrow engine, defaults to the
+                predictions table in the precalcs bucket
+        """
         self.config = config
         self.request_id = request_id
         self.model_id = model_id
         self.dev = dev
+        self.engine = engine
+        self.dataset_path = dataset_path or os.path.join("s3://", config.s3_bucket_name, config.athena_prediction_table)
+        self._request_keys: Optional[list[str]] = None
 
         self.logger = logging.getLogger("LocalPredictionFetcher")
         self.logger.setLevel(logging.INFO)
@@ -33,14 +62,51 @@ class LocalPredictionFetcher:
         logger.info("reading and formatting input data")
         input_df = self._read_input_data(path_to_input)
 
-        logger.info("writing input to athena")
-        self._write_inputs_s3(input_df)
+        column, values = self._get_request_values(input_df)
+
+        membership = self._load_membership()
+        if membership is not None:
+            values, missing = split_request(membership, values)
+            logger.info(f"{len(values)} inputs may have precalculations, {len(missing)} certainly don't")
+
+        if len(values) == 0:
+            return pd.DataFrame(columns=PREDICTION_COLUMNS)
+
+        if self._use_arrow_engine(input_df):
+            logger.info("reading outputs from the predictions dataset")
+            return read_model_predictions(self.dataset_path, self.model_id, values, column=column)
+
+        # small requests are inlined in the query, so only large ones need to be written to the requests table
+        if uses_request_table(len(values)):
+            logger.info("writing input to athena")
+            self._write_inputs_s3(pd.DataFrame({"request_id": self.request_id, "input": values}))
 
         logger.info("fetching outputs from athena")
-        output_df = self._read_predictions_from_s3()
+        output_df = self._read_predictions_from_s3(column, values)
 
         return output_df
 
+    def _get_request_values(self, input_df: pd.DataFrame) -> tuple[Literal["input", "key"], list[str]]:
+        """Column of the predictions table a request is matched on, and its distinct values"""
+        if self._request_keys is not None:
+            return "key", list(dict.fromkeys(self._request_keys))
+        return "input", input_df["input"].astype(str).drop_duplicates().tolist()
+
+    def _load_membership(self) -> Optional[BloomFilter]:
+        """Membership filter written by the last compaction of the model's partition, if it is still current"""
+        filesystem, path = pafs.FileSystem.from_uri(self.dataset_path)
+        try:
+            with filesystem.open_input_stream(f"{path}/model_id={self.model_id}/{MEMBERSHIP_FILE}") as f:
+                return BloomFilter.from_bytes(f.read())
+        except FileNotFoundError:
+            return None
+
+    def _use_arrow_engine(self, input_df: pd.DataFrame) -> bool:
+        if self.engine == "auto":
+            # Athena queueing dominates small requests, while large ones are cheaper to join in Athena
+            return len(input_df) <= self.config.local_fetch_max_rows
+        return self.engine == "arrow"
+
     def _validate_input(self, path_to_input: str) -> None:
         # check that it is a CSV/text file
         # check that size is within reasonable bounds
@@ -75,12 +141,14 @@ class LocalPredictionFetcher:
 
         df["request_id"] = self.request_id
 
+        # requests made of InChIKeys only touch the key buckets of those keys
+        self._request_keys = request_keys(df["input"].astype(str))
+
         return df[["request_id", "input"]]
 
     def _write_inputs_s3(self, input_df: pd.DataFrame) -> None:
-        # TODO: deduplicate repeated inputs
         wr.s3.to_parquet(
-            df=input_df,
+            df=input_df.drop_duplicates(),
             path=os.path.join(
                 "s3://",
                 self.config.s3_bucket_name,
@@ -92,30 +160,18 @@ class LocalPredictionFetcher:
             partition_cols=["request_id"],
         )
 
-    def _read_predictions_from_s3(self) -> pd.DataFrame:
-        query = f"""
-            with request as (
-                select distinct
-                    *
-                from
-                    requests
-                where
-                    request_id = '{self.request_id}'
-            )
-
-            select
-                p.model_id,
-                p.key,
-                p.input,
-                p.output
-            from
-                predictions p
-                inner join request r
-                    on p.input = r.input
-            where
-                and p.model_id = '{self.model_id}'
-        """
+    def _read_predictions_from_s3(self, column: Literal["input", "key"], values: list[str]) -> pd.DataFrame:
+        query, params = build_prediction_query(
+            self.model_id,
+            self.request_id,
+            values,
+            column=column,
+            prediction_table=self.config.athena_prediction_table,
+            request_table=self.config.athena_request_table,
+        )
 
-        df_out = wr.athena.read_sql_query(query, database=self.config.athena_database)
+        df_out = wr.athena.read_sql_query(
+            query, database=self.config.athena_database, params=params, paramstyle="qmark"
+        )
 
         return df_out
@@ -0,0 +1,103 @@
+import os
+import re
+
+import pyarrow.fs as pafs
+from pydantic import BaseModel
+
+from precalculator.scheduler import LeaseStore
+
+# A model partition holds its data in generations. Generation 0 is the partition directory itself, as written before
+# compaction existed. Each compaction writes the next generation into a directory of its own, `_gen=<n>`, and then
+# switches to it by rewriting the pointer file, a single write. The leading underscore hides generation directories
+# from readers of generation 0, and hides the pointer from Athena and pyarrow.
+POINTER_FILE = "_generation.json"
+GENERATION_DIR = "_gen"
+SEQUENCE_KEY = "sequence"
+# keys added by each file written to a generation since it was compacted (see precalculator.read.count_unique_keys)
+KEY_COUNTS_FILE = "_key_counts.json"
+
+# data files are named after a sequence number from a counter shared by all writers of the model, so that later
+# writes sort after earlier ones whatever the clocks of the writers and of the storage
+SEQUENCE_WIDTH = 12
+SEQUENCED_FILE = re.compile(rf"^(\d{{{SEQUENCE_WIDTH}}})_")
+
+
+class GenerationPointer(BaseModel):
+    """Generation of a model partition that readers and writers use"""
+
+    generation: int = 0
+
+
+def generation_path(partition_path: str, generation: int) -> str:
+    """Directory holding a generation of a model partition"""
+    partition_path = partition_path.rstrip("/")
+    return partition_path if generation == 0 else f"{partition_path}/{GENERATION_DIR}={generation}"
+
+
+def read_generation(filesystem: pafs.FileSystem, partition_path: str) -> int:
+    """Current generation of a model partition, 0 if it has never been compacted"""
+    try:
+        with filesystem.open_input_stream(f"{partition_path.rstrip('/')}/{POINTER_FILE}") as f:
+            return GenerationPointer.model_validate_json(f.read()).generation
+    except FileNotFoundError:
+        return 0
+
+
+def write_generation(filesystem: pafs.FileSystem, partition_path: str, generation: int) -> None:
+    """Switch a model partition to another generation, atomically for readers and writers"""
+    path = f"{partition_path.rstrip('/')}/{POINTER_FILE}"
+    body = GenerationPointer(generation=generation).model_dump_json().encode("utf-8")
+
+    if isinstance(filesystem, pafs.LocalFileSystem):
+        # a local file is replaced atomically by renaming a complete copy over it
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with filesystem.open_output_stream(tmp_path) as f:
+            f.write(body)
+        filesystem.move(tmp_path, path)
+    else:
+        # an object store replaces an object in a single PUT
+        with filesystem.open_output_stream(path) as f:
+            f.write(body)
+
+
+def current_path(filesystem: pafs.FileSystem, partition_path: str) -> str:
+    """Directory holding the current generation of a model partition"""
+    return generation_path(partition_path, read_generation(filesystem, partition_path))
+
+
+def file_sequence(path: str) -> int:
+    """Sequence number of a data file, -1 for files written before files were numbered"""
+    match = SEQUENCED_FILE.match(os.path.basename(path))
+    return int(match.group(1)) if match else -1
+
+
+def sequence_prefix(sequence: int) -> str:
+    """Start of the names of the data files of a write"""
+    return f"{sequence:0{SEQUENCE_WIDTH}d}_"
+
+
+def _is_hidden(path: str) -> bool:
+    return any(part.startswith(("_", ".")) for part in path.split("/"))
+
+
+def list_data_files(filesystem: pafs.FileSystem, path: str) -> list[pafs.FileInfo]:
+    """Data files of a generation, including its key bucket directories, in the order they were written"""
+    infos = filesystem.get_file_info(pafs.FileSelector(path, allow_not_found=True, recursive=True))
+    files = [
+        info for info in infos if info.type == pafs.FileType.File and not _is_hidden(os.path.relpath(info.path, path))
+    ]
+    return sorted(files, key=lambda info: (file_sequence(info.path), info.path))
+
+
+def next_sequence(store: LeaseStore, key: str = SEQUENCE_KEY) -> int:
+    """Next number of a counter in a lease store, incremented with compare-and-swap so every caller gets its own"""
+    while True:
+        current = store.read(key)
+        if current is None:
+            if store.create(key, b"1") is not None:
+                return 1
+            continue
+
+        sequence = int(current[0]) + 1
+        if store.replace(key, str(sequence).encode("utf-8"), current[1]) is not None:
+            return sequence
@@ -0,0 +1,262 @@
+import contextlib
+import resource
+import statistics
+import threading
+import time
+from typing import Any, Iterator, Optional
+
+from botocore.hooks import BaseEventHooks
+from pydantic import BaseModel
+
+from precalculator.models import Metadata
+from precalculator.profiling import Profiler
+
+STRAGGLER_FACTOR = 1.5  # workers taking this many times the median worker duration are reported as stragglers
+
+
+class StageRecord(BaseModel):
+    """Resources used by one stage of a worker, e.g. predicting one chunk"""
+
+    stage: str
+    started_at: float  # unix time
+    seconds: float = 0.0
+    rows: int = 0
+    peak_rss: int = 0  # bytes, peak resident memory of the worker process while the stage ran
+    children_peak_rss: int = 0  # bytes, largest child process (Ersilia CLI) waited for so far
+    bytes_downloaded: int = 0  # from S3
+    bytes_uploaded: int = 0  # to S3
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+
+class WorkerRecord(BaseModel):
+    """Structured record of a worker's run, written next to the records of the other workers of the run"""
+
+    model_id: str
+    worker_id: str
+    run_id: str
+    git_sha: str
+    started_at: float  # unix time
+    finished_at: float = 0.0
+    batch_size: int = 0  # Ersilia CLI batch size the worker ran the model with
+    bytes_downloaded: int = 0
+    bytes_uploaded: int = 0
+    stages: list[StageRecord] = []
+
+    @property
+    def duration(self) -> float:
+        return self.finished_at - self.started_at
+
+    def stage_totals(self) -> dict[str, StageRecord]:
+        """Records of each stage combined over chunks and work units: times, rows and bytes summed, peaks maxed"""
+        totals: dict[str, StageRecord] = {}
+        for record in self.stages:
+            total = totals.setdefault(record.stage, StageRecord(stage=record.stage, started_at=record.started_at))
+            total.seconds += record.seconds
+            total.rows += record.rows
+            total.bytes_downloaded += record.bytes_downloaded
+            total.bytes_uploaded += record.bytes_uploaded
+            total.peak_rss = max(total.peak_rss, record.peak_rss)
+            total.children_peak_rss = max(total.children_peak_rss, record.children_peak_rss)
+        return totals
+
+
+class RunSummary(BaseModel):
+    """Records of all workers of a run combined"""
+
+    workers: int
+    duration: float  # seconds from the first worker starting to the last worker finishing
+    rows: int  # rows written to the data lake
+    rows_per_second: float
+    stage_seconds: dict[str, float]  # summed over workers
+    slowest_worker: str
+    slowest_worker_duration: float
+    stragglers: list[str]
+    batch_size: int = 0  # used by most workers
+
+
+class TransferCounter:
+    """Bytes transferred to and from S3 by the boto3 clients whose events it is registered with"""
+
+    def __init__(self):
+        self.downloaded = 0
+        self.uploaded = 0
+        self._lock = threading.Lock()
+
+    def register(self, events: BaseEventHooks) -> None:
+        """Count the transfers of clients created from a session (or of a single client) from now on"""
+        events.register("after-call.s3.GetObject", self._count_download)
+        events.register("before-send.s3.PutObject", self._count_upload)
+        events.register("before-send.s3.UploadPart", self._count_upload)
+
+    def totals(self) -> tuple[int, int]:
+        with self._lock:
+            return self.downloaded, self.uploaded
+
+    def _count_download(self, parsed: dict, **kwargs: Any) -> None:  # noqa: ARG002
+        with self._lock:
+            self.downloaded += parsed.get("ContentLength") or 0
+
+    def _count_upload(self, request: Any, **kwargs: Any) -> None:  # noqa: ARG002, ANN401
+        with self._lock:
+            self.uploaded += int(request.headers.get("Content-Length") or 0)
+
+
+def _read_status(field: str) -> Optional[int]:
+    """Memory field of /proc/self/status in bytes, None where there is no /proc"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss() -> int:
+    """Peak resident memory of this process in bytes, since start or since the last reset"""
+    peak = _read_status("VmHWM")
+    if peak is not None:
+        return peak
+    # ru_maxrss is reported in kilobytes on Linux, and can't be reset
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def current_rss() -> int:
+    """Resident memory of this process in bytes, 0 where it can't be read"""
+    return _read_status("VmRSS") or 0
+
+
+def reset_peak_rss() -> None:
+    """Restart the peak of peak_rss from the current resident memory, where the kernel allows it"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+class Instrumentation:
+    def __init__(self, model_id: str, worker_id: str, run_id: str, git_sha: str, profiler: Optional[Profiler] = None):
+        """Per-stage wall time, throughput, memory and S3 transfers of a worker
+
+        Stages may run concurrently (the model and the upload of the previous chunk in pipelined mode). The peak
+        memory of a stage then covers the time since the earliest of them started, and S3 transfers are counted
+        in every stage running while they happen. The worker totals are exact.
+
+        Args:
+            model_id (str): ID of the model being predicted
+            worker_id (str): ID of the worker within the run, e.g. its position in the matrix
+            run_id (str): ID shared by all workers of a pipeline run
+            git_sha (str): commit the worker runs
+            profiler (Optional[Profiler]): also profiles every stage if given
+        """
+        self.record = WorkerRecord(
+            model_id=model_id, worker_id=worker_id, run_id=run_id, git_sha=git_sha, started_at=time.time()
+        )
+        self.transfers = TransferCounter()
+        self.profiler = profiler
+        self._lock = threading.Lock()
+        self._active = 0
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[StageRecord]:
+        """Measure the enclosed code as a stage. The caller sets the number of rows on the yielded record."""
+        with self._lock:
+            if self._active == 0:
+                reset_peak_rss()
+            self._active += 1
+
+        record = StageRecord(stage=name, started_at=time.time())
+        downloaded, uploaded = self.transfers.totals()
+        start = time.perf_counter()
+        try:
+            with self.profiler.stage(name) if self.profiler is not None else contextlib.nullcontext():
+                yield record
+        finally:
+            record.seconds = time.perf_counter() - start
+            record.peak_rss = peak_rss()
+            record.children_peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+            total_downloaded, total_uploaded = self.transfers.totals()
+            record.bytes_downloaded = total_downloaded - downloaded
+            record.bytes_uploaded = total_uploaded - uploaded
+
+            with self._lock:
+                self._active -= 1
+                self.record.stages.append(record)
+
+    def finish(self) -> WorkerRecord:
+        """Record of the worker so far, with its totals. Stops the profiler, if any."""
+        if self.profiler is not None:
+            self.profiler.close()
+            self.profiler = None
+        self.record.finished_at = time.time()
+        self.record.bytes_downloaded, self.record.bytes_uploaded = self.transfers.totals()
+        return self.record
+
+
+def run_records_prefix(meta_prefix: str, model_id: str, run_id: str) -> str:
+    """Prefix of the worker records of a run in the bucket"""
+    return f"{meta_prefix}/{model_id}/runs/{run_id}/"
+
+
+def read_worker_records(
+    s3: Any, bucket: str, meta_prefix: str, model_id: str, run_id: str  # noqa: ANN401
+) -> list[WorkerRecord]:
+    """Records written by the workers of a run"""
+    prefix = run_records_prefix(meta_prefix, model_id, run_id)
+    records = []
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            body = s3.get_object(Bucket=bucket, Key=obj["Key"])["Body"].read()
+            records.append(WorkerRecord.model_validate_json(body))
+    return records
+
+
+def summarize_run(records: list[WorkerRecord]) -> RunSummary:
+    """Combine the records of the workers of a run, and find the workers holding it up"""
+    if not records:
+        raise ValueError("No worker records to summarize")
+
+    duration = max(r.finished_at for r in records) - min(r.started_at for r in records)
+    rows = sum(stage.rows for r in records for stage in r.stages if stage.stage == "write_to_lake")
+
+    stage_seconds: dict[str, float] = {}
+    for r in records:
+        for stage, total in r.stage_totals().items():
+            stage_seconds[stage] = stage_seconds.get(stage, 0.0) + total.seconds
+
+    slowest = max(records, key=lambda r: r.duration)
+    median = statistics.median(r.duration for r in records)
+    batch_sizes = [r.batch_size for r in records if r.batch_size > 0]
+
+    return RunSummary(
+        workers=len(records),
+        duration=duration,
+        rows=rows,
+        rows_per_second=rows / duration if duration > 0 else 0.0,
+        stage_seconds=stage_seconds,
+        slowest_worker=slowest.worker_id,
+        slowest_worker_duration=slowest.duration,
+        stragglers=sorted(r.worker_id for r in records if r.duration > STRAGGLER_FACTOR * median),
+        batch_size=statistics.mode(batch_sizes) if batch_sizes else 0,
+    )
+
+
+def apply_run_summary(metadata: Metadata, summary: RunSummary) -> Metadata:
+    """Metadata of a pipeline run with the combined records of its workers"""
+    return metadata.model_copy(
+        update={
+            "pipeline_workers": summary.workers,
+            "pipeline_workers_duration": round(summary.duration),
+            "pipeline_rows_per_second": summary.rows_per_second,
+            "pipeline_stage_seconds": summary.stage_seconds,
+            "pipeline_slowest_worker": summary.slowest_worker,
+            "pipeline_slowest_worker_duration": round(summary.slowest_worker_duration),
+            "pipeline_stragglers": summary.stragglers,
+            "batch_size": summary.batch_size or metadata.batch_size,
+        }
+    )
@@ -0,0 +1,38 @@
+import re
+import zlib
+from typing import Iterable, Optional
+
+# Predictions are partitioned by model_id and then by a hash of the InChIKey, so that a request of a few hundred keys
+# only reads part of a model's partition. The hash is CRC-32, which the standard library computes in the Lambdas too.
+KEY_BUCKET_COLUMN = "key_bucket"
+KEY_BUCKET_COUNT = 64  # few enough that a worker's write or a pipelined chunk isn't split into many tiny files
+KEY_BUCKET_DIGITS = len(f"{KEY_BUCKET_COUNT - 1:x}")
+
+INCHIKEY_PATTERN = re.compile(r"^[A-Z]{14}-[A-Z]{10}-[A-Z]$")
+
+
+def key_bucket(key: str) -> str:
+    """Bucket of the predictions partition that holds a given InChIKey, as hexadecimal digits, e.g. 3f"""
+    return f"{zlib.crc32(key.encode('utf-8')) % KEY_BUCKET_COUNT:0{KEY_BUCKET_DIGITS}x}"
+
+
+def is_key_bucket(name: str) -> bool:
+    """Whether a bucket directory name is one of the current buckets, rather than one of an earlier layout"""
+    return re.fullmatch(f"[0-9a-f]{{{KEY_BUCKET_DIGITS}}}", name) is not None and int(name, 16) < KEY_BUCKET_COUNT
+
+
+def key_buckets(keys: Iterable[str]) -> list[str]:
+    """Sorted buckets touched by a set of InChIKeys"""
+    return sorted({key_bucket(key) for key in keys})
+
+
+def is_inchikey(value: str) -> bool:
+    return INCHIKEY_PATTERN.match(value) is not None
+
+
+def request_keys(inputs: Iterable[str]) -> Optional[list[str]]:
+    """The request's inputs if they are all InChIKeys (so buckets can be pruned), otherwise None"""
+    keys = [value.strip() for value in inputs]
+    if keys and all(is_inchikey(key) for key in keys):
+        return keys
+    return None
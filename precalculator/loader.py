@@ -0,0 +1,290 @@
+import logging
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, Optional
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+from pydantic import BaseModel
+
+from precalculator.dataset import PREDICTION_SCHEMA, deduplicate_by_sequence, file_bucket
+from precalculator.generations import current_path, list_data_files
+
+MAX_BATCH_ITEMS = 25  # DynamoDB limit per batch_write_item call
+DEFAULT_WORKERS = 16
+DEFAULT_READ_ROWS = 10_000
+MAX_ATTEMPTS = 10
+BASE_DELAY = 0.05  # seconds, doubled on every retry of unprocessed items
+MAX_DELAY = 5.0
+LOG_INTERVAL = 10.0  # seconds between progress logs
+
+logger = logging.getLogger("DynamoDBLoader")
+logger.setLevel(logging.INFO)
+
+
+class LoadStats(BaseModel):
+    """Progress of a bulk load into DynamoDB"""
+
+    rows_read: int = 0
+    items_written: int = 0
+    batches: int = 0
+    retries: int = 0  # batch_write_item calls made again for unprocessed items
+    seconds: float = 0.0
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items_written / self.seconds if self.seconds > 0 else 0.0
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        rate: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        """Token bucket shared by the writer threads, limiting the number of items written per second.
+
+        Items of predictions are well under 1 KB, so each item written consumes one write capacity unit and `rate`
+        is the write capacity the load may use. Callers reserve tokens up front and sleep off any deficit outside
+        the lock, so a burst of workers is spread out over time rather than serialised.
+
+        Args:
+            rate (float): items per second, also the size of the bucket
+            clock (Callable[[], float]): monotonic clock in seconds
+            sleep (Callable[[float], None]): called with the number of seconds to wait
+        """
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+
+        self.rate = rate
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = rate
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self, n: int) -> None:
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate) - n
+            self.updated = now
+            wait_seconds = -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+        if wait_seconds > 0:
+            self.sleep(wait_seconds)
+
+
+def _number(value: Optional[float]) -> dict:
+    # DynamoDB numbers can't be NaN or infinite
+    if value is None or not math.isfinite(value):
+        return {"NULL": True}
+    return {"N": repr(value)}
+
+
+def _text(value: Optional[str]) -> dict:
+    return {"NULL": True} if value is None else {"S": value}
+
+
+def prediction_items(batch: pa.RecordBatch, model_id: str) -> Iterator[dict]:
+    """Serialize the rows of a record batch as items of the precalculations table read by the API
+
+    Args:
+        batch (pa.RecordBatch): rows with the key, input, output and output_text columns of the predictions dataset
+        model_id (str): ID of the model the predictions belong to
+
+    Yields:
+        dict: item in the low-level DynamoDB format, keyed by input key and model ID
+    """
+    sort_key = {"S": f"MODELID#{model_id}"}
+    # output_text is null in files written before it was added
+    texts = batch.column("output_text").to_pylist() if "output_text" in batch.schema.names else [None] * len(batch)
+    for key, smiles, output, output_text in zip(
+        batch.column("key").to_pylist(),
+        batch.column("input").to_pylist(),
+        batch.column("output").to_pylist(),
+        texts,
+        strict=True,
+    ):
+        precalculation = {name: _number(value) for name, value in output}
+        precalculation.update((name, _text(value)) for name, value in output_text or [])
+        yield {
+            "PK": {"S": f"INPUTKEY#{key}"},
+            "SK": sort_key,
+            "Smiles": {"S": smiles},
+            "Precalculation": {"M": precalculation},
+        }
+
+
+def _chunks(items: Iterable[dict]) -> Iterator[list[dict]]:
+    # batch_write_item rejects batches with duplicate keys
+    chunk: dict[str, dict] = {}
+    for item in items:
+        chunk[item["PK"]["S"]] = item
+        if len(chunk) == MAX_BATCH_ITEMS:
+            yield list(chunk.values())
+            chunk = {}
+    if chunk:
+        yield list(chunk.values())
+
+
+def write_batch(client, table_name: str, items: list[dict]) -> int:  # noqa: ANN001
+    """Write one batch of at most 25 items, retrying unprocessed items with jittered exponential backoff
+
+    Args:
+        client: boto3 DynamoDB client (thread-safe, unlike the resource)
+        table_name (str): name of the table
+        items (list[dict]): serialized items
+
+    Returns:
+        int: number of retries needed
+    """
+    request = {table_name: [{"PutRequest": {"Item": item}} for item in items]}
+
+    for attempt in range(MAX_ATTEMPTS):
+        response = client.batch_write_item(RequestItems=request)
+
+        request = response.get("UnprocessedItems") or {}
+        if not request:
+            return attempt
+
+        # full jitter, so that throttled workers don't retry in lockstep
+        time.sleep(random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2**attempt)))
+
+    raise RuntimeError(f"{len(request[table_name])} items still unprocessed after {MAX_ATTEMPTS} attempts")
+
+
+def load_items(
+    client,  # noqa: ANN001
+    table_name: str,
+    items: Iterable[dict],
+    workers: int = DEFAULT_WORKERS,
+    max_write_capacity: Optional[float] = None,
+    stats: Optional[LoadStats] = None,
+) -> LoadStats:
+    """Write items to a DynamoDB table with parallel batch_write_item calls
+
+    Items are consumed lazily: at most two batches per worker are in flight, so the load streams in constant memory.
+
+    Args:
+        client: boto3 DynamoDB client, with a connection pool at least as large as `workers`
+        table_name (str): name of the table
+        items (Iterable[dict]): serialized items
+        workers (int): number of concurrent batch writes
+        max_write_capacity (Optional[float]): write capacity units per second the load may consume, unlimited if None
+        stats (Optional[LoadStats]): stats to update, e.g. with the number of rows read by the caller
+
+    Returns:
+        LoadStats: number of items and batches written, retries, and the duration of the load
+    """
+    stats = stats if stats is not None else LoadStats()
+    limiter = RateLimiter(max_write_capacity) if max_write_capacity else None
+    start = last_log = time.perf_counter()
+
+    def write(batch: list[dict]) -> tuple[int, int]:
+        if limiter is not None:
+            limiter.acquire(len(batch))
+        return len(batch), write_batch(client, table_name, batch)
+
+    def collect(done: set[Future]) -> None:
+        nonlocal last_log
+        for future in done:
+            written, retries = future.result()
+            stats.items_written += written
+            stats.retries += retries
+            stats.batches += 1
+
+        now = time.perf_counter()
+        stats.seconds = now - start
+        if now - last_log >= LOG_INTERVAL:
+            last_log = now
+            logger.info(
+                f"Written {stats.items_written} items in {stats.batches} batches "
+                f"({stats.items_per_second:.0f} items/s, {stats.retries} retries)"
+            )
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending: set[Future] = set()
+        for batch in _chunks(items):
+            pending.add(executor.submit(write, batch))
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(wait(pending).done)
+
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+
+def load_model_predictions(
+    client,  # noqa: ANN001
+    table_name: str,
+    dataset_path: str,
+    model_id: str,
+    workers: int = DEFAULT_WORKERS,
+    max_write_capacity: Optional[float] = None,
+    read_rows: int = DEFAULT_READ_ROWS,
+    filesystem: Optional[pafs.FileSystem] = None,
+) -> LoadStats:
+    """Load a model's predictions from the Parquet dataset into the DynamoDB table served by the API
+
+    The model's partition is read one key bucket at a time, so memory use is bounded by the size of a bucket rather
+    than of the partition. A key written more than once since the last compaction is loaded from the file with the
+    highest sequence number, like the Athena query reads it. Partitions with files outside the key buckets must be
+    compacted first, since the keys of those files can be in any bucket.
+
+    Args:
+        client: boto3 DynamoDB client, with a connection pool at least as large as `workers`
+        table_name (str): name of the table
+        dataset_path (str): root of the predictions dataset, an s3:// URI or a local directory
+        model_id (str): ID of the model whose partition is loaded
+        workers (int): number of concurrent batch writes
+        max_write_capacity (Optional[float]): write capacity units per second the load may consume, unlimited if None
+        read_rows (int): rows per record batch read from the dataset
+        filesystem (Optional[pafs.FileSystem]): filesystem of the path, inferred from the path if not given
+
+    Returns:
+        LoadStats: rows read, items written and throughput of the load
+
+    Raises:
+        ValueError: if the partition has files outside the key buckets
+    """
+    if filesystem is None:
+        filesystem, dataset_path = pafs.FileSystem.from_uri(dataset_path)
+
+    generation_path = current_path(filesystem, f"{dataset_path.rstrip('/')}/model_id={model_id}")
+    bucket_files: dict[str, list[str]] = defaultdict(list)
+    for info in list_data_files(filesystem, generation_path):
+        bucket = file_bucket(generation_path, info.path)
+        if bucket is None:
+            raise ValueError(
+                f"{info.path} is outside the key buckets, compact the partition with scripts/compact_predictions.py "
+                "before loading it"
+            )
+        bucket_files[bucket].append(info.path)
+
+    stats = LoadStats()
+
+    def items() -> Iterator[dict]:
+        # a key is only ever written to its own bucket, so each bucket is deduplicated on its own
+        for bucket in sorted(bucket_files):
+            dataset = ds.dataset(
+                bucket_files[bucket], schema=PREDICTION_SCHEMA, format="parquet", filesystem=filesystem
+            )
+            table = dataset.to_table(columns=[*PREDICTION_SCHEMA.names, "__filename"])
+            stats.rows_read += table.num_rows
+            for batch in deduplicate_by_sequence(table).to_batches(max_chunksize=read_rows):
+                yield from prediction_items(batch, model_id)
+
+    load_items(client, table_name, items(), workers=workers, max_write_capacity=max_write_capacity, stats=stats)
+
+    logger.info(
+        f"Loaded {stats.items_written} predictions of {model_id} into {table_name} in {stats.seconds:.1f}s "
+        f"({stats.items_per_second:.0f} items/s, {stats.retries} retries)"
+    )
+    return stats
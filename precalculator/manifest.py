@@ -0,0 +1,67 @@
+import logging
+import time
+
+from pydantic import BaseModel
+
+from precalculator.models import Metadata
+from precalculator.scheduler import LeaseStore
+
+MANIFEST_KEY = "models.json"
+MAX_ATTEMPTS = 10
+
+logger = logging.getLogger("ModelManifest")
+logger.setLevel(logging.INFO)
+
+
+class ModelEntry(BaseModel):
+    """Availability of a model's precalculations, as served by the get_model Lambda"""
+
+    model_id: str
+    total_unique_preds: int
+    preds_last_updated: int
+
+
+class ModelManifest(BaseModel):
+    """All models with precalculations, refreshed at the end of each pipeline run"""
+
+    updated_at: int = 0
+    models: dict[str, ModelEntry] = {}
+
+
+def update_model_manifest(store: LeaseStore, metadata: Metadata) -> ModelManifest:
+    """Add or refresh a model's entry in the manifest from the metadata of its latest pipeline run.
+
+    Pipelines of different models may finish at the same time, so the manifest is updated with compare-and-swap and
+    the update retried on conflict.
+
+    Args:
+        store (LeaseStore): store over the metadata prefix of the bucket
+        metadata (Metadata): metadata of the model's latest pipeline run
+
+    Returns:
+        ModelManifest: manifest as written
+    """
+    entry = ModelEntry(
+        model_id=metadata.model_id,
+        total_unique_preds=metadata.total_unique_preds,
+        preds_last_updated=metadata.preds_last_updated,
+    )
+
+    for _ in range(MAX_ATTEMPTS):
+        current = store.read(MANIFEST_KEY)
+        manifest = ModelManifest.model_validate_json(current[0]) if current else ModelManifest()
+
+        if metadata.preds_in_store:
+            manifest.models[entry.model_id] = entry
+        else:
+            manifest.models.pop(entry.model_id, None)
+        manifest.updated_at = int(time.time())
+
+        body = manifest.model_dump_json().encode("utf-8")
+        version = store.create(MANIFEST_KEY, body) if current is None else store.replace(MANIFEST_KEY, body, current[1])
+
+        if version is not None:
+            logger.info(f"Model manifest updated with {entry.model_id}, {len(manifest.models)} models available")
+            return manifest
+
+    raise RuntimeError(f"Could not update the model manifest after {MAX_ATTEMPTS} attempts")
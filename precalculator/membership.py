@@ -0,0 +1,78 @@
+import hashlib
+import math
+import struct
+from typing import Iterable, Iterator, Optional
+
+# Standard library only, so that it can be shipped to the fetch_predictions Lambda in the precalculator layer.
+
+# Written into each model partition by compaction. Athena and pyarrow skip files starting with an underscore.
+MEMBERSHIP_FILE = "_membership.bloom"
+DEFAULT_ERROR_RATE = 0.01
+
+_MAGIC = b"PCBF"
+_VERSION = 1
+_HEADER = struct.Struct("<4sBQIQ")  # magic, version, number of bits, number of hashes, number of values
+
+
+class BloomFilter:
+    def __init__(self, num_bits: int, num_hashes: int, bits: Optional[bytearray] = None, count: int = 0):
+        """Set membership with no false negatives and a bounded rate of false positives.
+
+        Used to tell which values of a request have a precalculation without querying the predictions table. A value
+        reported as absent is certainly absent; one reported as present may (rarely) still be missing.
+
+        Args:
+            num_bits (int): size of the bit array
+            num_hashes (int): number of bits set per value
+            bits (Optional[bytearray]): existing bit array, e.g. read back from a file
+            count (int): number of values added so far
+        """
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bits if bits is not None else bytearray((num_bits + 7) // 8)
+        self.count = count
+
+    @classmethod
+    def for_capacity(cls, capacity: int, error_rate: float = DEFAULT_ERROR_RATE) -> "BloomFilter":
+        """Smallest filter that keeps the false positive rate at `error_rate` with `capacity` values"""
+        capacity = max(capacity, 1)
+        num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        return cls(num_bits, num_hashes)
+
+    def _positions(self, value: str) -> Iterator[int]:
+        # double hashing: k positions from the two halves of a single digest
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = struct.unpack("<QQ", digest)
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, value: str) -> None:
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def update(self, values: Iterable[str]) -> None:
+        for value in values:
+            self.add(value)
+
+    def __contains__(self, value: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    def to_bytes(self) -> bytes:
+        return _HEADER.pack(_MAGIC, _VERSION, self.num_bits, self.num_hashes, self.count) + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BloomFilter":
+        magic, version, num_bits, num_hashes, count = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Not a membership filter written by this version of precalculator")
+        return cls(num_bits, num_hashes, bytearray(data[_HEADER.size :]), count)
+
+
+def split_request(membership: BloomFilter, values: list[str]) -> tuple[list[str], list[str]]:
+    """Split the values of a request into those that may have a precalculation and those that certainly don't"""
+    hits, misses = [], []
+    for value in values:
+        (hits if value in membership else misses).append(value)
+    return hits, misses
@@ -0,0 +1,129 @@
+import logging
+import os
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+from pydantic import BaseModel
+
+from precalculator.dataset import PREDICTION_SCHEMA, has_legacy_output
+from precalculator.generations import current_path, list_data_files
+from precalculator.membership import MEMBERSHIP_FILE
+from precalculator.writer import to_prediction_frame
+
+LEGACY_SEPARATOR = ","  # outputs were joined with commas, in the order of the model's output columns
+
+logger = logging.getLogger("Migration")
+logger.setLevel(logging.INFO)
+
+
+class MigrationResult(BaseModel):
+    """Legacy files of a model partition that were rewritten or deleted"""
+
+    files: int = 0
+    rows: int = 0
+    deleted: bool = False
+
+
+def find_legacy_files(filesystem: pafs.FileSystem, partition_path: str) -> list[str]:
+    """Files of a partition's current generation whose `output` is the comma-joined string of the model's outputs"""
+    return [
+        info.path
+        for info in list_data_files(filesystem, current_path(filesystem, partition_path))
+        if has_legacy_output(pq.read_schema(info.path, filesystem=filesystem))
+    ]
+
+
+def convert_legacy_outputs(table: pa.Table, output_columns: list[str]) -> pa.Table:
+    """Split legacy `output` strings into the `output` and `output_text` maps of the current layout.
+
+    The strings were joined without quoting, so they are split on every comma. Columns whose values all parse as
+    numbers go to `output`, the others to `output_text`, as to_prediction_frame would have written them.
+
+    Args:
+        table (pa.Table): rows of a legacy file, with key, input and a string output column
+        output_columns (list[str]): names of the model's output columns, in the order Ersilia wrote them
+
+    Raises:
+        ValueError: if a row doesn't have one value per output column, e.g. because a value contained a comma
+
+    Returns:
+        pa.Table: rows with the columns of PREDICTION_SCHEMA
+    """
+    n_rows, n_cols = table.num_rows, len(output_columns)
+    values = pc.split_pattern(table["output"].combine_chunks(), LEGACY_SEPARATOR)
+
+    lengths = pc.list_value_length(values).to_numpy(zero_copy_only=False)
+    if n_rows > 0 and (lengths != n_cols).any():
+        raise ValueError(
+            f"{int((lengths != n_cols).sum())} rows don't have {n_cols} outputs, so their columns can't be told apart"
+        )
+
+    flat = pc.list_flatten(values)
+    columns = {
+        name: pd.array(table[name].combine_chunks(), dtype=pd.ArrowDtype(pa.string())) for name in ("key", "input")
+    }
+    for i, name in enumerate(output_columns):
+        column = flat.take(pa.array(np.arange(i, n_rows * n_cols, n_cols)))
+        column = pc.if_else(pc.equal(column, ""), pa.scalar(None, pa.string()), column)
+        try:
+            column = pc.cast(column, pa.float64())
+        except pa.ArrowInvalid:
+            pass  # not all numbers, kept as text
+        columns[name] = pd.array(column, dtype=pd.ArrowDtype(column.type))
+
+    frame = to_prediction_frame(pd.DataFrame(columns, copy=False), model_id="")
+    return pa.Table.from_pandas(frame[PREDICTION_SCHEMA.names], schema=PREDICTION_SCHEMA, preserve_index=False)
+
+
+def migrate_partition(
+    partition_path: str,
+    output_columns: Optional[list[str]] = None,
+    filesystem: Optional[pafs.FileSystem] = None,
+) -> MigrationResult:
+    """Bring the legacy files of a model partition to the current layout, in place.
+
+    With `output_columns`, every legacy file is converted (see convert_legacy_outputs) into a hidden file next to
+    it, which then replaces it. Without, the legacy files are deleted, together with the partition's membership
+    filter, and the model's predictions have to be generated again in full (without delta mode).
+
+    Args:
+        partition_path (str): model partition, e.g. s3://bucket/predictions/model_id=eos3b5e or a local path
+        output_columns (Optional[list[str]]): names of the model's output columns, in the order Ersilia wrote them
+        filesystem (Optional[pafs.FileSystem]): filesystem of the path, inferred from the path if not given
+
+    Returns:
+        MigrationResult: number of legacy files and rows, and whether they were deleted
+    """
+    if filesystem is None:
+        filesystem, partition_path = pafs.FileSystem.from_uri(partition_path)
+
+    partition_path = partition_path.rstrip("/")
+    paths = find_legacy_files(filesystem, partition_path)
+    result = MigrationResult(files=len(paths), deleted=output_columns is None)
+
+    for path in paths:
+        table = pq.read_table(path, filesystem=filesystem, partitioning=None)
+        result.rows += table.num_rows
+
+        if output_columns is None:
+            filesystem.delete_file(path)
+            continue
+
+        staging_path = f"{os.path.dirname(path)}/.{os.path.basename(path)}.migrating"
+        pq.write_table(convert_legacy_outputs(table, output_columns), staging_path, filesystem=filesystem)
+        filesystem.move(staging_path, path)
+
+    if paths and output_columns is None:
+        membership_path = f"{partition_path}/{MEMBERSHIP_FILE}"
+        if filesystem.get_file_info(membership_path).type == pafs.FileType.File:
+            filesystem.delete_file(membership_path)
+
+    action = "Deleted" if result.deleted else "Migrated"
+    logger.info(f"{action} {result.files} legacy files with {result.rows} rows in {partition_path}")
+
+    return result
@@ -1,6 +1,16 @@
+from datetime import datetime
+from typing import Callable
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 from pydantic import BaseModel, Field
 
+from precalculator.layout import INCHIKEY_PATTERN
+
+MAX_EXAMPLES = 3  # invalid values quoted in validation errors
+
 
 class Prediction(BaseModel):
     """Dataclass to represent a single prediction"""
@@ -8,6 +18,7 @@ class Prediction(BaseModel):
     key: str
     input: str
     output: dict
+    output_text: dict
     model_id: str
 
 
@@ -21,6 +32,19 @@ class Metadata(BaseModel):
     pipeline_latest_start_time: int = Field(default=0)
     pipeline_latest_duration: int = Field(default=0)
     pipeline_meta_s3_uri: str = Field(default="")
+    batch_size: int = Field(default=0)  # Ersilia CLI batch size of the latest run
+    # read from the Parquet footers of the model's partition (see precalculator.read)
+    total_rows: int = Field(default=0)
+    total_files: int = Field(default=0)
+    total_bytes: int = Field(default=0)
+    # combined from the records of the run's workers (see precalculator.instrumentation)
+    pipeline_workers: int = Field(default=0)
+    pipeline_workers_duration: int = Field(default=0)
+    pipeline_rows_per_second: float = Field(default=0.0)
+    pipeline_stage_seconds: dict[str, float] = Field(default_factory=dict)
+    pipeline_slowest_worker: str = Field(default="")
+    pipeline_slowest_worker_duration: int = Field(default=0)
+    pipeline_stragglers: list[str] = Field(default_factory=list)
 
 
 class SchemaValidationError(Exception):
@@ -30,18 +54,41 @@ class SchemaValidationError(Exception):
         super().__init__(f"Schema validation failed with the following errors:\n{error_message}\n")
 
 
-def validate_dataframe_schema(df: pd.DataFrame, model: BaseModel) -> None:
+def validate_dataframe_schema(df: pd.DataFrame, model: type[BaseModel]) -> dict[str, pa.Array]:
+    """Check that a frame has exactly the fields of a model, with compatible types.
+
+    Each column is converted to Arrow and its type checked, so object columns are checked by the type of their
+    values (a column of strings is told apart from one of dicts) rather than by their pandas dtype. Columns
+    already backed by Arrow are not copied.
+
+    Args:
+        df (pd.DataFrame): frame to validate
+        model (type[BaseModel]): model whose fields the columns must match
+
+    Raises:
+        SchemaValidationError: with every missing, unexpected or mistyped column
+
+    Returns:
+        dict[str, pa.Array]: the model's columns as Arrow arrays, for checks of their values
+    """
     errors = []
+    columns = {}
     schema = model.model_fields
 
     for field_name, field in schema.items():
         if field_name not in df.columns:
             errors.append(f"Missing column: {field_name}")
-        else:
-            pandas_dtype = df[field_name].dtype
-            pydantic_type = field.annotation
-            if not _check_type_compatibility(pandas_dtype, pydantic_type):
-                errors.append(f"Column {field_name} has type {pandas_dtype}, expected {pydantic_type}")
+            continue
+
+        try:
+            array = _to_arrow(df[field_name])
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            errors.append(f"Column {field_name} has values of mixed types: {e}")
+            continue
+
+        if not _check_type_compatibility(array.type, field.annotation):
+            errors.append(f"Column {field_name} has type {array.type}, expected {field.annotation}")
+        columns[field_name] = array
 
     for column in df.columns:
         if column not in schema:
@@ -50,13 +97,73 @@ def validate_dataframe_schema(df: pd.DataFrame, model: BaseModel) -> None:
     if errors:
         raise SchemaValidationError(errors)
 
+    return columns
+
+
+def validate_predictions(df: pd.DataFrame, model_id: str) -> None:
+    """Check a frame of predictions before it is written to the data lake.
+
+    On top of the schema of `Prediction`, checks that no value is null, that keys are InChIKeys, that all rows
+    belong to `model_id` and that every row has the same, non-zero number of outputs across `output` and
+    `output_text`. All checks are vectorized Arrow kernels, so they cost a small fraction of writing the rows to
+    Parquet.
+
+    Args:
+        df (pd.DataFrame): predictions, as returned by precalculator.writer.to_prediction_frame
+        model_id (str): ID of the model the predictions must belong to
+
+    Raises:
+        SchemaValidationError: with every check that failed
+    """
+    columns = validate_dataframe_schema(df, Prediction)
+    errors = []
+
+    for name, array in columns.items():
+        if array.null_count > 0:
+            errors.append(f"Column {name} has {array.null_count} null values")
+
+    keys = columns["key"]
+    invalid = keys.filter(pc.invert(pc.match_substring_regex(keys, INCHIKEY_PATTERN.pattern)))
+    if len(invalid) > 0:
+        examples = invalid.slice(0, MAX_EXAMPLES).to_pylist()
+        errors.append(f"Column key has {len(invalid)} values that are not InChIKeys, e.g. {examples}")
+
+    model_ids = pc.unique(columns["model_id"].drop_null()).to_pylist()
+    if any(value != model_id for value in model_ids):
+        errors.append(f"Column model_id has values {model_ids[:MAX_EXAMPLES]}, expected only {model_id}")
+
+    maps = [columns[name] for name in ("output", "output_text") if pa.types.is_map(columns[name].type)]
+    if maps and len(df) > 0:
+        lengths = sum(np.diff(output.offsets.to_numpy()) for output in maps)
+        if lengths.min() == 0:
+            errors.append(f"Columns output and output_text have {int((lengths == 0).sum())} rows without outputs")
+        elif lengths.min() != lengths.max():
+            errors.append(
+                f"Columns output and output_text have between {lengths.min()} and {lengths.max()} outputs per row"
+            )
+
+    if errors:
+        raise SchemaValidationError(errors)
+
+
+def _to_arrow(column: pd.Series) -> pa.Array:
+    array = pa.array(column, from_pandas=True)
+    return array.combine_chunks() if isinstance(array, pa.ChunkedArray) else array
+
+
+ARROW_TYPE_CHECKS: dict[object, tuple[Callable[[pa.DataType], bool], ...]] = {
+    str: (pa.types.is_string, pa.types.is_large_string, pa.types.is_string_view),
+    int: (pa.types.is_integer,),
+    float: (pa.types.is_floating, pa.types.is_integer),
+    bool: (pa.types.is_boolean,),
+    dict: (pa.types.is_map, pa.types.is_struct),
+    list: (pa.types.is_list, pa.types.is_large_list),
+    datetime: (pa.types.is_timestamp,),
+}
+
 
-def _check_type_compatibility(pandas_dtype, pydantic_type) -> bool:  # noqa: ANN001
-    type_map = {
-        "object": [str, dict, list],
-        "int64": [int],
-        "float64": [float],
-        "bool": [bool],
-        "datetime64": [pd.Timestamp],
-    }
-    return pydantic_type in type_map.get(str(pandas_dtype))  # type: ignore
+def _check_type_compatibility(arrow_type: pa.DataType, pydantic_type: object) -> bool:
+    if pa.types.is_dictionary(arrow_type):
+        # categorical columns are checked by the type of their categories
+        arrow_type = arrow_type.value_type
+    return any(check(arrow_type) for check in ARROW_TYPE_CHECKS.get(pydantic_type, ()))
@@ -0,0 +1,128 @@
+import os
+import subprocess
+import time
+from typing import Optional
+
+import pandas as pd
+from pydantic import BaseModel
+
+from precalculator.shards import shard_bounds
+
+DEFAULT_PROCESS_MEMORY = 2 * 1024**3  # bytes of memory to reserve for each model instance
+MEMINFO_PATH = "/proc/meminfo"
+
+
+class ProcessStats(BaseModel):
+    """Throughput of a single model process"""
+
+    index: int
+    rows: int
+    seconds: float
+    returncode: int
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+
+def available_memory(meminfo_path: str = MEMINFO_PATH) -> Optional[int]:
+    """Memory available to new processes in bytes, or None if it cannot be determined.
+
+    This is the kernel's MemAvailable estimate, which counts page cache that can be reclaimed. Free memory alone is
+    much lower on a runner that has just downloaded its inputs and would leave cores idle.
+    """
+    try:
+        with open(meminfo_path) as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024  # reported in kilobytes
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def plan_processes(
+    n_rows: int, max_processes: Optional[int] = None, memory_per_process: int = DEFAULT_PROCESS_MEMORY
+) -> int:
+    """Number of model instances to run, limited by CPU cores, available memory and the number of inputs
+
+    Args:
+        n_rows (int): number of inputs to predict
+        max_processes (Optional[int]): upper bound, defaults to the number of CPU cores
+        memory_per_process (int): memory in bytes that each model instance and its client are expected to need
+
+    Returns:
+        int: number of processes, at least 1
+    """
+    processes = max_processes or os.cpu_count() or 1
+
+    memory = available_memory()
+    if memory is not None:
+        processes = min(processes, memory // memory_per_process)
+
+    return max(1, min(processes, n_rows))
+
+
+def split_csv(input_file_path: str, n_parts: int, output_dir: str) -> list[tuple[str, int]]:
+    """Split a CSV file into contiguous parts, preserving row order
+
+    Returns:
+        list[tuple[str, int]]: path and number of rows of each part
+    """
+    df = pd.read_csv(input_file_path)
+    os.makedirs(output_dir, exist_ok=True)
+
+    parts = []
+    for i in range(1, n_parts + 1):
+        start_row, end_row = shard_bounds(len(df), n_parts, i)
+        path = os.path.join(output_dir, f"part_{i:03d}.csv")
+        df.iloc[start_row:end_row].to_csv(path, index=False)
+        parts.append((path, end_row - start_row))
+
+    return parts
+
+
+def merge_csvs(paths: list[str], output_file_path: str) -> None:
+    """Concatenate CSV files with identical headers, keeping the header of the first file only"""
+    with open(output_file_path, "wb") as out:
+        for i, path in enumerate(paths):
+            with open(path, "rb") as f:
+                header = f.readline()
+                if i == 0:
+                    out.write(header)
+                rows = f.read()
+                if rows and not rows.endswith(b"\n"):
+                    rows += b"\n"
+                out.write(rows)
+
+
+def count_rows(path: str) -> int:
+    """Number of data rows in a CSV file with a header line"""
+    with open(path, "rb") as f:
+        return max(sum(1 for _ in f) - 1, 0)
+
+
+def run_processes(commands: list[list[str]], rows: list[int]) -> list[ProcessStats]:
+    """Start all commands at once and wait for them to finish, timing each one
+
+    Args:
+        commands (list[list[str]]): one command per process
+        rows (list[int]): number of inputs handled by each command, used to compute throughput
+
+    Returns:
+        list[ProcessStats]: stats per process, in the order of `commands`
+    """
+    start = time.perf_counter()
+    processes = [subprocess.Popen(command) for command in commands]
+
+    seconds: dict[int, float] = {}
+    while len(seconds) < len(processes):
+        for i, process in enumerate(processes):
+            if i not in seconds and process.poll() is not None:
+                seconds[i] = time.perf_counter() - start
+        time.sleep(0.1)
+
+    return [
+        ProcessStats(index=i, rows=rows[i], seconds=seconds[i], returncode=process.returncode)
+        for i, process in enumerate(processes)
+    ]
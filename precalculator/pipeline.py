@@ -0,0 +1,79 @@
+import queue
+import threading
+from typing import Callable, Iterable, Optional, TypeVar
+
+T = TypeVar("T")
+U = TypeVar("U")
+
+_DONE = object()
+
+
+class PipelineError(Exception):
+    def __init__(self, stage: str, error: Exception):
+        self.stage = stage
+        self.error = error
+        super().__init__(f"Pipeline failed in {stage} stage: {error!r}")
+
+
+def run_pipelined(
+    items: Iterable[T],
+    produce: Callable[[T], U],
+    consume: Callable[[U], None],
+    queue_depth: int = 2,
+) -> int:
+    """Run `produce` on each item in the calling thread while `consume` handles finished results in the background.
+
+    At most `queue_depth` produced results wait for the consumer at any time, so the producer blocks rather than
+    buffering the whole input when the consumer is slower. The first error in either stage stops the pipeline.
+
+    Args:
+        items (Iterable[T]): work items, e.g. input chunks
+        produce (Callable[[T], U]): CPU-bound step, e.g. running the model on a chunk
+        consume (Callable[[U], None]): I/O-bound step, e.g. postprocessing and uploading a chunk's outputs
+        queue_depth (int): maximum number of produced results waiting to be consumed
+
+    Returns:
+        int: number of items that went through both stages
+    """
+    if queue_depth < 1:
+        raise ValueError(f"queue_depth must be at least 1, got {queue_depth}")
+
+    results: queue.Queue = queue.Queue(maxsize=queue_depth)
+    consumer_error: list[Exception] = []
+    consumed = 0
+
+    def consumer() -> None:
+        nonlocal consumed
+        while True:
+            result = results.get()
+            if result is _DONE:
+                return
+            if consumer_error:
+                continue  # drain the queue so the producer never blocks on a failed consumer
+            try:
+                consume(result)
+                consumed += 1
+            except Exception as e:
+                consumer_error.append(e)
+
+    thread = threading.Thread(target=consumer, name="pipeline-consumer", daemon=True)
+    thread.start()
+
+    producer_error: Optional[Exception] = None
+    try:
+        for item in items:
+            if consumer_error:
+                break
+            results.put(produce(item))
+    except Exception as e:
+        producer_error = e
+    finally:
+        results.put(_DONE)
+        thread.join()
+
+    if producer_error is not None:
+        raise PipelineError("produce", producer_error) from producer_error
+    if consumer_error:
+        raise PipelineError("consume", consumer_error[0]) from consumer_error[0]
+
+    return consumed
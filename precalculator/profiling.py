@@ -0,0 +1,247 @@
+import contextlib
+import cProfile
+import csv
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from typing import Iterator, Optional
+
+PROCESS_SAMPLES_FILE = "processes.csv"
+DEFAULT_SAMPLE_INTERVAL = 1.0  # seconds
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+
+def read_process_table(proc: str = "/proc") -> dict[int, tuple[int, float, int]]:
+    """Parent, CPU seconds and RSS in bytes of every process, from /proc (empty where there is none)
+
+    Returns:
+        dict[int, tuple[int, float, int]]: (ppid, cpu seconds, rss) by pid
+    """
+    try:
+        entries = os.listdir(proc)
+    except OSError:
+        return {}
+
+    ticks = os.sysconf("SC_CLK_TCK")
+    page_size = os.sysconf("SC_PAGE_SIZE")
+
+    table = {}
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(os.path.join(proc, entry, "stat")) as f:
+                stat = f.read()
+        except OSError:
+            continue  # the process exited while the table was read
+
+        # the command name may contain spaces and parentheses, the fields after it don't
+        fields = stat[stat.rindex(")") + 2 :].split()
+        ppid, utime, stime, rss = int(fields[1]), int(fields[11]), int(fields[12]), int(fields[21])
+        table[int(entry)] = (ppid, (utime + stime) / ticks, rss * page_size)
+
+    return table
+
+
+def descendants(pid: int, table: dict[int, tuple[int, float, int]]) -> list[int]:
+    """All processes started by `pid`, directly or not"""
+    children: dict[int, list[int]] = {}
+    for child, (ppid, _, _) in table.items():
+        children.setdefault(ppid, []).append(child)
+
+    found, stack = [], [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            found.append(child)
+            stack.append(child)
+    return found
+
+
+def ancestors(pid: int, table: dict[int, tuple[int, float, int]]) -> list[int]:
+    """Processes that started `pid`, directly or not"""
+    found = []
+    while pid in table and table[pid][0] not in found and table[pid][0] > 0:
+        pid = table[pid][0]
+        found.append(pid)
+    return found
+
+
+def matching_processes(pattern: str, table: dict[int, tuple[int, float, int]], proc: str = "/proc") -> list[int]:
+    """Processes whose command line contains `pattern`, and all processes they started.
+
+    Used to find a served model, e.g. by its model ID, which is part of the command line of its server whether it
+    runs in a conda environment or a Docker container. Processes of a container are in the host's process table
+    too, only not under this process. This process and its ancestors are left out.
+    """
+    excluded = {os.getpid(), *ancestors(os.getpid(), table)}
+
+    matched = []
+    for pid in table:
+        if pid in excluded:
+            continue
+        try:
+            with open(os.path.join(proc, str(pid), "cmdline"), "rb") as f:
+                command_line = f.read().replace(b"\0", b" ").decode(errors="replace")
+        except OSError:
+            continue  # the process exited while the table was read
+        if pattern in command_line:
+            matched.append(pid)
+
+    found = set(matched)
+    for pid in matched:
+        found.update(descendants(pid, table))
+    return sorted(found - excluded)
+
+
+class ProcessSampler:
+    def __init__(
+        self,
+        path: str,
+        interval: float = DEFAULT_SAMPLE_INTERVAL,
+        stages: Optional[set[str]] = None,
+        server_pattern: Optional[str] = None,
+    ):
+        """Background thread sampling the CPU use and RSS of the processes this process started and of the model server.
+
+        Samples are appended to a CSV file with the time since sampling started, the stages running at the time,
+        the number of sampled processes, their CPU use in percent of one core since the previous sample, their total
+        RSS and the RSS of the model server alone. The server is found by `server_pattern` (see matching_processes),
+        since a model served in a Docker container runs outside this process tree.
+
+        Args:
+            path (str): CSV file the samples are written to
+            interval (float): seconds between samples
+            stages (Optional[set[str]]): names of the stages running, updated by the caller
+            server_pattern (Optional[str]): part of the command line of the model server, e.g. its model ID
+        """
+        self.path = path
+        self.interval = interval
+        self.stages = stages if stages is not None else set()
+        self.server_pattern = server_pattern
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="process-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        start = previous_time = time.perf_counter()
+        previous_cpu: dict[int, float] = {}
+
+        with open(self.path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["seconds", "stages", "processes", "cpu_percent", "rss_bytes", "server_rss_bytes"])
+
+            while not self._stop.wait(self.interval):
+                table = read_process_table()
+                server = matching_processes(self.server_pattern, table) if self.server_pattern is not None else []
+                pids = sorted({*descendants(os.getpid(), table), *server} & table.keys())
+                now = time.perf_counter()
+
+                cpu = {pid: table[pid][1] for pid in pids}
+                # processes seen for the first time only count from now on
+                used = sum(seconds - previous_cpu.get(pid, seconds) for pid, seconds in cpu.items())
+                cpu_percent = 100 * used / (now - previous_time)
+
+                writer.writerow(
+                    [
+                        f"{now - start:.1f}",
+                        "+".join(sorted(self.stages)),
+                        len(pids),
+                        f"{cpu_percent:.0f}",
+                        sum(table[pid][2] for pid in pids),
+                        sum(table[pid][2] for pid in server if pid in table),
+                    ]
+                )
+                f.flush()
+                previous_time, previous_cpu = now, cpu
+
+
+class Profiler:
+    def __init__(
+        self, output_dir: str, sample_interval: float = DEFAULT_SAMPLE_INTERVAL, server_pattern: Optional[str] = None
+    ):
+        """Profiles of each stage of a worker, written as artifacts to a directory
+
+        For every stage run, the directory gets:
+        - `<n>-<stage>.prof`: cProfile stats, e.g. for snakeviz or `python -m pstats`
+        - `<n>-<stage>.txt`: the functions with the highest cumulative time
+        - `<n>-<stage>-memory.txt`: the lines that allocated the most memory during the stage (tracemalloc)
+
+        and `processes.csv` samples the CPU and RSS of child processes and of the model server throughout the run.
+        cProfile only sees the thread a stage runs in, and tracemalloc slows allocation-heavy code down noticeably, so
+        profiled runs are for finding where time goes rather than for measuring it.
+
+        Args:
+            output_dir (str): directory the artifacts are written to
+            sample_interval (float): seconds between samples of the child processes
+            server_pattern (Optional[str]): part of the command line of the model server, e.g. its model ID
+        """
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._count = 0
+        self._stages: set[str] = set()
+        self._sampler = ProcessSampler(
+            os.path.join(output_dir, PROCESS_SAMPLES_FILE), sample_interval, self._stages, server_pattern
+        )
+
+        tracemalloc.start()
+        self._sampler.start()
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        with self._lock:
+            self._count += 1
+            prefix = os.path.join(self.output_dir, f"{self._count:03d}-{name}")
+            self._stages.add(name)
+
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            peak = tracemalloc.get_traced_memory()[1]
+            after = tracemalloc.take_snapshot()
+
+            with self._lock:
+                self._stages.discard(name)
+
+            self._write_profile(profile, prefix)
+            self._write_allocations(before, after, peak, prefix)
+
+    def close(self) -> None:
+        self._sampler.stop()
+        tracemalloc.stop()
+
+    def _write_profile(self, profile: cProfile.Profile, prefix: str) -> None:
+        profile.dump_stats(f"{prefix}.prof")
+
+        text = io.StringIO()
+        pstats.Stats(profile, stream=text).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+        with open(f"{prefix}.txt", "w") as f:
+            f.write(text.getvalue())
+
+    def _write_allocations(
+        self, before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, peak: int, prefix: str
+    ) -> None:
+        # the profiler's own bookkeeping is not of interest
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        differences = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+
+        with open(f"{prefix}-memory.txt", "w") as f:
+            f.write(f"Peak traced memory during the stage: {peak / 1024**2:.1f} MiB\n\n")
+            for difference in differences[:TOP_ALLOCATIONS]:
+                f.write(f"{difference}\n")
@@ -0,0 +1,103 @@
+import re
+from typing import Literal
+
+from precalculator.layout import KEY_BUCKET_COLUMN, key_buckets
+
+# This module only depends on the standard library and precalculator.layout, so that it can be shipped to the
+# fetch_predictions Lambda in a layer (see infra/precalculator).
+
+PREDICTION_COLUMNS = ["model_id", "key", "input", "output", "output_text"]
+OUTPUT_COLUMNS = ["output", "output_text"]  # map columns
+MAX_IN_LIST = 200  # requests with more values are semi-joined against the requests table instead
+
+IDENTIFIER_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def quote_literal(value: str) -> str:
+    """SQL string literal for an Athena execution parameter, which is substituted as written"""
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _identifier(name: str) -> str:
+    if IDENTIFIER_PATTERN.match(name) is None:
+        raise ValueError(f"Invalid table name: {name}")
+    return name
+
+
+def uses_request_table(n_values: int, max_in_list: int = MAX_IN_LIST) -> bool:
+    """Whether a request of `n_values` distinct inputs is joined against the requests table rather than inlined"""
+    return n_values > max_in_list
+
+
+def build_prediction_query(
+    model_id: str,
+    request_id: str,
+    values: list[str],
+    column: Literal["input", "key"] = "input",
+    prediction_table: str = "predictions",
+    request_table: str = "requests",
+    max_in_list: int = MAX_IN_LIST,
+    json_outputs: bool = False,
+) -> tuple[str, list[str]]:
+    """Athena query for a model's predictions of the inputs or keys of a request.
+
+    The request is pushed into the scan of the predictions table: small requests as an IN-list of parameters, large
+    ones as a semi-join against the request's partition of the requests table (which the caller must have written).
+    Either way, the result holds one row per matching key, so its size follows the request and not the model. Keys
+    written more than once since the last compaction are returned from the latest file, whose name starts with the
+    highest sequence number (see precalculator.generations). Lookups by key also restrict the scan to the key buckets
+    of the request.
+
+    Args:
+        model_id (str): ID of the model
+        request_id (str): ID of the request, used by the semi-join
+        values (list[str]): inputs or InChIKeys of the request
+        column (Literal["input", "key"]): column of the predictions table the values are matched against
+        prediction_table (str): name of the predictions table
+        request_table (str): name of the requests table
+        max_in_list (int): largest number of distinct values inlined as an IN-list
+        json_outputs (bool): whether the output maps are returned as JSON objects, for results read as CSV, where
+            Athena would write them as {name=value}
+
+    Returns:
+        tuple[str, list[str]]: query with `?` placeholders, and its execution parameters as SQL literals
+    """
+    if column not in ("input", "key"):
+        raise ValueError(f"Cannot match requests on column {column}")
+    if len(values) == 0:
+        raise ValueError("Cannot query predictions for an empty request")
+
+    values = list(dict.fromkeys(values))
+    predicates = ["p.model_id = ?"]
+    params = [quote_literal(model_id)]
+
+    if column == "key":
+        buckets = key_buckets(values)
+        predicates.append(f"p.{KEY_BUCKET_COLUMN} in ({', '.join('?' * len(buckets))})")
+        params += [quote_literal(bucket) for bucket in buckets]
+
+    if uses_request_table(len(values), max_in_list):
+        predicates.append(f"p.{column} in (select r.input from {_identifier(request_table)} r where r.request_id = ?)")
+        params.append(quote_literal(request_id))
+    else:
+        predicates.append(f"p.{column} in ({', '.join('?' * len(values))})")
+        params += [quote_literal(value) for value in values]
+
+    columns = ", ".join(
+        f"json_format(cast({name} as json)) as {name}" if json_outputs and name in OUTPUT_COLUMNS else name
+        for name in PREDICTION_COLUMNS
+    )
+    scan_columns = ", ".join(f"p.{name}" for name in PREDICTION_COLUMNS)
+    where = "\n        and ".join(predicates)
+    query = (
+        f"select {columns}\n"
+        "from (\n"
+        f"    select {scan_columns},\n"
+        '        row_number() over (partition by p.key order by p."$path" desc) as latest\n'
+        f"    from {_identifier(prediction_table)} p\n"
+        f"    where {where}\n"
+        ")\n"
+        "where latest = 1"
+    )
+
+    return query, params
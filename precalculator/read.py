@@ -0,0 +1,266 @@
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+from pydantic import BaseModel
+
+from precalculator.compaction import COMPACTED_SUFFIX
+from precalculator.generations import KEY_COUNTS_FILE, current_path, list_data_files
+from precalculator.layout import KEY_BUCKET_COLUMN, key_bucket
+from precalculator.models import Metadata
+
+# files written by precalculator.compaction, which leaves a single row per key in the generation it writes
+COMPACTED_FILE = re.compile(rf"/\d+_{COMPACTED_SUFFIX}-\d{{5}}\.parquet$")
+FOOTER_READERS = 16
+
+logger = logging.getLogger("Metadata")
+logger.setLevel(logging.INFO)
+
+
+class FileStats(BaseModel):
+    """Statistics of a Parquet file of a model partition, read from its footer"""
+
+    path: str
+    bytes: int
+    rows: int
+    row_groups: int
+    key_min: Optional[str] = None
+    key_max: Optional[str] = None
+    modified: int = 0  # unix time
+
+    @property
+    def compacted(self) -> bool:
+        return COMPACTED_FILE.search(self.path) is not None
+
+    @property
+    def bucket(self) -> Optional[str]:
+        match = re.search(rf"{KEY_BUCKET_COLUMN}=([^/]+)/", self.path)
+        return match.group(1) if match else None
+
+
+class PartitionStats(BaseModel):
+    """Size and contents of a model partition"""
+
+    model_id: str
+    files: int = 0
+    rows: int = 0
+    bytes: int = 0
+    unique_keys: int = 0
+    key_min: Optional[str] = None
+    key_max: Optional[str] = None
+    last_modified: int = 0  # unix time
+    new_files: int = 0  # files written since the last compaction whose keys were read, as they had not been counted
+
+
+class KeyCounts(BaseModel):
+    """Keys each file written since the last compaction added to a generation, stored next to its files"""
+
+    files: dict[str, int] = {}  # path relative to the generation -> keys no earlier file holds
+
+
+def read_file_stats(filesystem: pafs.FileSystem, info: pafs.FileInfo) -> FileStats:
+    """Row count and key range of a Parquet file, from its footer only"""
+    metadata = pq.read_metadata(info.path, filesystem=filesystem)
+
+    key_min, key_max = None, None
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+        for j in range(row_group.num_columns):
+            column = row_group.column(j)
+            if column.path_in_schema != "key" or column.statistics is None or not column.statistics.has_min_max:
+                continue
+            key_min = column.statistics.min if key_min is None else min(key_min, column.statistics.min)
+            key_max = column.statistics.max if key_max is None else max(key_max, column.statistics.max)
+
+    return FileStats(
+        path=info.path,
+        bytes=info.size or 0,
+        rows=metadata.num_rows,
+        row_groups=metadata.num_row_groups,
+        key_min=key_min,
+        key_max=key_max,
+        modified=(info.mtime_ns or 0) // 10**9,
+    )
+
+
+def _split_compacted(files: list[FileStats]) -> tuple[list[FileStats], list[FileStats]]:
+    """Files of the compaction that wrote the current generation, with distinct keys, and the files written since"""
+    return [f for f in files if f.compacted], [f for f in files if not f.compacted]
+
+
+def read_key_counts(filesystem: pafs.FileSystem, path: str) -> KeyCounts:
+    try:
+        with filesystem.open_input_stream(path) as f:
+            return KeyCounts.model_validate_json(f.read())
+    except FileNotFoundError:
+        return KeyCounts()
+
+
+def write_key_counts(filesystem: pafs.FileSystem, path: str, counts: KeyCounts) -> None:
+    with filesystem.open_output_stream(path) as f:
+        f.write(counts.model_dump_json().encode("utf-8"))
+
+
+def count_unique_keys(
+    filesystem: pafs.FileSystem, files: list[FileStats], counts_path: Optional[str] = None
+) -> tuple[int, int]:
+    """Exact number of distinct keys in a partition, reading as little data as possible.
+
+    The compacted files of the current generation hold a single row per key, so their keys are counted from the
+    footers. The keys each file written since then added are recorded in a sidecar at `counts_path`, so only the
+    keys of files not counted yet are read. The compacted and counted files whose bucket and key range could hold
+    any of those keys are searched for them. A partition with no new files since the last call is counted without
+    reading data.
+
+    Args:
+        filesystem (pafs.FileSystem): filesystem of the files
+        files (list[FileStats]): data files of the current generation of the partition
+        counts_path (Optional[str]): sidecar holding the keys each new file added, read and updated if given
+
+    Returns:
+        tuple[int, int]: number of distinct keys, and number of files whose keys had to be read
+    """
+    compacted, new = _split_compacted(files)
+    base = os.path.dirname(counts_path) if counts_path is not None else ""
+    names = {f.path: os.path.relpath(f.path, base) if base else f.path for f in new}
+    counts = read_key_counts(filesystem, counts_path) if counts_path is not None else KeyCounts()
+
+    counted = [f for f in new if names[f.path] in counts.files]
+    uncounted = [f for f in new if names[f.path] not in counts.files]
+    unique_keys = sum(f.rows for f in compacted) + sum(counts.files[names[f.path]] for f in counted)
+    if not uncounted:
+        return unique_keys, 0
+
+    file_keys = [
+        pc.unique(pq.read_table(f.path, columns=["key"], filesystem=filesystem)["key"].combine_chunks())
+        for f in uncounted
+    ]
+    new_keys = pc.unique(pa.concat_arrays(file_keys))
+
+    values = new_keys.to_pylist()
+    buckets = {key_bucket(key) for key in values}
+    lowest, highest = (min(values), max(values)) if values else ("", "")
+    candidates = [
+        f.path
+        for f in [*compacted, *counted]
+        if (f.bucket is None or f.bucket in buckets)
+        and (f.key_min is None or f.key_max is None or (f.key_min <= highest and f.key_max >= lowest))
+    ]
+
+    seen = pa.array([], pa.string())
+    if candidates:
+        dataset = ds.dataset(candidates, filesystem=filesystem, format="parquet")
+        seen = pc.unique(
+            dataset.to_table(columns=["key"], filter=ds.field("key").isin(new_keys))["key"].combine_chunks()
+        )
+
+    # in the order the files were written, each is credited with the keys no earlier file holds
+    for f, keys in zip(uncounted, file_keys, strict=True):
+        added = keys.filter(pc.invert(pc.is_in(keys, value_set=seen)))
+        counts.files[names[f.path]] = len(added)
+        unique_keys += len(added)
+        seen = pa.concat_arrays([seen, added])
+
+    if counts_path is not None:
+        # files of the generation that are gone, e.g. deleted by hand, are dropped with their counts
+        write_key_counts(
+            filesystem, counts_path, KeyCounts(files={names[f.path]: counts.files[names[f.path]] for f in new})
+        )
+
+    return unique_keys, len(uncounted)
+
+
+def read_partition_stats(
+    dataset_path: str, model_id: str, filesystem: Optional[pafs.FileSystem] = None
+) -> PartitionStats:
+    """Statistics of a model's partition of the predictions dataset, from Parquet footers
+
+    Args:
+        dataset_path (str): root of the predictions dataset, an s3:// URI or a local directory
+        model_id (str): ID of the model
+        filesystem (Optional[pafs.FileSystem]): filesystem of the path, inferred from the path if not given
+
+    Returns:
+        PartitionStats: number of files, rows, bytes and distinct keys, key range and last modification time
+    """
+    if filesystem is None:
+        filesystem, dataset_path = pafs.FileSystem.from_uri(dataset_path)
+
+    partition_path = f"{dataset_path.rstrip('/')}/model_id={model_id}"
+    generation = current_path(filesystem, partition_path)
+    infos = list_data_files(filesystem, generation)
+    if not infos:
+        return PartitionStats(model_id=model_id)
+
+    # footers are a few ranged reads each, so most of the time is latency
+    with ThreadPoolExecutor(max_workers=FOOTER_READERS) as executor:
+        files = list(executor.map(lambda info: read_file_stats(filesystem, info), infos))
+
+    unique_keys, new_files = count_unique_keys(filesystem, files, f"{generation}/{KEY_COUNTS_FILE}")
+    key_mins = [f.key_min for f in files if f.key_min is not None]
+    key_maxes = [f.key_max for f in files if f.key_max is not None]
+
+    return PartitionStats(
+        model_id=model_id,
+        files=len(files),
+        rows=sum(f.rows for f in files),
+        bytes=sum(f.bytes for f in files),
+        unique_keys=unique_keys,
+        key_min=min(key_mins) if key_mins else None,
+        key_max=max(key_maxes) if key_maxes else None,
+        last_modified=max(f.modified for f in files),
+        new_files=new_files,
+    )
+
+
+def get_metadata(
+    bucket: str,
+    metadata_key: str,
+    s3_uri: str,
+    model_id: str,
+    pipeline_start: int,
+    pipeline_end: int,
+    prediction_table: Optional[str] = None,
+    filesystem: Optional[pafs.FileSystem] = None,
+) -> Metadata:
+    """Metadata of a model's latest pipeline run and of its predictions in the data lake
+
+    Args:
+        bucket (str): precalcs bucket
+        metadata_key (str): key the metadata is written to, logged for reference
+        s3_uri (str): URI of the metadata, stored in the metadata
+        model_id (str): ID of the model
+        pipeline_start (int): unix time the pipeline run started
+        pipeline_end (int): unix time the pipeline run ended
+        prediction_table (Optional[str]): prefix of the predictions dataset in the bucket, ATHENA_PREDICTION_TABLE
+            or "predictions" by default
+        filesystem (Optional[pafs.FileSystem]): filesystem the bucket is read with, S3 by default
+
+    Returns:
+        Metadata: metadata of the model
+    """
+    prediction_table = prediction_table or os.getenv("ATHENA_PREDICTION_TABLE", "predictions")
+    dataset_path = f"{bucket}/{prediction_table}" if filesystem is not None else f"s3://{bucket}/{prediction_table}"
+
+    stats = read_partition_stats(dataset_path, model_id, filesystem=filesystem)
+    logger.info(f"Partition of {model_id} for {metadata_key}: {stats.model_dump_json()}")
+
+    return Metadata(
+        model_id=model_id,
+        preds_in_store=stats.unique_keys > 0,
+        total_unique_preds=stats.unique_keys,
+        preds_last_updated=stats.last_modified,
+        pipeline_latest_start_time=pipeline_start,
+        pipeline_latest_duration=pipeline_end - pipeline_start,
+        pipeline_meta_s3_uri=s3_uri,
+        total_rows=stats.rows,
+        total_files=stats.files,
+        total_bytes=stats.bytes,
+    )
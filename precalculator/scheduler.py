@@ -0,0 +1,316 @@
+import fcntl
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+from botocore.exceptions import ClientError
+from pydantic import BaseModel
+
+DEFAULT_UNIT_SIZE = 10000
+DEFAULT_LEASE_SECONDS = 600
+DEFAULT_POLL_SECONDS = 60  # wait between claims while the remaining units are leased by other workers
+RENEWALS_PER_LEASE = 4  # a held lease is renewed this many times per lease duration
+MANIFEST_KEY = "manifest.json"
+
+
+class WorkUnit(BaseModel):
+    """Contiguous range of input rows [start_row, end_row) processed as one piece of work"""
+
+    unit_id: str
+    start_row: int
+    end_row: int
+
+
+class Manifest(BaseModel):
+    """All work units of a run"""
+
+    total_rows: int
+    unit_size: int
+    units: list[WorkUnit]
+
+
+class Lease(BaseModel):
+    """Claim of a work unit by a worker, valid until `expires_at` unless the unit is done"""
+
+    unit_id: str
+    worker_id: str
+    expires_at: float
+    done: bool = False
+
+
+def build_manifest(total_rows: int, unit_size: int = DEFAULT_UNIT_SIZE) -> Manifest:
+    """Split `total_rows` input rows into units of at most `unit_size` rows, covering every row exactly once"""
+    units = [
+        WorkUnit(unit_id=f"unit_{i:05d}", start_row=start_row, end_row=min(start_row + unit_size, total_rows))
+        for i, start_row in enumerate(range(0, total_rows, unit_size))
+    ]
+    return Manifest(total_rows=total_rows, unit_size=unit_size, units=units)
+
+
+class LeaseStore(ABC):
+    """Key-value store with atomic create-if-absent and compare-and-swap, used to coordinate workers"""
+
+    @abstractmethod
+    def create(self, key: str, body: bytes) -> Optional[str]:
+        """Write `body` under `key` only if the key does not exist yet. Returns the new version, or None."""
+
+    @abstractmethod
+    def read(self, key: str) -> Optional[tuple[bytes, str]]:
+        """Body and version of `key`, or None if it does not exist"""
+
+    @abstractmethod
+    def replace(self, key: str, body: bytes, version: str) -> Optional[str]:
+        """Overwrite `key` only if it is still at `version`. Returns the new version, or None."""
+
+
+class LocalLeaseStore(LeaseStore):
+    def __init__(self, root: str):
+        """Lease store in a local directory, safe to share between processes on the same machine
+
+        Args:
+            root (str): directory holding one file per key
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    @contextmanager
+    def _lock(self) -> Iterator[None]:
+        with open(os.path.join(self.root, ".lock"), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def _read(self, key: str) -> Optional[tuple[bytes, str]]:
+        try:
+            with open(self._path(key), "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        return body, hashlib.md5(body).hexdigest()
+
+    def _write(self, key: str, body: bytes) -> str:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+        return hashlib.md5(body).hexdigest()
+
+    def create(self, key: str, body: bytes) -> Optional[str]:
+        with self._lock():
+            if os.path.exists(self._path(key)):
+                return None
+            return self._write(key, body)
+
+    def read(self, key: str) -> Optional[tuple[bytes, str]]:
+        return self._read(key)
+
+    def replace(self, key: str, body: bytes, version: str) -> Optional[str]:
+        with self._lock():
+            current = self._read(key)
+            if current is None or current[1] != version:
+                return None
+            return self._write(key, body)
+
+
+class S3LeaseStore(LeaseStore):
+    def __init__(self, s3: Any, bucket: str, prefix: str):  # noqa: ANN401
+        """Lease store in an S3 prefix, using conditional writes (If-None-Match / If-Match) for atomicity
+
+        Args:
+            s3 (Any): boto3 S3 client
+            bucket (str): bucket name
+            prefix (str): key prefix under which leases are stored
+        """
+        self.s3 = s3
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}"
+
+    @staticmethod
+    def _is_conflict(e: ClientError) -> bool:
+        return e.response["Error"]["Code"] in ("PreconditionFailed", "ConditionalRequestConflict", "412", "409")
+
+    def create(self, key: str, body: bytes) -> Optional[str]:
+        try:
+            response = self.s3.put_object(Bucket=self.bucket, Key=self._key(key), Body=body, IfNoneMatch="*")
+        except ClientError as e:
+            if self._is_conflict(e):
+                return None
+            raise
+        return response["ETag"]
+
+    def read(self, key: str) -> Optional[tuple[bytes, str]]:
+        try:
+            response = self.s3.get_object(Bucket=self.bucket, Key=self._key(key))
+        except self.s3.exceptions.NoSuchKey:
+            return None
+        return response["Body"].read(), response["ETag"]
+
+    def replace(self, key: str, body: bytes, version: str) -> Optional[str]:
+        try:
+            response = self.s3.put_object(Bucket=self.bucket, Key=self._key(key), Body=body, IfMatch=version)
+        except ClientError as e:
+            if self._is_conflict(e):
+                return None
+            raise
+        return response["ETag"]
+
+
+class WorkScheduler:
+    def __init__(
+        self,
+        store: LeaseStore,
+        manifest: Manifest,
+        worker_id: str,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        poll_seconds: float = DEFAULT_POLL_SECONDS,
+    ):
+        """Hands out work units to competing workers through leases in a shared store.
+
+        Workers keep claiming units until every unit is done, so fast workers take over the remaining work of slow
+        ones. A unit whose lease expired without being completed (e.g. its worker died) is claimed again, so workers
+        left without units wait for the leases of the others rather than exit.
+
+        Args:
+            store (LeaseStore): shared store for the manifest and leases
+            manifest (Manifest): manifest to publish if no other worker has published one yet
+            worker_id (str): unique ID of this worker
+            lease_seconds (float): how long a claimed unit is reserved without being renewed (see `hold`)
+            poll_seconds (float): wait between claims while all remaining units are leased by other workers
+        """
+        self.store = store
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+
+        self.logger = logging.getLogger("WorkScheduler")
+        self.logger.setLevel(logging.INFO)
+
+        # the first worker to publish the manifest wins, so every worker uses the same units
+        store.create(MANIFEST_KEY, manifest.model_dump_json().encode("utf-8"))
+        published = store.read(MANIFEST_KEY)
+        self.manifest = Manifest.model_validate_json(published[0]) if published else manifest
+
+        self._versions: dict[str, str] = {}
+        self._leased_elsewhere = False  # whether the last claim found units leased by other workers
+
+    def _lease_key(self, unit: WorkUnit) -> str:
+        return f"leases/{unit.unit_id}.json"
+
+    def _new_lease(self, unit: WorkUnit, done: bool = False) -> bytes:
+        lease = Lease(
+            unit_id=unit.unit_id, worker_id=self.worker_id, expires_at=time.time() + self.lease_seconds, done=done
+        )
+        return lease.model_dump_json().encode("utf-8")
+
+    def _try_claim(self, unit: WorkUnit) -> Optional[str]:
+        key = self._lease_key(unit)
+        current = self.store.read(key)
+
+        if current is None:
+            return self.store.create(key, self._new_lease(unit))
+
+        lease = Lease.model_validate_json(current[0])
+        if lease.done:
+            return None
+        if lease.expires_at > time.time():
+            self._leased_elsewhere = True
+            return None
+
+        self.logger.info(f"Re-claiming {unit.unit_id} from {lease.worker_id}, whose lease expired")
+        return self.store.replace(key, self._new_lease(unit), current[1])
+
+    def claim(self) -> Optional[WorkUnit]:
+        """Claim the next available unit, or return None once every unit is done or leased by a live worker"""
+        units = self.manifest.units
+        self._leased_elsewhere = False
+        if not units:
+            return None
+
+        # start at a random unit so that workers don't all contend for the same leases
+        offset = random.randrange(len(units))
+        for unit in units[offset:] + units[:offset]:
+            version = self._try_claim(unit)
+            if version is not None:
+                self._versions[unit.unit_id] = version
+                return unit
+
+        return None
+
+    def renew(self, unit: WorkUnit) -> bool:
+        """Extend the lease of a claimed unit. Returns False if the lease was lost to another worker."""
+        version = self._versions.get(unit.unit_id)
+        if version is None:
+            return False
+
+        version = self.store.replace(self._lease_key(unit), self._new_lease(unit), version)
+        if version is None:
+            self._versions.pop(unit.unit_id, None)
+            return False
+
+        self._versions[unit.unit_id] = version
+        return True
+
+    @contextmanager
+    def hold(self, unit: WorkUnit) -> Iterator[None]:
+        """Renew the lease of a claimed unit in the background while the enclosed code processes it.
+
+        A unit can then take longer than `lease_seconds` without another worker claiming it, while the lease of a
+        worker that died still expires within `lease_seconds`.
+        """
+        stop = threading.Event()
+
+        def keep_alive() -> None:
+            while not stop.wait(self.lease_seconds / RENEWALS_PER_LEASE):
+                try:
+                    if not self.renew(unit):
+                        self.logger.warning(f"Lost the lease of {unit.unit_id}, another worker may process it too")
+                        return
+                except Exception as e:
+                    # the lease is still valid for a while, so the next renewal may succeed
+                    self.logger.warning(f"Failed to renew the lease of {unit.unit_id}: {e}")
+
+        thread = threading.Thread(target=keep_alive, name=f"lease-{unit.unit_id}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, unit: WorkUnit) -> bool:
+        """Mark a claimed unit as done. Returns False if the lease was lost to another worker in the meantime."""
+        version = self._versions.pop(unit.unit_id, None)
+        if version is None:
+            return False
+        return self.store.replace(self._lease_key(unit), self._new_lease(unit, done=True), version) is not None
+
+    def __iter__(self) -> Iterator[WorkUnit]:
+        """Claim units one at a time until every unit is done; the caller must call `complete` after each one.
+
+        While the only units left are leased by other workers, waits `poll_seconds` between claims: those leases
+        are either completed or expire and are claimed here.
+        """
+        while True:
+            unit = self.claim()
+            if unit is not None:
+                yield unit
+            elif self._leased_elsewhere:
+                time.sleep(self.poll_seconds * random.uniform(0.5, 1.5))
+            else:
+                return
@@ -0,0 +1,116 @@
+from typing import Callable, Optional
+
+from pydantic import BaseModel
+
+DEFAULT_STRIDE = 1000
+
+RangeFetcher = Callable[[int, int], bytes]
+
+
+class RowIndex(BaseModel):
+    """Byte offsets of every `stride`-th data row of a line-delimited CSV file"""
+
+    header_length: int  # size in bytes of the header line, including its newline
+    total_rows: int  # number of data rows, excluding the header
+    stride: int
+    offsets: list[int]  # offsets[i] is the byte offset of data row i * stride
+    file_size: int
+    etag: Optional[str] = None  # ETag of the indexed file in S3, recorded if it was uploaded before the index
+
+    def matches(self, size: int, etag: Optional[str] = None) -> bool:
+        """Whether the index describes a file of this size and, where both are known, this ETag"""
+        if size != self.file_size:
+            return False
+        return self.etag is None or etag is None or etag == self.etag
+
+    def byte_range(self, start_row: int, end_row: int) -> tuple[int, int]:
+        """Smallest indexed byte range [first, last) containing data rows [start_row, end_row)"""
+        first = self.offsets[start_row // self.stride]
+
+        end_block = -(-end_row // self.stride)
+        last = self.offsets[end_block] if end_block < len(self.offsets) else self.file_size
+
+        return first, last
+
+
+def shard_bounds(total_rows: int, denominator: int, numerator: int) -> tuple[int, int]:
+    """Row range [start, end) for a worker such that all workers together cover every row exactly once.
+
+    Remainder rows are spread over the workers, so shard sizes differ by at most one row.
+
+    Args:
+        total_rows (int): number of data rows in the input
+        denominator (int): total number of workers
+        numerator (int): 1-based number assigned to this worker
+
+    Returns:
+        tuple[int, int]: start (inclusive) and end (exclusive) row
+    """
+    if not 1 <= numerator <= denominator:
+        raise ValueError(f"Worker numerator must be between 1 and {denominator}, got {numerator}")
+
+    start_row = (numerator - 1) * total_rows // denominator
+    end_row = numerator * total_rows // denominator
+
+    return start_row, end_row
+
+
+def build_row_index(path: str, stride: int = DEFAULT_STRIDE) -> RowIndex:
+    """Scan a local CSV file once and record the byte offset of every `stride`-th data row
+
+    Args:
+        path (str): location of CSV file with a header line and one record per line
+        stride (int): number of rows between indexed offsets
+
+    Returns:
+        RowIndex: index that can be used to read any row range with a single byte-range request
+    """
+    offsets = []
+    total_rows = 0
+
+    with open(path, "rb") as f:
+        header_length = len(f.readline())
+        position = header_length
+
+        for line in f:
+            if not line.strip():
+                position += len(line)
+                continue
+            if total_rows % stride == 0:
+                offsets.append(position)
+            total_rows += 1
+            position += len(line)
+
+    return RowIndex(
+        header_length=header_length, total_rows=total_rows, stride=stride, offsets=offsets, file_size=position
+    )
+
+
+def read_shard(index: RowIndex, fetch_range: RangeFetcher, start_row: int, end_row: int) -> bytes:
+    """Read the header and data rows [start_row, end_row) of an indexed CSV file
+
+    Args:
+        index (RowIndex): row index of the file
+        fetch_range (RangeFetcher): callable returning the bytes [first, last) of the file
+        start_row (int): first row to read
+        end_row (int): row to stop at (exclusive)
+
+    Returns:
+        bytes: CSV content with the header followed by the requested rows
+    """
+    header = fetch_range(0, index.header_length)
+    if not header.endswith(b"\n"):
+        header += b"\n"
+
+    if start_row >= end_row:
+        return header
+
+    first, last = index.byte_range(start_row, end_row)
+    lines = [line for line in fetch_range(first, last).splitlines(keepends=True) if line.strip()]
+
+    skip = start_row - (start_row // index.stride) * index.stride
+    rows = lines[skip : skip + end_row - start_row]
+    if rows and not rows[-1].endswith(b"\n"):
+        rows[-1] += b"\n"
+
+    return header + b"".join(rows)
@@ -0,0 +1,27 @@
+import logging
+from typing import Any, Optional
+
+import boto3
+
+from precalculator.models import Metadata
+
+logger = logging.getLogger("Metadata")
+logger.setLevel(logging.INFO)
+
+
+def write_metadata(
+    bucket: str, metadata_key: str, metadata: Metadata, s3: Optional[Any] = None  # noqa: ANN401
+) -> None:
+    """Write a model's metadata as JSON to the precalcs bucket
+
+    Args:
+        bucket (str): precalcs bucket
+        metadata_key (str): key of the metadata, e.g. meta/eos3b5e.json
+        metadata (Metadata): metadata of the model
+        s3: boto3 S3 client, a new one if not given
+    """
+    s3 = s3 if s3 is not None else boto3.client("s3")
+    s3.put_object(
+        Bucket=bucket, Key=metadata_key, Body=metadata.model_dump_json().encode("utf-8"), ContentType="application/json"
+    )
+    logger.info(f"Written metadata of {metadata.model_id} to s3://{bucket}/{metadata_key}")
@@ -2,32 +2,164 @@
 import ast
 import logging
 import os
+import shlex
 import subprocess
 import sys
+import time
+import uuid
+from typing import Iterator, Optional
 
 import awswrangler as wr
 import boto3
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
 
 from config.app import DataLakeConfig, WorkerConfig
-from precalculator.models import (
-    Prediction,
-    validate_dataframe_schema,
+from precalculator.autotune import DEFAULT_BATCH_SIZE, BatchSizeTuner, TuningResult
+from precalculator.catalog import register_partitions
+from precalculator.checkpoint import CheckpointTracker, hash_file
+from precalculator.dataset import OUTPUT_TEXT_TYPE, OUTPUT_TYPE, bucket_keys, open_model_partition
+from precalculator.generations import (
+    POINTER_FILE,
+    GenerationPointer,
+    generation_path,
+    next_sequence,
+    read_generation,
+    sequence_prefix,
 )
+from precalculator.instrumentation import Instrumentation, WorkerRecord, run_records_prefix
+from precalculator.layout import KEY_BUCKET_COLUMN
+from precalculator.membership import MEMBERSHIP_FILE, BloomFilter
+from precalculator.models import validate_predictions
+from precalculator.parallel import count_rows, merge_csvs, plan_processes, run_processes, split_csv
+from precalculator.pipeline import run_pipelined
+from precalculator.profiling import Profiler
+from precalculator.scheduler import LeaseStore, LocalLeaseStore, S3LeaseStore, WorkScheduler, WorkUnit, build_manifest
+from precalculator.shards import RowIndex, build_row_index, read_shard, shard_bounds
 
 INPUT_NAME = "reference_library"
 INPUT_FILE_NAME = f"{INPUT_NAME}.csv"
+INDEX_SUFFIX = ".index.json"
 PROCESSED_FILE_NAME = "input.csv"
 OUTPUT_FILE_NAME = "output.csv"
+CHUNK_DIR = "chunks"
+ERSILIA = ".venv/bin/ersilia"
+SERVE_PORT = 3000  # port of the first model instance served by predict_parallel, the others follow it
+TUNING_SAMPLE_ROWS = 2000
+ARROW_STRING = pd.ArrowDtype(pa.string())
+
+
+def to_prediction_frame(df: pd.DataFrame, model_id: str) -> pd.DataFrame:
+    """Convert an Ersilia output frame to the predictions table layout.
+
+    Numeric model output columns are packed into a single `output` column of type map<string, double> keyed by the
+    output column name, so values keep their numeric type in Parquet and can be queried in Athena with
+    `output['<name>']`. Any other output columns, e.g. class labels, are kept as text in `output_text`, of type
+    map<string, string>. The maps are assembled from flat Arrow arrays, with no per-row Python code.
+
+    `key` and `input` are Arrow-backed strings and `model_id` is categorical, so the frame holds about as many bytes
+    as its Parquet data rather than a Python object per value.
+
+    Args:
+        df (pd.DataFrame): Ersilia output with `key`, `input` and one column per model output
+        model_id (str): ID of the model that produced the outputs
+
+    Returns:
+        pd.DataFrame: frame with columns key, input, output, output_text and model_id
+    """
+    output_cols = [c for c in df.columns if c not in ("key", "input")]
+    n_rows = len(df)
+
+    # columns that are empty throughout are read as nulls by the pyarrow CSV reader
+    numeric = [c for c in output_cols if pd.api.types.is_numeric_dtype(df[c]) or df[c].isna().all()]
+    text = [c for c in output_cols if c not in numeric]
+
+    values = df[numeric].to_numpy(dtype="float64", na_value=np.nan)
+    output = _output_map(numeric, pa.array(values.ravel(), pa.float64(), from_pandas=True), n_rows, OUTPUT_TYPE)
+
+    # text columns are concatenated one after the other, then taken row by row
+    strings = pa.concat_arrays([_flat_array(df[c]).cast(pa.string()) for c in text] or [pa.array([], pa.string())])
+    order = (np.arange(len(text)) * n_rows + np.arange(n_rows)[:, None]).ravel()
+    output_text = _output_map(text, strings.take(pa.array(order)), n_rows, OUTPUT_TEXT_TYPE)
+
+    return pd.DataFrame(
+        {
+            "key": _arrow_strings(df["key"]),
+            "input": _arrow_strings(df["input"]),
+            "output": pd.array(output, dtype=pd.ArrowDtype(OUTPUT_TYPE)),
+            "output_text": pd.array(output_text, dtype=pd.ArrowDtype(OUTPUT_TEXT_TYPE)),
+            "model_id": pd.Categorical.from_codes(np.zeros(n_rows, dtype=np.int8), categories=[model_id]),
+        },
+        index=pd.RangeIndex(n_rows),
+        copy=False,
+    )
+
+
+def _output_map(names: list[str], items: pa.Array, n_rows: int, map_type: pa.DataType) -> pa.MapArray:
+    # `items` holds the values of every row in turn, one per name
+    n_cols = len(names)
+    offsets = pa.array(np.arange(n_rows + 1, dtype=np.int32) * n_cols)
+    keys = pa.array(names, pa.string()).take(pa.array(np.tile(np.arange(n_cols), n_rows)))
+    return pa.MapArray.from_arrays(offsets, keys, items, type=map_type)
+
+
+def _flat_array(column: pd.Series) -> pa.Array:
+    array = pa.array(column, from_pandas=True)
+    return array.combine_chunks() if isinstance(array, pa.ChunkedArray) else array
+
+
+def _arrow_strings(column: pd.Series) -> pd.Series:
+    if column.dtype == ARROW_STRING:
+        return column.reset_index(drop=True)
+    array = pa.array(column, from_pandas=True)
+    return pd.Series(pd.array(array.cast(pa.string()), dtype=ARROW_STRING), copy=False)
 
 
 class PredictionWriter:
-    def __init__(self, data_config: DataLakeConfig, worker_config: WorkerConfig, model_id: str, dev: bool):
+    def __init__(
+        self,
+        data_config: DataLakeConfig,
+        worker_config: WorkerConfig,
+        model_id: str,
+        dev: bool,
+        profile_dir: Optional[str] = None,
+        dataset_path: Optional[str] = None,
+    ):
         self.data_config = data_config
         self.worker_config = worker_config
         self.model_id = model_id
-        self.s3 = boto3.client("s3")
+        # root of the predictions dataset written by write_to_lake. A local directory is written with pyarrow and
+        # registers no Glue partitions, so that the write path runs offline, e.g. in the benchmarks.
+        self.dataset_path = dataset_path or os.path.join(
+            "s3://", data_config.s3_bucket_name, data_config.athena_prediction_table
+        )
+        self._local_dataset = not self.dataset_path.startswith("s3://")
+        self.instrumentation = Instrumentation(
+            model_id,
+            f"worker-{worker_config.numerator}",
+            worker_config.run_id or worker_config.git_sha,
+            worker_config.git_sha,
+            profiler=Profiler(profile_dir, server_pattern=model_id) if profile_dir else None,
+        )
+        # S3 transfers of every client created from the session, including awswrangler's, are counted
+        self.session = boto3.Session()
+        self.instrumentation.transfers.register(self.session.events)
+        self.s3 = self.session.client("s3")
         self.dev = dev
+        self.batch_size = worker_config.batch_size or DEFAULT_BATCH_SIZE
+        self.instrumentation.record.batch_size = self.batch_size
+        self._fetched = False
+        self._served = False
+        self._membership: Optional[BloomFilter] = None
+        self._membership_loaded = False
+        self._existing_inputs: Optional[pd.Index] = None
+        self._input_index: Optional[RowIndex] = None
+        self._input_etag: Optional[str] = None
+        self._local_input = False
+        self._shard_id = f"{worker_config.sample or 'full'}-{worker_config.numerator}-of-{worker_config.denominator}"
 
         self.logger = logging.getLogger("PredictionWriter")
         self.logger.setLevel(logging.INFO)
@@ -40,28 +172,191 @@ class PredictionWriter:
     #     self.s3.put_object(Bucket=bucket, Key=metadata_key, Body=json.dumps(metadata.model_dump_json()))
 
     def fetch(self) -> str:
-        """Fetch and split inputs for this worker, ready to pass to Ersilia CLI"""
+        """Fetch and split inputs for this worker, ready to pass to Ersilia CLI.
+
+        If a row index has been published next to the input file (see scripts/build_row_index.py), only the
+        byte range holding this worker's rows is downloaded. Otherwise the whole file is downloaded and split.
+        """
         logger = self.logger
 
-        if self.worker_config.sample:
-            input_filename = f"{INPUT_NAME}_{self.worker_config.sample}.csv"
-        else:
-            input_filename = INPUT_FILE_NAME
+        with self.instrumentation.stage("fetch") as stage:
+            input_filename = self._get_input_filename()
+            index = self._get_row_index(input_filename)
+
+            if index is None:
+                logger.info(f"No usable row index for {input_filename}, downloading the whole file")
+
+                self.s3.download_file(
+                    self.data_config.s3_bucket_name,
+                    input_filename,
+                    INPUT_FILE_NAME,
+                )
+
+                logger.info(f"Downloaded {input_filename} from S3")
+
+                partition_metadata = self._split_csv()
+            else:
+                self._input_index = index
+                partition_metadata = self._read_shard(index)
+
+                logger.info(f"Read shard of {input_filename} from S3 using its row index")
+
+            logger.info(f"Partitioned rows {partition_metadata[0]} to {partition_metadata[1]}")
+            stage.rows = partition_metadata[1] - partition_metadata[0]
+
+        return PROCESSED_FILE_NAME
+
+    def write_instrumentation(self) -> WorkerRecord:
+        """Write this worker's per-stage timings, throughput, memory and transfers next to the other workers' records.
+
+        Also logged as a single JSON line, so it can be read from the job's logs if the upload fails.
+        """
+        record = self.instrumentation.finish()
+        self.logger.info(f"Worker record: {record.model_dump_json()}")
+
+        prefix = run_records_prefix(self.data_config.s3_meta_prefix, self.model_id, record.run_id)
+        self.s3.put_object(
+            Bucket=self.data_config.s3_bucket_name,
+            Key=f"{prefix}{record.worker_id}.json",
+            Body=record.model_dump_json().encode("utf-8"),
+        )
+
+        return record
+
+    def get_scheduler(self) -> WorkScheduler:
+        """Scheduler handing out work units of the input to this worker and its peers.
+
+        Units are claimed through leases stored under the model's metadata prefix, keyed by the run ID, so all
+        workers of a run share the same units and a re-run of failed jobs only processes unfinished units.
+        """
+        index = self._get_input_index()
 
-        self.s3.download_file(
+        run_id = self.worker_config.run_id or self.worker_config.git_sha
+        store = S3LeaseStore(
+            self.s3,
             self.data_config.s3_bucket_name,
-            input_filename,
-            INPUT_FILE_NAME,
+            f"{self.data_config.s3_meta_prefix}/{self.model_id}/schedule/{run_id}",
         )
+        worker_id = f"worker-{self.worker_config.numerator}-{uuid.uuid4().hex[:8]}"
 
-        logger.info(f"Downloaded {input_filename} from S3")
+        return WorkScheduler(
+            store,
+            build_manifest(index.total_rows, self.worker_config.unit_size),
+            worker_id,
+            lease_seconds=self.worker_config.lease_seconds,
+        )
 
-        partition_metadata = self._split_csv()
+    def fetch_unit(self, unit: WorkUnit) -> str:
+        """Fetch the input rows of a work unit, ready to pass to Ersilia CLI"""
+        with self.instrumentation.stage("fetch") as stage:
+            index = self._get_input_index()
+            self._write_rows(index, unit.start_row, unit.end_row)
+            stage.rows = unit.end_row - unit.start_row
+        self._shard_id = f"{self.worker_config.sample or 'full'}-{unit.unit_id}"
 
-        logger.info(f"Partitioned rows {partition_metadata[0]} to {partition_metadata[1]}")
+        self.logger.info(f"Fetched {unit.unit_id}: rows {unit.start_row} to {unit.end_row}")
 
         return PROCESSED_FILE_NAME
 
+    def filter_existing(self, input_file_path: str) -> int:
+        """Remove inputs that already have a prediction for this model in the data lake ("delta" mode).
+
+        Inputs that the partition's membership filter reports as absent are certainly new and are kept without
+        reading the partition, so units of a grown library's new rows cost nothing. The remaining inputs are
+        checked exactly against the `input` column of the partition, which is read at most once per worker and
+        reused for every unit it processes. Both are snapshots: rows written after they were read can only cause
+        inputs to be predicted again (and deduplicated by compaction), never to be skipped.
+
+        Args:
+            input_file_path (str): path to input CSV, which is overwritten with the remaining inputs
+
+        Returns:
+            int: number of inputs still to be predicted
+        """
+        logger = self.logger
+
+        with self.instrumentation.stage("filter_existing") as stage:
+            df = pd.read_csv(input_file_path)
+            inputs = df.iloc[:, 0]
+            n_inputs = len(df)
+
+            membership = self._get_membership()
+            if membership is None:
+                existing = np.ones(n_inputs, dtype=bool)
+            else:
+                existing = np.fromiter((value in membership for value in inputs), dtype=bool, count=n_inputs)
+
+            if existing.any():
+                existing[existing] = self._get_existing_inputs().get_indexer(inputs[existing]) != -1
+
+            df = df[~existing]
+            df.to_csv(input_file_path, index=False)
+            stage.rows = n_inputs
+
+        logger.info(f"{len(df)} inputs to predict after skipping {n_inputs - len(df)} inputs already in the lake")
+
+        return len(df)
+
+    def tune_batch_size(self, input_file_path: str, sample_rows: int = TUNING_SAMPLE_ROWS) -> int:
+        """Choose the Ersilia CLI batch size for this model.
+
+        A batch size tuned in a previous run of the model is reused if one has been stored. Otherwise a few batch
+        sizes are probed on the first `sample_rows` inputs of the shard, and the fastest one that stays under the
+        memory ceiling is chosen and stored with the model's run metadata.
+
+        Args:
+            input_file_path (str): path to input CSV
+            sample_rows (int): number of inputs to probe batch sizes on
+
+        Returns:
+            int: chosen batch size, which is also used by all subsequent model runs of this writer
+        """
+        logger = self.logger
+
+        tuning = self._read_tuning_result()
+
+        if tuning is None:
+            logger.info(f"Tuning batch size for model {self.model_id} on {sample_rows} inputs")
+
+            self._serve_model()
+
+            sample = pd.read_csv(input_file_path, nrows=sample_rows)
+            os.makedirs(CHUNK_DIR, exist_ok=True)
+            sample_input_path = os.path.join(CHUNK_DIR, f"tuning_{PROCESSED_FILE_NAME}")
+            sample_output_path = os.path.join(CHUNK_DIR, f"tuning_{OUTPUT_FILE_NAME}")
+            sample.to_csv(sample_input_path, index=False)
+
+            tuner = BatchSizeTuner(
+                lambda batch_size: self._ersilia_run_command(sample_input_path, sample_output_path, batch_size),
+                rows=len(sample),
+                server_pattern=self.model_id,
+            )
+            batch_size, probes = tuner.tune()
+
+            for probe in probes:
+                logger.info(
+                    f"Batch size {probe.batch_size}: {probe.rows_per_second:.1f} rows/s, "
+                    f"peak RSS {probe.peak_rss / 1024**2:.0f} MiB, return code {probe.returncode}"
+                )
+
+            tuning = TuningResult(
+                model_id=self.model_id,
+                batch_size=batch_size,
+                memory_ceiling=tuner.memory_ceiling,
+                tuned_at=int(time.time()),
+                probes=probes,
+            )
+            self._write_tuning_result(tuning)
+        else:
+            logger.info(f"Reusing batch size tuned at {tuning.tuned_at} for model {self.model_id}")
+
+        self.batch_size = tuning.batch_size
+        self.instrumentation.record.batch_size = self.batch_size
+
+        logger.info(f"Using batch size {self.batch_size}")
+
+        return self.batch_size
+
     def predict(self, input_file_path: str) -> str:
         """Calls Ersilia CLI to generate predictions for provided input CSV.
 
@@ -74,12 +369,118 @@ class PredictionWriter:
 
         logger.info(f"Calling Ersilia CLI for model {self.model_id}")
 
-        subprocess.run([".venv/bin/ersilia", "-v", "fetch", self.model_id, "--from_github"])  # type: ignore
-        subprocess.run([".venv/bin/ersilia", "-v", "serve", self.model_id, "--disable-local-cache"])  # type: ignore
-        subprocess.run([".venv/bin/ersilia", "-v", "run", "-i", input_file_path, "-o", OUTPUT_FILE_NAME, "--batch_size", str(1000)])
+        self._serve_model()
+        with self.instrumentation.stage("predict") as stage:
+            self._run_model(input_file_path, OUTPUT_FILE_NAME)
+            stage.rows = count_rows(input_file_path)
 
         return OUTPUT_FILE_NAME
 
+    def predict_parallel(self, input_file_path: str, max_processes: Optional[int] = None) -> str:
+        """Generate predictions with several instances of the model running at the same time.
+
+        The input is split into contiguous sub-shards, one per instance. Each instance is a model server of its own,
+        with an Ersilia CLI client sending it one sub-shard (see `_instance_command`). The number of instances is
+        sized from the CPU cores and the memory available on the worker. Outputs are merged back in input order.
+
+        Args:
+            input_file_path (str): path to input CSV
+            max_processes (Optional[int]): upper bound on the number of instances, defaults to the CPU count
+        """
+        logger = self.logger
+
+        n_rows = len(pd.read_csv(input_file_path))
+        processes = plan_processes(n_rows, max_processes)
+
+        logger.info(f"Calling Ersilia CLI for model {self.model_id} with {processes} model instances")
+
+        self._fetch_model()
+
+        parts = split_csv(input_file_path, processes, CHUNK_DIR)
+        output_paths = [f"{os.path.splitext(path)[0]}_{OUTPUT_FILE_NAME}" for path, _ in parts]
+
+        commands = [
+            self._instance_command(i, path, output_path)
+            for i, ((path, _), output_path) in enumerate(zip(parts, output_paths, strict=True))
+        ]
+        with self.instrumentation.stage("predict") as stage:
+            stats = run_processes(commands, [rows for _, rows in parts])
+            stage.rows = n_rows
+
+        for stat in stats:
+            logger.info(
+                f"Instance {stat.index}: {stat.rows} rows in {stat.seconds:.1f} s ({stat.rows_per_second:.1f} rows/s)"
+            )
+
+        failed = [stat.index for stat in stats if stat.returncode != 0]
+        if failed:
+            raise RuntimeError(f"Ersilia CLI failed for sub-shards {failed}")
+
+        merge_csvs(output_paths, OUTPUT_FILE_NAME)
+
+        total_seconds = max(stat.seconds for stat in stats)
+        logger.info(f"Predicted {n_rows} rows in {total_seconds:.1f} s ({n_rows / total_seconds:.1f} rows/s)")
+
+        return OUTPUT_FILE_NAME
+
+    def predict_pipelined(self, input_file_path: str, chunk_size: int, queue_depth: int = 2) -> int:
+        """Generate predictions chunk by chunk, postprocessing and uploading finished chunks in the background.
+
+        The model runs on the next chunk while the previous chunk's outputs are written to the data lake, so the CPU
+        and the network are busy at the same time. At most `queue_depth` finished chunks wait for upload.
+
+        Each chunk written to the data lake is recorded in a checkpoint keyed by model, shard and git SHA. If the
+        worker is re-run after being interrupted, chunks recorded in the checkpoint are skipped.
+
+        Args:
+            input_file_path (str): path to input CSV
+            chunk_size (int): number of inputs per chunk passed to the Ersilia CLI
+            queue_depth (int): maximum number of finished chunks waiting to be uploaded
+
+        Returns:
+            int: number of chunks written to the data lake
+        """
+        logger = self.logger
+
+        logger.info(f"Calling Ersilia CLI for model {self.model_id} in chunks of {chunk_size} inputs")
+
+        checkpoint = self._get_checkpoint_tracker(input_file_path, chunk_size)
+
+        self._serve_model()
+        os.makedirs(CHUNK_DIR, exist_ok=True)
+
+        def chunks() -> Iterator[tuple[str, pd.DataFrame]]:
+            for i, chunk in enumerate(pd.read_csv(input_file_path, chunksize=chunk_size)):
+                chunk_id = f"chunk_{i:05d}"
+                if checkpoint.is_done(chunk_id):
+                    logger.info(f"Skipping {chunk_id}, already in the data lake")
+                    continue
+                yield chunk_id, chunk
+
+        def run_chunk(item: tuple[str, pd.DataFrame]) -> tuple[str, str]:
+            chunk_id, chunk = item
+            chunk_input_path = os.path.join(CHUNK_DIR, f"{chunk_id}_{PROCESSED_FILE_NAME}")
+            chunk_output_path = os.path.join(CHUNK_DIR, f"{chunk_id}_{OUTPUT_FILE_NAME}")
+
+            chunk.to_csv(chunk_input_path, index=False)
+            with self.instrumentation.stage("predict") as stage:
+                self._run_model(chunk_input_path, chunk_output_path)
+                stage.rows = len(chunk)
+            os.remove(chunk_input_path)
+
+            return chunk_id, chunk_output_path
+
+        def upload_chunk(result: tuple[str, str]) -> None:
+            chunk_id, chunk_output_path = result
+
+            self.write_to_lake(self.postprocess(chunk_output_path))
+            checkpoint.mark_done(chunk_id)
+            os.remove(chunk_output_path)
+
+            logger.info(f"Wrote {chunk_id} to the data lake")
+
+        return run_pipelined(chunks(), run_chunk, upload_chunk, queue_depth=queue_depth)
+
     def postprocess(self, ersilia_output_path: str) -> pd.DataFrame:
         """Postprocessing for output file from Ersilia CLI
 
@@ -92,41 +493,337 @@ class PredictionWriter:
         logger = self.logger
         logger.info("Postprocessing outputs from Ersilia model")
 
-        df = pd.read_csv(ersilia_output_path)
+        with self.instrumentation.stage("postprocess") as stage:
+            # read straight into Arrow memory, without a Python object per string
+            df = pd.read_csv(ersilia_output_path, engine="pyarrow", dtype_backend="pyarrow")
+            predictions = to_prediction_frame(df, self.model_id)
+            stage.rows = len(predictions)
+
+        return predictions
 
-        output_cols = [c for c in df.columns if c not in ("key", "input")]
+    def write_to_lake(self, outputs: pd.DataFrame) -> None:
+        """Append predictions to the data lake, partitioned by model and by the leading characters of the key
+
+        The files are written to the current generation of the model's partition (see precalculator.generations),
+        named after the next number of the model's sequence, so that compaction prefers them over earlier writes.
+
+        Raises:
+            SchemaValidationError: if the predictions don't match `Prediction`, in which case nothing is written
+        """
+        with self.instrumentation.stage("validate") as stage:
+            validate_predictions(outputs, self.model_id)
+            stage.rows = len(outputs)
+
+        with self.instrumentation.stage("write_to_lake") as stage:
+            partition_path = self._get_partition_path()
+            generation = self._read_generation()
+            sequence = next_sequence(self._get_sequence_store())
+
+            # a shallow copy: the caller's frame is left as is, without copying its columns
+            outputs = outputs.copy(deep=False)
+            del outputs["model_id"]  # the partition column, not stored in the files
+            outputs[KEY_BUCKET_COLUMN] = pd.Series(
+                pd.array(bucket_keys(_flat_array(outputs["key"])), dtype=ARROW_STRING), index=outputs.index, copy=False
+            )
+            paths, buckets = self._write_files(outputs, generation_path(partition_path, generation), sequence)
+            self._register_partitions(generation, buckets)
+
+            current = self._read_generation()
+            if current != generation:
+                # a compaction switched generations during the write and may have copied the old one without it
+                self._copy_files(
+                    paths, generation_path(partition_path, generation), generation_path(partition_path, current)
+                )
+                self._register_partitions(current, buckets, replace=True)
+
+            # the membership filter no longer covers the partition; compaction writes a new one. It is deleted after
+            # writing, so that a filter written by a compaction that didn't see these files doesn't outlive them
+            self._delete_membership()
+            stage.rows = len(outputs)
+
+    def _write_files(self, outputs: pd.DataFrame, path: str, sequence: int) -> tuple[list[str], list[str]]:
+        """Write predictions into the key bucket directories of a generation, returning the files and buckets"""
+        if not self._local_dataset:
+            written = wr.s3.to_parquet(
+                df=outputs,
+                path=path,
+                dataset=True,
+                filename_prefix=sequence_prefix(sequence),
+                partition_cols=[KEY_BUCKET_COLUMN],
+                concurrent_partitioning=True,
+                boto3_session=self.session,
+            )
+            return written["paths"], sorted({values[0] for values in written["partitions_values"].values()})
+
+        paths = []
+        pq.write_to_dataset(
+            # without pandas metadata, like the files written by awswrangler
+            pa.Table.from_pandas(outputs, preserve_index=False).replace_schema_metadata(None),
+            path,
+            partition_cols=[KEY_BUCKET_COLUMN],
+            basename_template=f"{sequence_prefix(sequence)}{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            file_visitor=lambda written: paths.append(written.path),
+        )
+        return paths, sorted(outputs[KEY_BUCKET_COLUMN].unique())
+
+    def _copy_files(self, paths: list[str], source_path: str, target_path: str) -> None:
+        if not self._local_dataset:
+            wr.s3.copy_objects(paths, source_path=source_path, target_path=target_path, boto3_session=self.session)
+            return
+
+        filesystem = pafs.LocalFileSystem()
+        for path in paths:
+            target = os.path.join(target_path, os.path.relpath(path, source_path))
+            filesystem.create_dir(os.path.dirname(target))
+            filesystem.copy_file(path, target)
+
+    def _delete_membership(self) -> None:
+        path = os.path.join(self._get_partition_path(), MEMBERSHIP_FILE)
+        if not self._local_dataset:
+            wr.s3.delete_objects(path, boto3_session=self.session)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def _read_generation(self) -> int:
+        if self._local_dataset:
+            return read_generation(pafs.LocalFileSystem(), self._get_partition_path())
+
+        key = f"{self.data_config.athena_prediction_table}/model_id={self.model_id}/{POINTER_FILE}"
+        try:
+            response = self.s3.get_object(Bucket=self.data_config.s3_bucket_name, Key=key)
+        except self.s3.exceptions.NoSuchKey:
+            return 0
+
+        return GenerationPointer.model_validate_json(response["Body"].read()).generation
+
+    def _get_sequence_store(self) -> LeaseStore:
+        if self._local_dataset:
+            # hidden from readers of the dataset by the leading underscore
+            return LocalLeaseStore(
+                os.path.join(self.dataset_path, f"_{self.data_config.s3_meta_prefix}", self.model_id)
+            )
+
+        return S3LeaseStore(
+            self.s3, self.data_config.s3_bucket_name, f"{self.data_config.s3_meta_prefix}/{self.model_id}"
+        )
 
-        df["output"] = df[output_cols].apply(lambda row: ",".join(str(v) for v in row.values), axis=1)
+    def _register_partitions(self, generation: int, buckets: list[str], replace: bool = False) -> None:
+        if self._local_dataset:
+            return  # no Glue catalog to register a local dataset in
+
+        register_partitions(
+            self.data_config.athena_database,
+            self.data_config.athena_prediction_table,
+            self.model_id,
+            generation_path(self._get_partition_path(), generation),
+            buckets,
+            replace=replace,
+            boto3_session=self.session,
+        )
 
-        df["model_id"] = self.model_id
-        return df[["key", "input", "output", "model_id"]]
+    def _fetch_model(self) -> None:
+        if self._fetched:
+            return
 
+        subprocess.run([ERSILIA, "-v", "fetch", self.model_id, "--from_github"])  # type: ignore
+        self._fetched = True
 
-    def write_to_lake(self, outputs: pd.DataFrame) -> None:
-        # validate_dataframe_schema(outputs, Prediction)  # type: ignore
-        wr.s3.to_parquet(
-            df=outputs,
-            path=os.path.join(
-                "s3://",
-                self.data_config.s3_bucket_name,
-                self.data_config.athena_prediction_table,
-            ),
-            dataset=True,
-            database=self.data_config.athena_database,
-            table=self.data_config.athena_prediction_table,
-            partition_cols=["model_id"],
-            
+    def _serve_model(self) -> None:
+        if self._served:
+            return
+
+        self._fetch_model()
+        subprocess.run([ERSILIA, "-v", "serve", self.model_id, "--disable-local-cache"])  # type: ignore
+        self._served = True
+
+    def _instance_command(self, index: int, input_file_path: str, output_file_path: str) -> list[str]:
+        """Command that serves its own instance of the model, runs it on one input file and closes it.
+
+        The Ersilia CLI keeps one session, and so one served model, per parent process. Each instance is served and
+        run from its own shell, on its own port, so that parallel runs don't share a single model server.
+        """
+        serve = [ERSILIA, "-v", "serve", self.model_id, "--disable-local-cache", "--port", str(SERVE_PORT + index)]
+        run = shlex.join(self._ersilia_run_command(input_file_path, output_file_path))
+        close = shlex.join([ERSILIA, "close"])
+        return ["sh", "-c", f"{shlex.join(serve)} && {run}; status=$?; {close}; exit $status"]
+
+    def _ersilia_run_command(
+        self, input_file_path: str, output_file_path: str, batch_size: Optional[int] = None
+    ) -> list[str]:
+        return [
+            ERSILIA,
+            "-v",
+            "run",
+            "-i",
+            input_file_path,
+            "-o",
+            output_file_path,
+            "--batch_size",
+            str(batch_size or self.batch_size),
+        ]
+
+    def _run_model(self, input_file_path: str, output_file_path: str) -> None:
+        """Run the served model on an input CSV
+
+        Raises:
+            RuntimeError: if the Ersilia CLI fails or writes no output, so that the inputs are never reported as done
+        """
+        # a failed run must not leave an earlier run's output behind to be written again in its place
+        if os.path.exists(output_file_path):
+            os.remove(output_file_path)
+
+        result = subprocess.run(self._ersilia_run_command(input_file_path, output_file_path))
+        if result.returncode != 0:
+            raise RuntimeError(f"Ersilia CLI failed on {input_file_path} with exit code {result.returncode}")
+        if not os.path.exists(output_file_path):
+            raise RuntimeError(f"Ersilia CLI wrote no output for {input_file_path}")
+
+    def _get_tuning_key(self) -> str:
+        return f"{self.data_config.s3_meta_prefix}/{self.model_id}/tuning.json"
+
+    def _read_tuning_result(self) -> Optional[TuningResult]:
+        try:
+            response = self.s3.get_object(Bucket=self.data_config.s3_bucket_name, Key=self._get_tuning_key())
+        except self.s3.exceptions.NoSuchKey:
+            return None
+
+        return TuningResult.model_validate_json(response["Body"].read())
+
+    def _write_tuning_result(self, tuning: TuningResult) -> None:
+        self.s3.put_object(
+            Bucket=self.data_config.s3_bucket_name,
+            Key=self._get_tuning_key(),
+            Body=tuning.model_dump_json().encode("utf-8"),
+        )
+
+    def _get_partition_path(self) -> str:
+        return os.path.join(self.dataset_path, f"model_id={self.model_id}")
+
+    def _get_membership(self) -> Optional[BloomFilter]:
+        """Membership filter of the partition as of the first call, None if there is none (e.g. since a write)"""
+        if not self._membership_loaded:
+            key = f"{self.data_config.athena_prediction_table}/model_id={self.model_id}/{MEMBERSHIP_FILE}"
+            try:
+                response = self.s3.get_object(Bucket=self.data_config.s3_bucket_name, Key=key)
+                self._membership = BloomFilter.from_bytes(response["Body"].read())
+            except self.s3.exceptions.NoSuchKey:
+                self._membership = None
+            self._membership_loaded = True
+
+        return self._membership
+
+    def _get_existing_inputs(self) -> pd.Index:
+        # an Index keeps its hash table between lookups, so later units don't rebuild it
+        if self._existing_inputs is None:
+            self._existing_inputs = pd.Index(self._read_existing_inputs())
+        return self._existing_inputs
+
+    def _read_existing_inputs(self) -> pd.Series:
+        filesystem, partition_path = pafs.FileSystem.from_uri(self._get_partition_path())
+        try:
+            table = open_model_partition(partition_path, filesystem).to_table(columns=["input"])
+        except FileNotFoundError:
+            return pd.Series([], dtype=object)
+
+        return table.to_pandas()["input"].drop_duplicates()
+
+    def _get_checkpoint_tracker(self, input_file_path: str, chunk_size: int) -> CheckpointTracker:
+        store = S3LeaseStore(
+            self.s3,
+            self.data_config.s3_bucket_name,
+            f"{self.data_config.s3_meta_prefix}/{self.model_id}/checkpoints",
+        )
+        return CheckpointTracker(
+            store,
+            self.model_id,
+            self._shard_id,
+            self.worker_config.git_sha,
+            chunk_size,
+            hash_file(input_file_path),
+        )
+
+    def _get_input_filename(self) -> str:
+        if self.worker_config.sample:
+            return f"{INPUT_NAME}_{self.worker_config.sample}.csv"
+        return INPUT_FILE_NAME
+
+    def _get_input_index(self) -> RowIndex:
+        """Row index of the input file, built from a full download if none has been published"""
+        if self._input_index is None:
+            input_filename = self._get_input_filename()
+            index = self._get_row_index(input_filename)
+
+            if index is None:
+                self.logger.info(f"No usable row index for {input_filename}, downloading the whole file")
+
+                self.s3.download_file(self.data_config.s3_bucket_name, input_filename, INPUT_FILE_NAME)
+                index = build_row_index(INPUT_FILE_NAME)
+                self._local_input = True
+
+            self._input_index = index
+
+        return self._input_index
+
+    def _get_row_index(self, input_filename: str) -> Optional[RowIndex]:
+        """Published row index of the input file, or None if there is none or it doesn't match the file in S3"""
+        bucket = self.data_config.s3_bucket_name
+        try:
+            response = self.s3.get_object(Bucket=bucket, Key=input_filename + INDEX_SUFFIX)
+        except self.s3.exceptions.NoSuchKey:
+            return None
+
+        index = RowIndex.model_validate_json(response["Body"].read())
+
+        # an index left over from a previous version of the file would silently give the wrong rows
+        head = self.s3.head_object(Bucket=bucket, Key=input_filename)
+        if not index.matches(head["ContentLength"], head.get("ETag")):
+            self.logger.warning(
+                f"Row index of {input_filename} is stale: indexed {index.file_size} bytes (ETag {index.etag}), "
+                f"found {head['ContentLength']} bytes (ETag {head.get('ETag')})"
+            )
+            return None
+
+        # byte ranges are only read from the version of the file that was checked
+        self._input_etag = head.get("ETag")
+        return index
+
+    def _fetch_range(self, first: int, last: int) -> bytes:
+        if self._local_input:
+            with open(INPUT_FILE_NAME, "rb") as f:
+                f.seek(first)
+                return f.read(last - first)
+
+        request = {
+            "Bucket": self.data_config.s3_bucket_name,
+            "Key": self._get_input_filename(),
+            "Range": f"bytes={first}-{last - 1}",
+        }
+        if self._input_etag is not None:
+            request["IfMatch"] = self._input_etag
+        return self.s3.get_object(**request)["Body"].read()
+
+    def _write_rows(self, index: RowIndex, start_row: int, end_row: int) -> None:
+        content = read_shard(index, self._fetch_range, start_row, end_row)
+
+        with open(PROCESSED_FILE_NAME, "wb") as f:
+            f.write(content)
+
+    def _read_shard(self, index: RowIndex) -> tuple[int, int]:
+        """Download only the rows assigned to this worker using byte-range requests"""
+        start_row, end_row = shard_bounds(
+            index.total_rows, self.worker_config.denominator, self.worker_config.numerator
         )
 
+        self._write_rows(index, start_row, end_row)
+
+        return start_row, end_row
+
     def _split_csv(self) -> tuple[int, int]:
         """Partition CSV file such that the worker has the correct set of rows to predict on"""
         df = pd.read_csv(INPUT_FILE_NAME)
 
-        total_length = len(df)
-        chunk_size = total_length // self.worker_config.denominator
-
-        start_row = (self.worker_config.numerator - 1) * chunk_size
-        end_row = start_row + chunk_size
+        start_row, end_row = shard_bounds(len(df), self.worker_config.denominator, self.worker_config.numerator)
 
         df = df.iloc[start_row:end_row]
         df.to_csv(PROCESSED_FILE_NAME, index=False)
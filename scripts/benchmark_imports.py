@@ -0,0 +1,60 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_DIR = os.path.join(ROOT, "infra", "precalculator", "lambda")
+
+# Lambda handler modules, followed by the heavy dependencies they may load on some code paths
+DEFAULT_MODULES = ["fetch_predictions", "api_handler", "get_model", "boto3", "pandas", "awswrangler"]
+
+MEASURE = "import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="BenchmarkImports", description="Measure the cold-start import time of the Lambda handlers"
+    )
+
+    parser.add_argument("modules", help="Modules to import", nargs="*", default=DEFAULT_MODULES)
+
+    parser.add_argument("--runs", help="Fresh interpreters per module, the median is reported", type=int, default=5)
+
+    parser.add_argument(
+        "--output", help="JSON lines file the results are appended to, to track them over time", type=str, default=None
+    )
+
+    return parser
+
+
+def measure_import(module: str) -> float:
+    """Seconds to import a module in a fresh interpreter, as on a Lambda cold start"""
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([LAMBDA_DIR, ROOT])}
+    result = subprocess.run(
+        [sys.executable, "-c", MEASURE.format(module=module)], capture_output=True, text=True, env=env, check=True
+    )
+    return float(result.stdout.strip())
+
+
+def git_sha() -> str:
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=ROOT)
+    return result.stdout.strip()
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+
+    results = {}
+    for module in args.modules:
+        seconds = [measure_import(module) for _ in range(args.runs)]
+        results[module] = statistics.median(seconds)
+        print(f"{module:<20} {results[module] * 1000:8.1f} ms")
+
+    if args.output is not None:
+        record = {"timestamp": int(time.time()), "git_sha": git_sha(), "python": sys.version.split()[0]}
+        with open(args.output, "a") as f:
+            f.write(json.dumps({**record, "import_seconds": results}) + "\n")
@@ -0,0 +1,63 @@
+import argparse
+import time
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+
+from precalculator.writer import to_prediction_frame
+
+MODEL_ID = "eos0bench"
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="BenchmarkPostprocess", description="Compare row-wise and vectorized postprocessing of Ersilia outputs"
+    )
+
+    parser.add_argument("--rows", help="Number of rows in the synthetic output", type=int, default=1_000_000)
+
+    parser.add_argument("--outputs", help="Number of model output columns", type=int, default=4)
+
+    return parser
+
+
+def make_output_frame(n_rows: int, n_outputs: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "key": [f"{i:014d}-UHFFFAOYSA-N" for i in range(n_rows)],
+            "input": [f"CCO{i}" for i in range(n_rows)],
+        }
+    )
+    for i in range(n_outputs):
+        df[f"feat_{i}"] = rng.random(n_rows)
+    return df
+
+
+def rowwise_postprocess(df: pd.DataFrame, model_id: str) -> pd.DataFrame:
+    """Previous implementation of PredictionWriter.postprocess, kept as the benchmark baseline"""
+    df = df.copy()
+    output_cols = [c for c in df.columns if c not in ("key", "input")]
+    df["output"] = df[output_cols].apply(lambda row: ",".join(str(v) for v in row.values), axis=1)
+    df["model_id"] = model_id
+    return df[["key", "input", "output", "model_id"]]
+
+
+def timed(fn: Callable, *args: Any) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+
+    df = make_output_frame(args.rows, args.outputs)
+
+    rowwise = timed(rowwise_postprocess, df, MODEL_ID)
+    vectorized = timed(to_prediction_frame, df, MODEL_ID)
+
+    print(f"rows: {args.rows}, outputs: {args.outputs}")
+    print(f"row-wise:   {rowwise:.2f} s")
+    print(f"vectorized: {vectorized:.2f} s ({rowwise / vectorized:.0f}x faster)")
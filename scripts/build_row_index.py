@@ -0,0 +1,52 @@
+import argparse
+import os
+
+import boto3
+from botocore.exceptions import ClientError
+
+from config.app import DataLakeConfig
+from precalculator.shards import DEFAULT_STRIDE, build_row_index
+from precalculator.writer import INDEX_SUFFIX
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="RowIndex", description="Build a row-offset index for a reference library CSV and upload it to S3"
+    )
+
+    parser.add_argument("input_path", help="Local path of the reference library CSV", type=str)
+
+    parser.add_argument("--stride", help="Number of rows between indexed offsets", type=int, default=DEFAULT_STRIDE)
+
+    parser.add_argument("--dry-run", help="Print the index summary without uploading it", action="store_true")
+
+    return parser
+
+
+if __name__ == "__main__":
+    parser = build_parser()
+    args = parser.parse_args()
+
+    index = build_row_index(args.input_path, stride=args.stride)
+
+    print(f"Indexed {index.total_rows} rows ({len(index.offsets)} offsets) of {args.input_path}")
+
+    if not args.dry_run:
+        config = DataLakeConfig()  # type: ignore
+        input_key = os.path.basename(args.input_path)
+        index_key = input_key + INDEX_SUFFIX
+        s3 = boto3.client("s3")
+
+        # workers ignore the index if the file in S3 doesn't match it, so record which version it was built from
+        try:
+            head = s3.head_object(Bucket=config.s3_bucket_name, Key=input_key)
+        except ClientError:
+            head = None
+        if head is not None and index.matches(head["ContentLength"]):
+            index.etag = head["ETag"]
+        else:
+            print(f"Warning: s3://{config.s3_bucket_name}/{input_key} is missing or differs from {args.input_path}")
+
+        s3.put_object(Bucket=config.s3_bucket_name, Key=index_key, Body=index.model_dump_json().encode("utf-8"))
+
+        print(f"Uploaded index to s3://{config.s3_bucket_name}/{index_key}")
@@ -0,0 +1,67 @@
+import argparse
+import logging
+import os
+import sys
+
+from config.app import DataLakeConfig
+from precalculator.catalog import register_partitions
+from precalculator.compaction import DEFAULT_FILE_ROWS, DEFAULT_ROW_GROUP_SIZE, compact_partition
+from precalculator.generations import generation_path
+
+logger = logging.getLogger("CompactPredictionsScript")
+logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="Compaction", description="Compact the predictions partition of a model into a few large sorted files"
+    )
+
+    parser.add_argument("model_id", help="ID of the Ersilia model whose partition is to be compacted", type=str)
+
+    parser.add_argument(
+        "--path",
+        help="Root of the predictions dataset, defaults to the predictions table in the precalcs bucket",
+        type=str,
+        default=None,
+    )
+
+    parser.add_argument("--file-rows", help="Maximum rows per output file", type=int, default=DEFAULT_FILE_ROWS)
+
+    parser.add_argument("--row-group-size", help="Rows per Parquet row group", type=int, default=DEFAULT_ROW_GROUP_SIZE)
+
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+
+    config = None
+    if args.path is None:
+        config = DataLakeConfig()  # type: ignore
+        args.path = os.path.join("s3://", config.s3_bucket_name, config.athena_prediction_table)
+
+    partition_path = os.path.join(args.path, f"model_id={args.model_id}")
+
+    on_switch = None
+    if config is not None:
+
+        def on_switch(generation: int, buckets: list[str]) -> None:
+            # Athena reads the partitions where Glue says they are, so they are pointed at the new generation. This
+            # also registers the buckets of a partition written before key bucketing or with other buckets, and drops
+            # the partitions of those other buckets
+            register_partitions(
+                config.athena_database,
+                config.athena_prediction_table,
+                args.model_id,
+                generation_path(partition_path, generation),
+                buckets,
+                replace=True,
+                exclusive=True,
+            )
+
+    result = compact_partition(
+        partition_path, file_rows=args.file_rows, row_group_size=args.row_group_size, on_switch=on_switch
+    )
+
+    logger.info(result.model_dump_json())
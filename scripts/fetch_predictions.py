@@ -10,20 +10,27 @@ def get_parameters() -> dict:
     parser = argparse.ArgumentParser(description="Process parameters.")
     parser.add_argument("--request", help="Request ID")
     parser.add_argument("--model", help="Model ID")
+    parser.add_argument(
+        "--engine",
+        help="Read Parquet directly (arrow), join in Athena (athena), or pick by request size (auto)",
+        choices=["auto", "arrow", "athena"],
+        default="auto",
+    )
 
     args = parser.parse_args()
 
-    params = {"request_id": args.request, "model_id": args.model}
+    params = {"request_id": args.request, "model_id": args.model, "engine": args.engine}
 
     return params
 
 
-def main(request_id: str, model_id: str) -> pd.DataFrame:
+def main(request_id: str, model_id: str, engine: str = "auto") -> pd.DataFrame:
     """Fetch predictions
 
     Args:
         request_id (str): _description_
         model_id (str): _description_
+        engine (str): fetch engine, see LocalPredictionFetcher
 
     Returns:
         pd.DataFrame: _description_
@@ -32,7 +39,7 @@ def main(request_id: str, model_id: str) -> pd.DataFrame:
 
     print("config", config)
 
-    fetcher = LocalPredictionFetcher(config, request_id, model_id)
+    fetcher = LocalPredictionFetcher(config, request_id, model_id, engine=engine)  # type: ignore
 
     path_to_input = fetcher.get_s3_input_location()
 
@@ -12,13 +12,50 @@ TEST_ENV = {
     "INPUT_NUMERATOR": 1,
     "INPUT_DENOMINATOR": 2,
     "INPUT_SAMPLE_ONLY": 10,
+    "INPUT_DELTA": "false",
+    "INPUT_CHUNK_SIZE": None,
+    "INPUT_PROCESSES": 1,
+    "INPUT_BATCH_SIZE": 1000,
+    "INPUT_SCHEDULER": "static",
+    "GITHUB_RUN_ID": "local",
+    "INPUT_PROFILE": "false",
 }
 
 logger = logging.getLogger("GeneratePredictionsScript")
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 
+
+def predict_and_write(writer: PredictionWriter, worker_config: WorkerConfig, input_file: str) -> None:
+    """Run the model on an input file fetched by the writer and write its predictions to the data lake"""
+    if worker_config.delta and writer.filter_existing(input_file) == 0:
+        logger.info("All inputs already have predictions, nothing to do")
+        return
+
+    if worker_config.batch_size == 0:
+        worker_config.batch_size = writer.tune_batch_size(input_file)
+
+    if worker_config.chunk_size:
+        writer.predict_pipelined(input_file, worker_config.chunk_size, worker_config.queue_depth)
+    else:
+        if worker_config.processes != 1:
+            output_file = writer.predict_parallel(input_file, worker_config.processes or None)
+        else:
+            output_file = writer.predict(input_file)
+
+        df_predictions = writer.postprocess(output_file)
+
+        writer.write_to_lake(df_predictions)
+
+
 parser = argparse.ArgumentParser()
 parser.add_argument("-e", "--env", choices=["dev", "ci", "prod"], default="dev", help="Specify environment")
+parser.add_argument(
+    "--profile",
+    nargs="?",
+    const="profile",
+    default=None,
+    help="Profile every stage and write the profiles to this directory (default: profile)",
+)
 
 if __name__ == "__main__":
     args = parser.parse_args()
@@ -38,6 +75,14 @@ if __name__ == "__main__":
     numerator = int(env_source.get("INPUT_NUMERATOR"))  # type: ignore
     denominator = int(env_source.get("INPUT_DENOMINATOR"))  # type: ignore
     sample_only = env_source.get("INPUT_SAMPLE_ONLY")  # type: ignore
+    delta = str(env_source.get("INPUT_DELTA", "false")).lower() == "true"  # type: ignore
+    chunk_size = env_source.get("INPUT_CHUNK_SIZE") or None  # type: ignore
+    processes = int(env_source.get("INPUT_PROCESSES") or 1)  # type: ignore
+    batch_size = int(env_source.get("INPUT_BATCH_SIZE") or 1000)  # type: ignore
+    scheduler = env_source.get("INPUT_SCHEDULER") or "static"  # type: ignore
+    run_id = env_source.get("GITHUB_RUN_ID")  # type: ignore
+    if str(env_source.get("INPUT_PROFILE", "false")).lower() == "true":  # type: ignore
+        args.profile = args.profile or "profile"
 
     data_config = DataLakeConfig()  # type: ignore
     worker_config = WorkerConfig(  # type: ignore
@@ -45,6 +90,12 @@ if __name__ == "__main__":
         denominator=denominator,  # type: ignore
         numerator=numerator,  # type: ignore
         sample=sample_only,
+        delta=delta,
+        chunk_size=chunk_size,  # type: ignore
+        processes=processes,
+        batch_size=batch_size,
+        scheduler=scheduler,  # type: ignore
+        run_id=run_id,  # type: ignore
     )
 
     logger.info(
@@ -57,12 +108,25 @@ if __name__ == "__main__":
         "\n".join(f"{k}: {v}" for k, v in worker_config.model_dump().items()),
     )
 
-    writer = PredictionWriter(data_config=data_config, worker_config=worker_config, model_id=model_id, dev=dev)
-
-    input_file = writer.fetch()
-
-    output_file = writer.predict(input_file)
-
-    df_predictions = writer.postprocess(output_file)
+    writer = PredictionWriter(
+        data_config=data_config, worker_config=worker_config, model_id=model_id, dev=dev, profile_dir=args.profile
+    )
 
-    writer.write_to_lake(df_predictions)
+    try:
+        if worker_config.scheduler == "dynamic":
+            scheduler = writer.get_scheduler()
+
+            for unit in scheduler:
+                with scheduler.hold(unit):
+                    predict_and_write(writer, worker_config, writer.fetch_unit(unit))
+                if not scheduler.complete(unit):
+                    # another worker claimed the unit and writes its predictions again; compaction drops duplicates
+                    logger.warning(f"Lost the lease of {unit.unit_id} before completing it")
+        else:
+            predict_and_write(writer, worker_config, writer.fetch())
+    finally:
+        # also written for failed workers, to see how far they got
+        writer.write_instrumentation()
+
+        if args.profile:
+            logger.info(f"Profiles written to {args.profile}")
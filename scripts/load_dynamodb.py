@@ -0,0 +1,69 @@
+import argparse
+import logging
+import os
+import sys
+
+import boto3
+from botocore.config import Config
+
+from config.app import DataLakeConfig
+from precalculator.loader import DEFAULT_READ_ROWS, DEFAULT_WORKERS, load_model_predictions
+
+logger = logging.getLogger("LoadDynamoDBScript")
+logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="LoadDynamoDB", description="Load the predictions of a model from the data lake into DynamoDB"
+    )
+
+    parser.add_argument("model_id", help="ID of the Ersilia model whose predictions are to be loaded", type=str)
+
+    parser.add_argument(
+        "--path",
+        help="Root of the predictions dataset, defaults to the predictions table in the precalcs bucket",
+        type=str,
+        default=None,
+    )
+
+    parser.add_argument("--table", help="DynamoDB table, defaults to DYNAMODB_TABLE_NAME", type=str, default=None)
+
+    parser.add_argument("--workers", help="Concurrent batch writes", type=int, default=DEFAULT_WORKERS)
+
+    parser.add_argument(
+        "--max-wcu",
+        help="Write capacity units per second the load may consume, unlimited by default",
+        type=float,
+        default=None,
+    )
+
+    parser.add_argument("--read-rows", help="Rows per batch read from Parquet", type=int, default=DEFAULT_READ_ROWS)
+
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+
+    if args.path is None or args.table is None:
+        config = DataLakeConfig()  # type: ignore
+        args.path = args.path or os.path.join("s3://", config.s3_bucket_name, config.athena_prediction_table)
+        args.table = args.table or config.dynamodb_table_name
+
+    # one connection per worker, botocore's default pool of 10 would serialise the writes
+    client = boto3.client(
+        "dynamodb", config=Config(max_pool_connections=args.workers, retries={"max_attempts": 10, "mode": "adaptive"})
+    )
+
+    stats = load_model_predictions(
+        client,
+        args.table,
+        args.path,
+        args.model_id,
+        workers=args.workers,
+        max_write_capacity=args.max_wcu,
+        read_rows=args.read_rows,
+    )
+
+    logger.info(stats.model_dump_json())
@@ -0,0 +1,80 @@
+import argparse
+import logging
+import os
+import sys
+
+import awswrangler as wr
+
+from config.app import DataLakeConfig
+from precalculator.migration import migrate_partition
+
+logger = logging.getLogger("MigrateOutputsScript")
+logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="MigrateOutputs",
+        description="Rewrite predictions stored with outputs as a comma-joined string into the output map columns",
+    )
+
+    parser.add_argument("model_id", help="ID of the Ersilia model whose partition is to be migrated", type=str)
+
+    parser.add_argument(
+        "--columns",
+        help="Comma-separated output columns of the model, in the order of its Ersilia output",
+        type=str,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--delete",
+        help="Delete the legacy files instead, so the model's predictions are generated again in full",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--path",
+        help="Root of the predictions dataset, defaults to the predictions table in the precalcs bucket",
+        type=str,
+        default=None,
+    )
+
+    return parser
+
+
+if __name__ == "__main__":
+    parser = build_parser()
+    args = parser.parse_args()
+
+    if (args.columns is None) == (not args.delete):
+        parser.error("give either --columns or --delete")
+
+    config = None
+    if args.path is None:
+        config = DataLakeConfig()  # type: ignore
+        args.path = os.path.join("s3://", config.s3_bucket_name, config.athena_prediction_table)
+
+    partition_path = os.path.join(args.path, f"model_id={args.model_id}")
+    output_columns = None if args.delete else args.columns.split(",")
+
+    result = migrate_partition(partition_path, output_columns)
+
+    logger.info(result.model_dump_json())
+
+    if config is not None and result.files:
+        # partitions registered before the migration keep the old column types, which Athena would read the
+        # migrated files with, so they are registered again with the table's columns
+        partitions = wr.catalog.get_parquet_partitions(
+            database=config.athena_database,
+            table=config.athena_prediction_table,
+            expression=f"model_id = '{args.model_id}'",
+        )
+        wr.catalog.delete_partitions(
+            table=config.athena_prediction_table,
+            database=config.athena_database,
+            partitions_values=list(partitions.values()),
+        )
+        wr.catalog.add_parquet_partitions(
+            database=config.athena_database, table=config.athena_prediction_table, partitions_values=partitions
+        )
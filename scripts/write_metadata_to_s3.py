@@ -2,9 +2,14 @@ import argparse
 import os
 from pathlib import Path
 
+import boto3
 from dotenv import load_dotenv
 
+from config.app import DataLakeConfig
+from precalculator.instrumentation import apply_run_summary, read_worker_records, summarize_run
+from precalculator.manifest import update_model_manifest
 from precalculator.read import get_metadata
+from precalculator.scheduler import S3LeaseStore
 from precalculator.write import write_metadata
 
 dotenv_path = Path("./config/stack.env")  # relative to root of git repo
@@ -24,6 +29,13 @@ def build_parser() -> argparse.ArgumentParser:
 
     parser.add_argument("pipeline_end", help="Timestamp for when the pipeline run ended", type=int)
 
+    parser.add_argument(
+        "--run-id",
+        help="ID of the pipeline run, whose worker records are combined into the metadata",
+        type=str,
+        default=os.getenv("GITHUB_RUN_ID"),
+    )
+
     return parser
 
 
@@ -34,10 +46,23 @@ def get_metadata_s3_uri(metadata_key: str) -> str:
 if __name__ == "__main__":
     parser = build_parser()
     args = parser.parse_args()
+    config = DataLakeConfig()  # type: ignore
 
     metadata_key = f"meta/{args.model_id}.json"
     s3_uri = get_metadata_s3_uri(metadata_key)
 
     metadata = get_metadata(BUCKET_NAME, metadata_key, s3_uri, args.model_id, args.pipeline_start, args.pipeline_end)
 
+    if args.run_id:
+        records = read_worker_records(
+            boto3.client("s3"), BUCKET_NAME, config.s3_meta_prefix, args.model_id, args.run_id
+        )
+        if records:
+            summary = summarize_run(records)
+            print(f"Run {args.run_id}: {summary.model_dump_json()}")
+            metadata = apply_run_summary(metadata, summary)
+
     write_metadata(BUCKET_NAME, metadata_key, metadata)
+
+    # the get_model Lambda answers availability checks from this manifest
+    update_model_manifest(S3LeaseStore(boto3.client("s3"), BUCKET_NAME, config.s3_meta_prefix), metadata)
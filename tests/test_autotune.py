@@ -0,0 +1,63 @@
+import subprocess
+import sys
+import time
+
+from precalculator.autotune import BatchSizeProbe, BatchSizeTuner, choose_batch_size, run_measured
+
+MiB = 1024**2
+
+
+def probe(batch_size: int, seconds: float, peak_rss: int, returncode: int = 0) -> BatchSizeProbe:
+    return BatchSizeProbe(batch_size=batch_size, rows=1000, seconds=seconds, peak_rss=peak_rss, returncode=returncode)
+
+
+def test_choose_batch_size_prefers_fastest_under_ceiling():
+    probes = [probe(100, 4.0, 100 * MiB), probe(500, 2.0, 300 * MiB), probe(1000, 1.0, 900 * MiB)]
+
+    assert choose_batch_size(probes, memory_ceiling=500 * MiB) == 500
+    assert choose_batch_size(probes, memory_ceiling=1000 * MiB) == 1000
+
+
+def test_choose_batch_size_ignores_failed_probes():
+    probes = [probe(100, 4.0, 100 * MiB), probe(500, 1.0, 100 * MiB, returncode=1)]
+
+    assert choose_batch_size(probes, memory_ceiling=500 * MiB) == 100
+    assert choose_batch_size([probes[1]], memory_ceiling=500 * MiB) == 500
+
+
+def allocate(mib: int) -> list[str]:
+    return [sys.executable, "-c", f"x = bytearray({mib} * 1024 ** 2)"]
+
+
+def test_run_measured_reports_peak_rss():
+    _, peak_rss, returncode = run_measured(allocate(400))
+
+    assert returncode == 0
+    assert peak_rss >= 400 * MiB
+
+
+def test_run_measured_includes_model_server():
+    # stands in for a served model, which the ersilia client sends its inputs to
+    server = subprocess.Popen(
+        [sys.executable, "-c", "import time; x = bytearray(300 * 1024 ** 2); time.sleep(60)", "eos-test-server"]
+    )
+    try:
+        time.sleep(1)
+        _, peak_rss, returncode = run_measured(allocate(0), server_pattern="eos-test-server")
+    finally:
+        server.kill()
+        server.wait()
+
+    assert returncode == 0
+    assert peak_rss >= 300 * MiB
+
+
+def test_tuner_stops_at_memory_ceiling():
+    # a forked child starts with the RSS of this process, so the ceiling is relative to it
+    _, baseline, _ = run_measured(allocate(0))
+
+    tuner = BatchSizeTuner(allocate, rows=1000, candidates=(10, 100, 800, 1000), memory_ceiling=baseline + 300 * MiB)
+    batch_size, probes = tuner.tune()
+
+    assert [p.batch_size for p in probes] == [10, 100, 800]
+    assert batch_size in (10, 100)
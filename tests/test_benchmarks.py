@@ -0,0 +1,73 @@
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+
+from benchmarks.compare import compare
+from benchmarks.run import BenchmarkRun, StageResult, run
+from benchmarks.scan import scanned_bytes
+from benchmarks.synthetic import make_model_output, parse_size
+from precalculator.compaction import compact_partition
+from precalculator.layout import KEY_BUCKET_COUNT, is_inchikey, key_buckets
+
+FIXTURE = Path(__file__).parent / "fixtures" / "test_output.csv"
+
+
+def test_model_output_is_shaped_like_ersilia_output():
+    df = make_model_output(1000)
+
+    assert list(df.columns) == list(pd.read_csv(FIXTURE).columns)
+    assert df["key"].is_unique and df["input"].is_unique
+    assert all(is_inchikey(key) for key in df["key"])
+    assert make_model_output(10, seed=1).equals(make_model_output(10, seed=1))
+
+
+def test_parse_size():
+    assert [parse_size(size) for size in ["10k", "100K", "2M", "1.5k", "500"]] == [
+        10_000,
+        100_000,
+        2_000_000,
+        1500,
+        500,
+    ]
+
+
+def test_run_times_every_stage():
+    result = run([500], ["split_csv", "postprocess", "validate", "write_parquet", "fetch"], repeat=1)
+
+    assert [(r.stage, r.rows, len(r.runs)) for r in result.results] == [
+        ("split_csv", 500, 1),
+        ("postprocess", 500, 1),
+        ("validate", 500, 1),
+        ("write_parquet", 500, 1),
+        ("fetch", 500, 1),
+    ]
+    assert all(r.peak_rss > 0 for r in result.results)
+    assert BenchmarkRun.model_validate_json(result.model_dump_json()) == result
+
+
+def test_compare_reports_regressions():
+    def benchmark_run(seconds: float) -> BenchmarkRun:
+        results = [StageResult(stage="fetch", rows=1000, runs=[seconds])]
+        return BenchmarkRun(timestamp=0, git_sha="abc", python="3.10", machine="x86_64", results=results)
+
+    assert compare(benchmark_run(1.0), benchmark_run(1.05), tolerance=0.1) == []
+    assert compare(benchmark_run(1.0), benchmark_run(1.5), tolerance=0.1) == ["fetch (1000 rows)"]
+
+
+def test_scanned_bytes_of_a_key_lookup(tmp_path: Path):
+    keys = make_model_output(2000)["key"].tolist()
+    partition = tmp_path / "model_id=eos0bench"
+    partition.mkdir()
+    pq.write_table(pa.table({"key": keys, "input": keys}), partition / "part.parquet")
+    compact_partition(str(partition))
+
+    result = scanned_bytes(str(partition), keys[:10], pafs.LocalFileSystem())
+
+    # one row group per bucket, of which a 10 key request reads only its own
+    assert (result.buckets, result.row_groups) == (len(key_buckets(keys[:10])), len(key_buckets(keys[:10])))
+    # about the share of the partition's buckets the request touches
+    assert 0 < result.fraction < 2 * result.buckets / KEY_BUCKET_COUNT
+    assert scanned_bytes(str(partition), keys, pafs.LocalFileSystem()).fraction == 1.0
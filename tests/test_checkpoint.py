@@ -0,0 +1,48 @@
+from pathlib import Path
+
+import pytest
+
+from precalculator.checkpoint import CheckpointTracker, hash_file
+from precalculator.scheduler import LocalLeaseStore
+
+MODEL_ID = "eos3b5e"
+
+
+def tracker(store: LocalLeaseStore, chunk_size: int = 100, input_hash: str = "abc") -> CheckpointTracker:
+    return CheckpointTracker(store, MODEL_ID, "full-1-of-2", "1234", chunk_size, input_hash)
+
+
+def test_rerun_skips_completed_chunks(tmp_path: Path):
+    store = LocalLeaseStore(str(tmp_path))
+
+    first_run = tracker(store)
+    first_run.mark_done("chunk_00000")
+    first_run.mark_done("chunk_00001")
+
+    second_run = tracker(store)
+    assert second_run.is_done("chunk_00001")
+    assert not second_run.is_done("chunk_00002")
+
+    second_run.mark_done("chunk_00002")
+    assert tracker(store).checkpoint.completed == ["chunk_00000", "chunk_00001", "chunk_00002"]
+
+
+@pytest.mark.parametrize("chunk_size,input_hash", [(50, "abc"), (100, "def")])
+def test_checkpoint_for_other_chunks_is_ignored(tmp_path: Path, chunk_size: int, input_hash: str):
+    store = LocalLeaseStore(str(tmp_path))
+    tracker(store).mark_done("chunk_00000")
+
+    rerun = tracker(store, chunk_size, input_hash)
+    assert not rerun.is_done("chunk_00000")
+
+    # the stale checkpoint is overwritten by the new run
+    rerun.mark_done("chunk_00003")
+    assert tracker(store, chunk_size, input_hash).checkpoint.completed == ["chunk_00003"]
+
+
+def test_hash_file_depends_on_content(tmp_path: Path):
+    a, b = tmp_path / "a.csv", tmp_path / "b.csv"
+    a.write_text("smiles\nC\n")
+    b.write_text("smiles\nCC\n")
+
+    assert hash_file(str(a)) != hash_file(str(b))
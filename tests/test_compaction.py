@@ -0,0 +1,120 @@
+import os
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+import pytest
+
+from precalculator import compaction
+from precalculator.compaction import compact_partition
+from precalculator.generations import read_generation, write_generation
+from precalculator.layout import key_bucket, key_buckets
+from precalculator.membership import MEMBERSHIP_FILE, BloomFilter
+
+
+def write_file(path: Path, keys: list[str], value: float) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    table = pa.table({"key": keys, "input": [f"smiles-{k}" for k in keys], "output": [value] * len(keys)})
+    pq.write_table(table, path)
+
+
+def write_bucketed(directory: Path, name: str, keys: list[str], value: float) -> int:
+    """Write keys to their bucket directories like a writer does, returning the number of files written"""
+    buckets = sorted({key_bucket(key) for key in keys})
+    for bucket in buckets:
+        write_file(directory / f"key_bucket={bucket}" / name, [key for key in keys if key_bucket(key) == bucket], value)
+    return len(buckets)
+
+
+def read_keys(directory: Path) -> pa.Table:
+    files = sorted(str(p) for p in directory.glob("key_bucket=*/*.parquet"))
+    return pa.concat_tables([pq.read_table(f, partitioning=None) for f in files]).sort_by("key")
+
+
+def test_compact_partition(tmp_path: Path):
+    partition = tmp_path / "predictions" / "model_id=eos3b5e"
+
+    # files from before key bucketing and from the first-letter buckets next to files in the current buckets, newest
+    # sequence last whatever the mtime
+    files_before = write_bucketed(partition, "000000000003_c.parquet", ["AD", "AF", "AB", "AA"], 3.0)
+    write_file(partition / "key_bucket=B" / "000000000002_b.parquet", ["BB", "BC"], 2.0)
+    write_file(partition / "legacy.parquet", ["AC", "AA", "BC", "AE"], 1.0)
+    keys = ["AA", "AB", "AC", "AD", "AE", "AF", "BB", "BC"]
+
+    switched = []
+    result = compact_partition(
+        str(partition), file_rows=4, row_group_size=1, on_switch=lambda *args: switched.append(args)
+    )
+
+    assert (result.files_before, result.files_after) == (files_before + 2, len(key_buckets(keys)))
+    assert (result.rows_before, result.rows_after) == (10, 8)
+    assert result.buckets == key_buckets(keys)
+    assert result.generation == 1
+    assert switched == [(1, key_buckets(keys))]
+
+    assert read_generation(pafs.LocalFileSystem(), str(partition)) == 1
+    generation = partition / "_gen=1"
+    bucket = generation / f"key_bucket={key_bucket('AA')}"
+    assert os.listdir(bucket) == ["000000000003_compacted-00000.parquet"]
+    # the rows of the files outside the current buckets were only staged per bucket for compaction
+    assert not (generation / compaction.STAGING_DIR).exists()
+
+    table = read_keys(generation)
+    assert table["key"].to_pylist() == keys
+    # duplicates keep the value from the file with the highest sequence number
+    assert table["output"].to_pylist() == [3.0, 3.0, 1.0, 3.0, 1.0, 3.0, 2.0, 2.0]
+
+    membership = BloomFilter.from_bytes((partition / MEMBERSHIP_FILE).read_bytes())
+    assert membership.count == 16
+    assert all(value in membership for value in ["AA", "BC", "smiles-AF"])
+
+    metadata = pq.ParquetFile(bucket / "000000000003_compacted-00000.parquet").metadata
+    assert metadata.num_row_groups == metadata.num_rows
+    assert metadata.row_group(0).column(0).compression == "ZSTD"
+
+
+def test_compaction_deletes_the_generation_before_the_previous_one(tmp_path: Path):
+    partition = tmp_path / "model_id=eos3b5e"
+    write_bucketed(partition, "000000000001_a.parquet", ["AA", "AB"], 1.0)
+    compact_partition(str(partition))
+
+    # written to the current generation after the first compaction
+    write_bucketed(partition / "_gen=1", "000000000002_a.parquet", ["AB", "AC"], 2.0)
+    result = compact_partition(str(partition))
+
+    assert result.generation == 2
+    # the files of generation 0 are deleted, generation 1 is kept for readers that haven't switched yet
+    assert sorted(os.listdir(partition)) == ["_gen=1", "_gen=2", "_generation.json", MEMBERSHIP_FILE]
+    table = read_keys(partition / "_gen=2")
+    assert table["key"].to_pylist() == ["AA", "AB", "AC"]
+    assert table["output"].to_pylist() == [1.0, 2.0, 2.0]
+
+    compact_partition(str(partition))
+    assert not (partition / "_gen=1").exists()
+
+
+def test_files_written_during_compaction_are_copied(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    partition = tmp_path / "model_id=eos3b5e"
+    write_bucketed(partition, "000000000001_a.parquet", ["AA", "AB"], 1.0)
+
+    def switch_during_write(filesystem: pafs.FileSystem, partition_path: str, generation: int) -> None:
+        # a writer that read the pointer before the switch finishes writing to the old generation after it
+        write_generation(filesystem, partition_path, generation)
+        write_file(partition / f"key_bucket={key_bucket('CA')}" / "000000000002_c.parquet", ["CA"], 2.0)
+
+    monkeypatch.setattr(compaction, "write_generation", switch_during_write)
+    switched = []
+    result = compact_partition(str(partition), on_switch=lambda *args: switched.append(args))
+
+    assert switched == [(1, key_buckets(["AA", "AB", "CA"]))]
+    assert result.buckets == key_buckets(["AA", "AB", "CA"])
+    assert (partition / "_gen=1" / f"key_bucket={key_bucket('CA')}" / "000000000002_c.parquet").exists()
+    membership = BloomFilter.from_bytes((partition / MEMBERSHIP_FILE).read_bytes())
+    assert "CA" in membership and "smiles-CA" in membership
+
+
+def test_compact_missing_partition(tmp_path: Path):
+    result = compact_partition(str(tmp_path / "model_id=missing"))
+
+    assert result.files_before == 0
@@ -0,0 +1,111 @@
+import time
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config.app import DataLakeConfig
+from precalculator.dataset import OUTPUT_TYPE, bucket_keys, read_model_predictions
+from precalculator.fetcher import LocalPredictionFetcher
+from precalculator.layout import key_bucket
+from precalculator.membership import MEMBERSHIP_FILE, BloomFilter
+
+MODEL_ID = "eos3b5e"
+KEYS = ["AAAAAAAAAAAAAA-UHFFFAOYSA-N", "BBBBBBBBBBBBBB-UHFFFAOYSA-N", "CCCCCCCCCCCCCC-UHFFFAOYSA-N"]
+MISSING_KEY = "ZZZZZZZZZZZZZZ-UHFFFAOYSA-N"
+
+
+def write_predictions(path: Path, keys: list[str]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    table = pa.table(
+        {
+            "key": keys,
+            "input": [f"smiles-{key[0]}" for key in keys],
+            "output": pa.array([[("mw", float(i))] for i in range(len(keys))], OUTPUT_TYPE),
+        }
+    )
+    pq.write_table(table, path)
+
+
+def build_dataset(root: Path) -> Path:
+    partition = root / f"model_id={MODEL_ID}"
+    write_predictions(partition / f"key_bucket={key_bucket(KEYS[0])}" / "a.parquet", KEYS[:1])
+    write_predictions(partition / f"key_bucket={key_bucket(KEYS[1])}" / "b.parquet", KEYS[1:2])
+    # written before key bucketing
+    write_predictions(partition / "legacy.parquet", KEYS[2:])
+    # a file in a bucket the lookup must skip: reading it would fail
+    (partition / f"key_bucket={key_bucket(MISSING_KEY)}").mkdir()
+    (partition / f"key_bucket={key_bucket(MISSING_KEY)}" / "corrupt.parquet").write_bytes(b"not parquet")
+    return root
+
+
+def test_read_model_predictions_by_key(tmp_path: Path):
+    root = build_dataset(tmp_path)
+
+    df = read_model_predictions(str(root), MODEL_ID, [KEYS[2], KEYS[0], KEYS[0]], column="key")
+
+    assert list(df.columns) == ["model_id", "key", "input", "output", "output_text"]
+    assert sorted(df["key"]) == [KEYS[0], KEYS[2]]
+    assert df.set_index("key").loc[KEYS[2], "output"] == {"mw": 0.0}
+    # written before output_text was added
+    assert df["output_text"].isna().all()
+
+
+def test_read_model_predictions_returns_the_latest_write_of_a_key(tmp_path: Path):
+    bucket = tmp_path / f"model_id={MODEL_ID}" / f"key_bucket={key_bucket(KEYS[0])}"
+    write_predictions(bucket / "000000000010_a.parquet", [KEYS[1], KEYS[0]])
+    write_predictions(bucket / "000000000002_b.parquet", KEYS[:1])
+
+    df = read_model_predictions(str(tmp_path), MODEL_ID, ["smiles-A"])
+
+    assert df["key"].tolist() == [KEYS[0]]
+    assert df["output"].tolist() == [{"mw": 1.0}]
+
+
+def test_read_model_predictions_missing_model(tmp_path: Path):
+    df = read_model_predictions(str(tmp_path), "eos0000", ["C"])
+
+    assert df.empty
+
+
+def test_fetcher_reads_small_requests_from_dataset(tmp_path: Path):
+    root = tmp_path / "predictions"
+    write_predictions(root / f"model_id={MODEL_ID}" / f"key_bucket={key_bucket(KEYS[0])}" / "a.parquet", KEYS[:1])
+    write_predictions(root / f"model_id={MODEL_ID}" / f"key_bucket={key_bucket(KEYS[1])}" / "b.parquet", KEYS[1:])
+
+    request = tmp_path / "request.csv"
+    pd.Series(["smiles-B", "smiles-X"]).to_csv(request, header=False, index=False)
+
+    config = DataLakeConfig()  # type: ignore
+    fetcher = LocalPredictionFetcher(config, "request-1", MODEL_ID, dataset_path=str(root))
+
+    start = time.perf_counter()
+    df = fetcher.fetch(str(request))
+
+    assert time.perf_counter() - start < 1
+    assert df["input"].tolist() == ["smiles-B"]
+    assert df["key"].tolist() == [KEYS[1]]
+
+
+def test_fetcher_skips_requests_without_precalculations(tmp_path: Path):
+    root = build_dataset(tmp_path / "predictions")
+    membership = BloomFilter.for_capacity(10)
+    membership.update(KEYS)
+    (root / f"model_id={MODEL_ID}" / MEMBERSHIP_FILE).write_bytes(membership.to_bytes())
+
+    request = tmp_path / "request.csv"
+    pd.Series([MISSING_KEY]).to_csv(request, header=False, index=False)
+
+    config = DataLakeConfig()  # type: ignore
+    # reading the bucket of the missing key would fail, so the membership filter must answer on its own
+    df = LocalPredictionFetcher(config, "request-1", MODEL_ID, dataset_path=str(root)).fetch(str(request))
+
+    assert df.empty
+    assert list(df.columns) == ["model_id", "key", "input", "output", "output_text"]
+
+
+def test_bucket_keys():
+    keys = pa.chunked_array([[KEYS[1], KEYS[0]], [KEYS[1], MISSING_KEY]])
+
+    assert bucket_keys(keys).to_pylist() == [key_bucket(key) for key in keys.to_pylist()]
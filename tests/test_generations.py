@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pyarrow.fs as pafs
+
+from precalculator.generations import (
+    current_path,
+    file_sequence,
+    list_data_files,
+    next_sequence,
+    read_generation,
+    sequence_prefix,
+    write_generation,
+)
+from precalculator.scheduler import LocalLeaseStore
+
+
+def test_generation_pointer(tmp_path: Path):
+    filesystem = pafs.LocalFileSystem()
+    partition = str(tmp_path / "model_id=eos3b5e")
+
+    assert read_generation(filesystem, partition) == 0
+    assert current_path(filesystem, partition) == partition
+
+    filesystem.create_dir(partition)
+    write_generation(filesystem, partition, 3)
+
+    assert read_generation(filesystem, partition) == 3
+    assert current_path(filesystem, partition) == f"{partition}/_gen=3"
+    assert sorted(p.name for p in Path(partition).iterdir()) == ["_generation.json"]
+
+
+def test_data_files_in_sequence_order(tmp_path: Path):
+    for name in ["key_bucket=B/000000000010_b.parquet", "key_bucket=A/000000000002_a.parquet", "legacy.parquet"]:
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_bytes(b"")
+    (tmp_path / "_gen=1").mkdir()
+    (tmp_path / "_gen=1" / "000000000011_c.parquet").write_bytes(b"")
+
+    files = list_data_files(pafs.LocalFileSystem(), str(tmp_path))
+
+    assert [Path(info.path).name for info in files] == [
+        "legacy.parquet",
+        "000000000002_a.parquet",
+        "000000000010_b.parquet",
+    ]
+    assert file_sequence(files[0].path) == -1
+    assert file_sequence(f"x/{sequence_prefix(42)}0.parquet") == 42
+
+
+def test_next_sequence_is_unique(tmp_path: Path):
+    store = LocalLeaseStore(str(tmp_path))
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        sequences = list(executor.map(lambda _: next_sequence(store), range(20)))
+
+    assert sorted(sequences) == list(range(1, 21))
@@ -0,0 +1,87 @@
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+from botocore.hooks import HierarchicalEmitter
+
+from precalculator.instrumentation import Instrumentation, StageRecord, WorkerRecord, apply_run_summary, summarize_run
+from precalculator.models import Metadata
+
+
+def test_stage_records_rows_memory_and_transfers():
+    instrumentation = Instrumentation("eos3b5e", "worker-1", "run-1", "abc123")
+    events = HierarchicalEmitter()
+    instrumentation.transfers.register(events)
+
+    with instrumentation.stage("fetch") as stage:
+        events.emit("after-call.s3.GetObject", parsed={"ContentLength": 1000})
+        stage.rows = 10
+    with instrumentation.stage("predict") as stage:
+        subprocess.run([sys.executable, "-c", "b = bytearray(50 * 1024**2)"], check=True)
+        stage.rows = 10
+    with instrumentation.stage("write_to_lake") as stage:
+        events.emit("before-send.s3.PutObject", request=SimpleNamespace(headers={"Content-Length": "300"}))
+        events.emit("before-send.s3.UploadPart", request=SimpleNamespace(headers={"Content-Length": "200"}))
+        stage.rows = 10
+
+    record = instrumentation.finish()
+
+    fetch, predict, write = record.stages
+    assert (fetch.stage, fetch.rows, fetch.bytes_downloaded, fetch.bytes_uploaded) == ("fetch", 10, 1000, 0)
+    assert (write.bytes_downloaded, write.bytes_uploaded) == (0, 500)
+    assert predict.children_peak_rss >= 50 * 1024**2
+    assert all(stage.seconds > 0 and stage.peak_rss > 0 for stage in record.stages)
+    assert (record.bytes_downloaded, record.bytes_uploaded) == (1000, 500)
+    assert WorkerRecord.model_validate_json(record.model_dump_json()) == record
+
+
+def test_failed_stage_is_recorded():
+    instrumentation = Instrumentation("eos3b5e", "worker-1", "run-1", "abc123")
+
+    with pytest.raises(RuntimeError), instrumentation.stage("predict"):
+        raise RuntimeError("model failed")
+
+    assert [stage.stage for stage in instrumentation.finish().stages] == ["predict"]
+
+
+def worker(worker_id: str, started_at: float, finished_at: float, rows: int) -> WorkerRecord:
+    stages = [
+        StageRecord(stage="predict", started_at=started_at, seconds=finished_at - started_at - 1, rows=rows),
+        StageRecord(stage="write_to_lake", started_at=finished_at - 1, seconds=0.5, rows=rows // 2),
+        StageRecord(stage="write_to_lake", started_at=finished_at - 0.5, seconds=0.5, rows=rows - rows // 2),
+    ]
+    return WorkerRecord(
+        model_id="eos3b5e",
+        worker_id=worker_id,
+        run_id="run-1",
+        git_sha="abc123",
+        started_at=started_at,
+        finished_at=finished_at,
+        stages=stages,
+    )
+
+
+def test_summarize_run_finds_stragglers():
+    records = [
+        worker("worker-1", 100, 200, 1000),
+        worker("worker-2", 105, 195, 1000),
+        worker("worker-3", 100, 400, 1000),
+    ]
+
+    for record, batch_size in zip(records, (500, 500, 1000), strict=True):
+        record.batch_size = batch_size
+
+    summary = summarize_run(records)
+
+    assert (summary.workers, summary.duration, summary.rows) == (3, 300, 3000)
+    assert summary.rows_per_second == 10
+    assert summary.stage_seconds == {"predict": 99 + 89 + 299, "write_to_lake": 3}
+    assert (summary.slowest_worker, summary.slowest_worker_duration) == ("worker-3", 300)
+    assert summary.stragglers == ["worker-3"]
+
+    metadata = apply_run_summary(Metadata(model_id="eos3b5e", pipeline_latest_duration=320), summary)
+    assert metadata.pipeline_latest_duration == 320
+    assert (metadata.pipeline_workers, metadata.pipeline_workers_duration) == (3, 300)
+    assert metadata.pipeline_stragglers == ["worker-3"]
+    assert metadata.batch_size == 500
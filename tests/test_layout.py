@@ -0,0 +1,24 @@
+import hashlib
+
+from precalculator.layout import KEY_BUCKET_COUNT, key_bucket, key_buckets, request_keys
+
+
+def test_key_buckets():
+    keys = ["QTBSBXVTEAMEQO-UHFFFAOYSA-N", "BSYNRYMUTXBXSQ-UHFFFAOYSA-N", "QTBSBXVTEAMEQO-UHFFFAOYSA-O"]
+
+    assert key_bucket(keys[0]) == "29"
+    # keys are hashed whole, so the buckets don't follow their leading characters
+    assert key_buckets(keys) == ["13", "29", "3f"]
+    # the first block of an InChIKey is itself derived from a hash
+    hashed = [hashlib.sha256(str(i).encode()).hexdigest()[:14].upper() for i in range(10_000)]
+    assert len({key_bucket(f"{block}-UHFFFAOYSA-N") for block in hashed}) == KEY_BUCKET_COUNT
+
+
+def test_request_keys():
+    assert request_keys([" QTBSBXVTEAMEQO-UHFFFAOYSA-N", "BSYNRYMUTXBXSQ-UHFFFAOYSA-N"]) == [
+        "QTBSBXVTEAMEQO-UHFFFAOYSA-N",
+        "BSYNRYMUTXBXSQ-UHFFFAOYSA-N",
+    ]
+    # SMILES can't be mapped to buckets without computing their keys
+    assert request_keys(["QTBSBXVTEAMEQO-UHFFFAOYSA-N", "CC(=O)O"]) is None
+    assert request_keys([]) is None
@@ -0,0 +1,137 @@
+import threading
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import pytest
+
+from precalculator.dataset import OUTPUT_TEXT_TYPE, OUTPUT_TYPE, bucket_keys
+from precalculator.loader import RateLimiter, load_items, load_model_predictions, prediction_items
+
+
+class FakeDynamoDB:
+    """batch_write_item that leaves the last item of the first few calls unprocessed, like a throttled table"""
+
+    def __init__(self, throttled_calls: int = 0):
+        self.items: dict[tuple[str, str], dict] = {}
+        self.throttled_calls = throttled_calls
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def batch_write_item(self, RequestItems: dict) -> dict:  # noqa: N803
+        ((table_name, requests),) = RequestItems.items()
+        assert len(requests) <= 25
+        keys = [(r["PutRequest"]["Item"]["PK"]["S"], r["PutRequest"]["Item"]["SK"]["S"]) for r in requests]
+        assert len(set(keys)) == len(keys), "duplicate keys in batch"
+
+        with self.lock:
+            self.calls += 1
+            throttled = self.calls <= self.throttled_calls
+        processed, unprocessed = (requests[:-1], requests[-1:]) if throttled else (requests, [])
+
+        with self.lock:
+            for request in processed:
+                item = request["PutRequest"]["Item"]
+                self.items[(item["PK"]["S"], item["SK"]["S"])] = item
+        return {"UnprocessedItems": {table_name: unprocessed} if unprocessed else {}}
+
+
+def write_partition(path: Path, keys: list[str], name: str = "000000000001_a.parquet", score: float = 0.0) -> None:
+    """Write keys to their bucket directories like a writer does, each scored by its position plus `score`"""
+    output = pa.array([[("score", score + i), ("nan", float("nan"))] for i in range(len(keys))], OUTPUT_TYPE)
+    table = pa.table({"key": keys, "input": [f"smiles-{k}" for k in keys], "output": output})
+    buckets = bucket_keys(table["key"])
+    for bucket in pc.unique(buckets).to_pylist():
+        (path / f"key_bucket={bucket}").mkdir(parents=True, exist_ok=True)
+        pq.write_table(table.filter(pc.equal(buckets, bucket)), path / f"key_bucket={bucket}" / name)
+
+
+def test_prediction_items():
+    output = pa.array([[("score", 0.5), ("missing", None)]], OUTPUT_TYPE)
+    output_text = pa.array([[("label", "active")]], OUTPUT_TEXT_TYPE)
+    batch = pa.record_batch({"key": ["AAA"], "input": ["CCO"], "output": output, "output_text": output_text})
+
+    (item,) = prediction_items(batch, "eos3b5e")
+
+    assert item == {
+        "PK": {"S": "INPUTKEY#AAA"},
+        "SK": {"S": "MODELID#eos3b5e"},
+        "Smiles": {"S": "CCO"},
+        "Precalculation": {"M": {"score": {"N": "0.5"}, "missing": {"NULL": True}, "label": {"S": "active"}}},
+    }
+
+
+def test_load_model_predictions(tmp_path: Path):
+    keys = [f"K{i:04d}" for i in range(1000)]
+    write_partition(tmp_path / "model_id=eos3b5e", keys)
+    client = FakeDynamoDB(throttled_calls=5)
+
+    stats = load_model_predictions(client, "precalculations", str(tmp_path), "eos3b5e", workers=4, read_rows=300)
+
+    assert (stats.rows_read, stats.items_written, stats.batches) == (1000, 1000, 40)
+    assert stats.retries == 5
+    assert set(client.items) == {(f"INPUTKEY#{key}", "MODELID#eos3b5e") for key in keys}
+    assert client.items[("INPUTKEY#K0003", "MODELID#eos3b5e")]["Precalculation"]["M"]["score"] == {"N": "3.0"}
+
+
+def test_keys_are_loaded_from_the_newest_file(tmp_path: Path):
+    keys = [f"K{i:04d}" for i in range(100)]
+    partition = tmp_path / "model_id=eos3b5e"
+    write_partition(partition, keys, name="000000000002_b.parquet", score=1000.0)
+    # an earlier write of the same keys, e.g. by a work unit that was retried
+    write_partition(partition, keys, name="000000000001_a.parquet")
+    client = FakeDynamoDB()
+
+    stats = load_model_predictions(client, "precalculations", str(tmp_path), "eos3b5e", workers=4, read_rows=7)
+
+    assert (stats.rows_read, stats.items_written) == (200, 100)
+    assert client.items[("INPUTKEY#K0003", "MODELID#eos3b5e")]["Precalculation"]["M"]["score"] == {"N": "1003.0"}
+
+
+def test_partition_with_unbucketed_files_is_refused(tmp_path: Path):
+    partition = tmp_path / "model_id=eos3b5e"
+    write_partition(partition, ["K0000"])
+    pq.write_table(pa.table({"key": ["K0001"], "input": ["smiles-K0001"]}), partition / "legacy.parquet")
+
+    with pytest.raises(ValueError, match="compact the partition"):
+        load_model_predictions(FakeDynamoDB(), "precalculations", str(tmp_path), "eos3b5e")
+
+
+def test_duplicate_keys_are_not_written_in_the_same_batch():
+    items = [{"PK": {"S": f"INPUTKEY#{i % 3}"}, "SK": {"S": "MODELID#m"}, "Value": {"N": str(i)}} for i in range(6)]
+    client = FakeDynamoDB()
+
+    stats = load_items(client, "precalculations", items, workers=2)
+
+    assert stats.items_written == 3
+    assert client.items[("INPUTKEY#0", "MODELID#m")]["Value"] == {"N": "3"}  # the last occurrence wins
+
+
+def test_unprocessed_items_exhaust_retries(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr("precalculator.loader.time.sleep", lambda seconds: None)  # noqa: ARG005
+    items = [{"PK": {"S": f"INPUTKEY#{i}"}, "SK": {"S": "MODELID#m"}} for i in range(2)]
+
+    with pytest.raises(RuntimeError, match="still unprocessed"):
+        load_items(FakeDynamoDB(throttled_calls=100), "precalculations", items, workers=1)
+
+
+def test_rate_limiter():
+    now = [0.0]
+    waits = []
+
+    def sleep(seconds: float) -> None:
+        waits.append(seconds)
+        now[0] += seconds
+
+    limiter = RateLimiter(100, clock=lambda: now[0], sleep=sleep)
+
+    limiter.acquire(100)  # the bucket starts full
+    assert waits == []
+
+    limiter.acquire(50)
+    assert waits == [0.5]
+
+    now[0] += 1.0
+    limiter.acquire(100)
+    assert waits == [0.5]
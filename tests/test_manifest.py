@@ -0,0 +1,22 @@
+from pathlib import Path
+
+from precalculator.manifest import MANIFEST_KEY, ModelManifest, update_model_manifest
+from precalculator.models import Metadata
+from precalculator.scheduler import LocalLeaseStore
+
+
+def test_update_model_manifest(tmp_path: Path):
+    store = LocalLeaseStore(str(tmp_path))
+
+    update_model_manifest(store, Metadata(model_id="eos3b5e", preds_in_store=True, total_unique_preds=10))
+    update_model_manifest(store, Metadata(model_id="eos4e40", preds_in_store=True, preds_last_updated=1700000000))
+    manifest = update_model_manifest(store, Metadata(model_id="eos3b5e", preds_in_store=True, total_unique_preds=20))
+
+    saved = ModelManifest.model_validate_json(store.read(MANIFEST_KEY)[0])  # type: ignore
+    assert saved == manifest
+    assert sorted(saved.models) == ["eos3b5e", "eos4e40"]
+    assert saved.models["eos3b5e"].total_unique_preds == 20
+    assert saved.models["eos4e40"].preds_last_updated == 1700000000
+
+    manifest = update_model_manifest(store, Metadata(model_id="eos4e40", preds_in_store=False))
+    assert list(manifest.models) == ["eos3b5e"]
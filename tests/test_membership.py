@@ -0,0 +1,23 @@
+from precalculator.membership import BloomFilter, split_request
+
+
+def test_bloom_filter_round_trip():
+    membership = BloomFilter.for_capacity(10_000, error_rate=0.01)
+    members = [f"{i:014d}-UHFFFAOYSA-N" for i in range(10_000)]
+    membership.update(members)
+
+    restored = BloomFilter.from_bytes(membership.to_bytes())
+
+    assert restored.count == 10_000
+    assert all(value in restored for value in members)
+
+    others = [f"{i:014d}-UHFFFAOYSA-M" for i in range(10_000)]
+    false_positives = sum(value in restored for value in others)
+    assert false_positives < 200
+
+
+def test_split_request():
+    membership = BloomFilter.for_capacity(10)
+    membership.update(["CCO", "c1ccccc1"])
+
+    assert split_request(membership, ["c1ccccc1", "CCN", "CCO"]) == (["c1ccccc1", "CCO"], ["CCN"])
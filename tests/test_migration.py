@@ -0,0 +1,61 @@
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+import pytest
+
+from precalculator.compaction import compact_partition
+from precalculator.dataset import PREDICTION_SCHEMA, read_model_predictions
+from precalculator.membership import MEMBERSHIP_FILE
+from precalculator.migration import find_legacy_files, migrate_partition
+
+MODEL_ID = "eos3b5e"
+KEYS = ["AAAAAAAAAAAAAA-UHFFFAOYSA-N", "BBBBBBBBBBBBBB-UHFFFAOYSA-N"]
+
+
+def write_legacy_file(path: Path, outputs: list[str]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    table = pa.table({"key": KEYS[: len(outputs)], "input": ["CCO", "CCN"][: len(outputs)], "output": outputs})
+    pq.write_table(table, path)
+
+
+def test_migrate_partition_splits_legacy_outputs(tmp_path: Path):
+    partition = tmp_path / f"model_id={MODEL_ID}"
+    write_legacy_file(partition / "key_bucket=A" / "a.parquet", ["0.5,active,nan", "1.5,inactive,"])
+
+    with pytest.raises(ValueError, match="legacy string format"):
+        compact_partition(str(partition))
+
+    result = migrate_partition(str(partition), ["score", "label", "mw"])
+
+    assert (result.files, result.rows, result.deleted) == (1, 2, False)
+    assert find_legacy_files(pafs.LocalFileSystem(), str(partition)) == []
+    assert [p.name for p in (partition / "key_bucket=A").iterdir()] == ["a.parquet"]
+
+    table = pq.read_table(partition / "key_bucket=A" / "a.parquet")
+    assert table.schema == PREDICTION_SCHEMA
+    assert table["output"][0].as_py()[0] == ("score", 0.5)
+    assert table["output_text"].to_pylist() == [[("label", "active")], [("label", "inactive")]]
+
+    df = read_model_predictions(str(tmp_path), MODEL_ID, ["CCN"])
+    assert df["output"].iloc[0] == {"score": 1.5, "mw": None}
+
+
+def test_migrate_partition_rejects_ambiguous_outputs(tmp_path: Path):
+    partition = tmp_path / f"model_id={MODEL_ID}"
+    write_legacy_file(partition / "a.parquet", ["0.5,a,b"])
+
+    with pytest.raises(ValueError, match="1 rows don't have 2 outputs"):
+        migrate_partition(str(partition), ["score", "label"])
+
+
+def test_migrate_partition_deletes_legacy_files(tmp_path: Path):
+    partition = tmp_path / f"model_id={MODEL_ID}"
+    write_legacy_file(partition / "a.parquet", ["0.5"])
+    (partition / MEMBERSHIP_FILE).write_bytes(b"filter")
+
+    result = migrate_partition(str(partition))
+
+    assert (result.files, result.deleted) == (1, True)
+    assert list(partition.iterdir()) == []
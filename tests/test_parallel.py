@@ -0,0 +1,44 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+from precalculator.parallel import available_memory, merge_csvs, plan_processes, run_processes, split_csv
+
+
+def test_plan_processes_is_bounded_by_inputs_and_limit():
+    assert plan_processes(3, max_processes=8, memory_per_process=1) == 3
+    assert plan_processes(1000, max_processes=4, memory_per_process=1) == 4
+    assert plan_processes(0, max_processes=4, memory_per_process=1) == 1
+
+
+def test_available_memory_reads_mem_available(tmp_path: Path):
+    meminfo = tmp_path / "meminfo"
+    meminfo.write_text("MemTotal:       16000000 kB\nMemFree:          500000 kB\nMemAvailable:    8000000 kB\n")
+
+    assert available_memory(str(meminfo)) == 8000000 * 1024
+    assert available_memory(str(tmp_path / "missing")) is None
+
+
+def test_split_and_merge_preserve_order(tmp_path: Path):
+    input_path = tmp_path / "input.csv"
+    pd.DataFrame({"smiles": [f"C{i}" for i in range(11)]}).to_csv(input_path, index=False)
+
+    parts = split_csv(str(input_path), 3, str(tmp_path / "parts"))
+
+    assert [rows for _, rows in parts] == [3, 4, 4]
+
+    merged_path = tmp_path / "merged.csv"
+    merge_csvs([path for path, _ in parts], str(merged_path))
+
+    assert merged_path.read_text() == input_path.read_text()
+
+
+def test_run_processes_reports_each_process():
+    commands = [[sys.executable, "-c", f"import sys; sys.exit({code})"] for code in (0, 3)]
+
+    stats = run_processes(commands, [10, 20])
+
+    assert [stat.returncode for stat in stats] == [0, 3]
+    assert [stat.rows for stat in stats] == [10, 20]
+    assert all(stat.rows_per_second > 0 for stat in stats)
@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+
+from precalculator.pipeline import PipelineError, run_pipelined
+
+
+def test_run_pipelined_consumes_in_order():
+    consumed = []
+
+    n = run_pipelined(range(10), lambda i: i * i, consumed.append, queue_depth=2)
+
+    assert n == 10
+    assert consumed == [i * i for i in range(10)]
+
+
+def test_run_pipelined_bounds_pending_results():
+    pending = []
+    max_pending = 0
+    lock = threading.Lock()
+
+    def produce(i: int) -> int:
+        nonlocal max_pending
+        with lock:
+            pending.append(i)
+            max_pending = max(max_pending, len(pending))
+        return i
+
+    def consume(i: int) -> None:
+        time.sleep(0.01)
+        with lock:
+            pending.remove(i)
+
+    run_pipelined(range(20), produce, consume, queue_depth=2)
+
+    # queued results plus the one being consumed plus the one just produced
+    assert max_pending <= 2 + 2
+
+
+def test_run_pipelined_stops_on_consumer_error():
+    produced = []
+
+    def produce(i: int) -> int:
+        produced.append(i)
+        time.sleep(0.01)
+        return i
+
+    def consume(i: int) -> None:
+        if i == 1:
+            raise OSError("upload failed")
+
+    with pytest.raises(PipelineError) as e:
+        run_pipelined(range(100), produce, consume, queue_depth=1)
+
+    assert e.value.stage == "consume"
+    assert isinstance(e.value.error, OSError)
+    assert len(produced) < 100
+
+
+def test_run_pipelined_raises_producer_error():
+    def produce(i: int) -> int:
+        if i == 3:
+            raise RuntimeError("model crashed")
+        return i
+
+    consumed = []
+
+    with pytest.raises(PipelineError) as e:
+        run_pipelined(range(10), produce, consumed.append)
+
+    assert e.value.stage == "produce"
+    assert consumed == [0, 1, 2]
@@ -0,0 +1,74 @@
+import csv
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from precalculator.instrumentation import Instrumentation
+from precalculator.profiling import PROCESS_SAMPLES_FILE, ProcessSampler, Profiler, descendants, read_process_table
+
+CHILD = "import time; b = bytearray(64 * 1024**2); time.sleep(0.5)"
+SERVER = "import time; b = bytearray(64 * 1024**2); time.sleep(2)"
+
+
+def test_descendants():
+    table = {10: (1, 0.0, 0), 11: (10, 0.0, 0), 12: (11, 0.0, 0), 13: (1, 0.0, 0), 14: (10, 0.0, 0)}
+
+    assert sorted(descendants(10, table)) == [11, 12, 14]
+    assert descendants(13, table) == []
+
+
+def test_process_table_includes_this_process():
+    table = read_process_table()
+
+    ppid, cpu_seconds, rss = table[os.getpid()]
+    assert ppid == os.getppid()
+    assert cpu_seconds > 0 and rss > 0
+
+
+def test_profiled_stages_write_artifacts(tmp_path: Path):
+    profiler = Profiler(str(tmp_path), sample_interval=0.05)
+    instrumentation = Instrumentation("eos3b5e", "worker-1", "run-1", "abc123", profiler=profiler)
+
+    with instrumentation.stage("predict"):
+        subprocess.run([sys.executable, "-c", CHILD], check=True)
+    with instrumentation.stage("postprocess"):
+        rows = [str(i) * 10 for i in range(100_000)]
+    instrumentation.finish()
+
+    assert sorted(os.listdir(tmp_path)) == [
+        "001-predict-memory.txt",
+        "001-predict.prof",
+        "001-predict.txt",
+        "002-postprocess-memory.txt",
+        "002-postprocess.prof",
+        "002-postprocess.txt",
+        PROCESS_SAMPLES_FILE,
+    ]
+    assert "subprocess.py" in (tmp_path / "001-predict.txt").read_text()
+    assert "test_profiling.py" in (tmp_path / "002-postprocess-memory.txt").read_text()
+    assert len(rows) == 100_000
+
+    with open(tmp_path / PROCESS_SAMPLES_FILE) as f:
+        samples = list(csv.DictReader(f))
+    predict = [sample for sample in samples if sample["stages"] == "predict" and int(sample["processes"]) > 0]
+    assert predict
+    assert max(int(sample["rss_bytes"]) for sample in predict) >= 64 * 1024**2
+
+
+def test_sampler_includes_the_model_server(tmp_path: Path):
+    token = f"server-{os.getpid()}"
+    # started by a shell that exits right away, so the server is not a descendant, like a model served in Docker
+    subprocess.run(["sh", "-c", f'"{sys.executable}" -c "{SERVER}" {token} &'], check=True)
+    sampler = ProcessSampler(str(tmp_path / PROCESS_SAMPLES_FILE), interval=0.05, server_pattern=token)
+
+    sampler.start()
+    time.sleep(0.5)
+    sampler.stop()
+
+    with open(tmp_path / PROCESS_SAMPLES_FILE) as f:
+        samples = list(csv.DictReader(f))
+    assert samples
+    assert max(int(sample["server_rss_bytes"]) for sample in samples) >= 64 * 1024**2
+    assert all(int(sample["rss_bytes"]) >= int(sample["server_rss_bytes"]) for sample in samples)
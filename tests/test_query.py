@@ -0,0 +1,93 @@
+import sqlite3
+
+import pytest
+
+from precalculator.layout import key_bucket
+from precalculator.query import build_prediction_query, quote_literal
+
+MODEL_ID = "eos3b5e"
+KEYS = ["AAAAAAAAAAAAAA-UHFFFAOYSA-N", "ABBBBBBBBBBBBB-UHFFFAOYSA-N", "BBBBBBBBBBBBBB-UHFFFAOYSA-N"]
+
+
+def run(query: str, params: list[str], rewritten: tuple[tuple, ...] = ()) -> list[tuple]:
+    """Run a query on a small SQLite copy of the predictions and requests tables, substituting the parameters as
+    Athena does"""
+    db = sqlite3.connect(":memory:")
+    db.execute('create table predictions (model_id, key, input, output, output_text, key_bucket, "$path")')
+    db.execute("create table requests (input, request_id)")
+    for model_id in (MODEL_ID, "eos0000"):
+        db.executemany(
+            "insert into predictions values (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (model_id, key, f"smiles-{i}", i, None, key_bucket(key), "000000000001_a.parquet")
+                for i, key in enumerate(KEYS)
+            ],
+        )
+    # predictions written again by a later write, before compaction
+    db.executemany(
+        "insert into predictions values (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (MODEL_ID, key, f"smiles-{i}", output, None, key_bucket(key), "000000000002_b.parquet")
+            for i, key, output in rewritten
+        ],
+    )
+    db.executemany("insert into requests values (?, ?)", [("smiles-0", "r1"), ("smiles-0", "r1"), ("smiles-2", "r1")])
+
+    parts = query.split("?")
+    assert len(parts) == len(params) + 1
+    sql = parts[0] + "".join(param + part for param, part in zip(params, parts[1:], strict=True))
+
+    return sorted(db.execute(sql).fetchall())
+
+
+def test_in_list_query():
+    query, params = build_prediction_query(MODEL_ID, "r1", ["smiles-2", "smiles-0", "smiles-2"])
+
+    assert "requests" not in query
+    assert len(params) == 3
+    assert run(query, params) == [(MODEL_ID, KEYS[0], "smiles-0", 0, None), (MODEL_ID, KEYS[2], "smiles-2", 2, None)]
+
+
+def test_semi_join_query():
+    query, params = build_prediction_query(MODEL_ID, "r1", ["smiles-0", "smiles-2"], max_in_list=1)
+
+    assert "from requests r" in query
+    # duplicate inputs in the request don't duplicate predictions
+    assert run(query, params) == [(MODEL_ID, KEYS[0], "smiles-0", 0, None), (MODEL_ID, KEYS[2], "smiles-2", 2, None)]
+
+
+def test_keys_written_twice_are_returned_once():
+    rewritten = ((0, KEYS[0], 10),)
+    in_list = build_prediction_query(MODEL_ID, "r1", KEYS[:2], column="key")
+    semi_join = build_prediction_query(MODEL_ID, "r1", ["smiles-0", "smiles-2"], max_in_list=1)
+
+    assert run(*in_list, rewritten) == [
+        (MODEL_ID, KEYS[0], "smiles-0", 10, None),
+        (MODEL_ID, KEYS[1], "smiles-1", 1, None),
+    ]
+    assert run(*semi_join, rewritten) == [
+        (MODEL_ID, KEYS[0], "smiles-0", 10, None),
+        (MODEL_ID, KEYS[2], "smiles-2", 2, None),
+    ]
+
+
+def test_key_query_prunes_buckets():
+    query, params = build_prediction_query(MODEL_ID, "r1", KEYS[:2], column="key")
+
+    assert "key_bucket in (?, ?)" in query
+    assert sorted(params[1:3]) == sorted(f"'{key_bucket(key)}'" for key in KEYS[:2])
+    assert [row[1] for row in run(query, params)] == KEYS[:2]
+
+
+def test_parameters_are_quoted():
+    assert quote_literal("O=C(O)c1ccccc1'") == "'O=C(O)c1ccccc1'''"
+
+    query, params = build_prediction_query(MODEL_ID, "r1", ["x' or '1' = '1"])
+    assert run(query, params) == []
+
+
+def test_invalid_queries():
+    with pytest.raises(ValueError):
+        build_prediction_query(MODEL_ID, "r1", [])
+    with pytest.raises(ValueError):
+        build_prediction_query(MODEL_ID, "r1", ["C"], prediction_table="predictions; drop table requests")
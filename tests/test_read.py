@@ -0,0 +1,124 @@
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+import pytest
+
+from precalculator.compaction import compact_partition
+from precalculator.generations import KEY_COUNTS_FILE
+from precalculator.layout import key_bucket, key_buckets
+from precalculator.read import KeyCounts, get_metadata, read_partition_stats
+
+
+def write_file(path: Path, keys: list[str]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    table = pa.table({"key": keys, "input": [f"smiles-{k}" for k in keys], "output": [1.0] * len(keys)})
+    pq.write_table(table, path)
+
+
+def test_compacted_partition_stats_from_footers(tmp_path: Path):
+    partition = tmp_path / "predictions" / "model_id=eos3b5e"
+    write_file(partition / "a.parquet", ["AC", "AA", "AB", "AA"])
+    write_file(partition / "b.parquet", ["BB", "BA"])
+    compact_partition(str(partition), row_group_size=2)
+
+    stats = read_partition_stats(str(tmp_path / "predictions"), "eos3b5e")
+
+    assert (stats.files, stats.rows, stats.unique_keys) == (len(key_buckets(["AA", "AB", "AC", "BA", "BB"])), 5, 5)
+    assert (stats.key_min, stats.key_max) == ("AA", "BB")
+    assert stats.new_files == 0
+    assert stats.bytes == sum(p.stat().st_size for p in partition.glob("_gen=1/key_bucket=*/*.parquet"))
+    assert stats.last_modified > 0
+
+
+def test_files_written_since_compaction_are_counted_exactly(tmp_path: Path):
+    partition = tmp_path / "predictions" / "model_id=eos3b5e"
+    write_file(partition / "a.parquet", ["AA", "AB", "AC"])
+    write_file(partition / "b.parquet", ["BA", "BB"])
+    compact_partition(str(partition))
+
+    # one key already compacted, one repeated between the new files, two new
+    write_file(partition / "_gen=1" / f"key_bucket={key_bucket('AB')}" / "000000000001_new.parquet", ["AB", "AD"])
+    write_file(partition / "_gen=1" / f"key_bucket={key_bucket('CA')}" / "000000000002_new.parquet", ["AD", "CA"])
+    # written to the generation that was compacted, which is no longer read
+    write_file(partition / "key_bucket=D" / "000000000003_old.parquet", ["DA"])
+
+    stats = read_partition_stats(str(tmp_path / "predictions"), "eos3b5e")
+
+    compacted = len(key_buckets(["AA", "AB", "AC", "BA", "BB"]))
+    assert (stats.files, stats.rows, stats.new_files) == (compacted + 2, 9, 2)
+    assert stats.unique_keys == 7
+    assert (stats.key_min, stats.key_max) == ("AA", "CA")
+
+
+def test_files_are_counted_once(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    partition = tmp_path / "predictions" / "model_id=eos3b5e"
+    write_file(partition / "a.parquet", ["AA", "AB"])
+    compact_partition(str(partition))
+    bucket = partition / "_gen=1" / f"key_bucket={key_bucket('AD')}"
+    write_file(bucket / "000000000001_new.parquet", ["AD"])
+
+    assert read_partition_stats(str(tmp_path / "predictions"), "eos3b5e").new_files == 1
+    counts = KeyCounts.model_validate_json((partition / "_gen=1" / KEY_COUNTS_FILE).read_text())
+    assert counts.files == {f"key_bucket={key_bucket('AD')}/000000000001_new.parquet": 1}
+
+    # a key of a counted file is found without reading that file's keys again
+    write_file(bucket / "000000000002_new.parquet", ["AD"])
+    reads = []
+    read_table = pq.read_table
+    monkeypatch.setattr(pq, "read_table", lambda path, **kwargs: reads.append(path) or read_table(path, **kwargs))
+    stats = read_partition_stats(str(tmp_path / "predictions"), "eos3b5e")
+
+    assert (stats.unique_keys, stats.new_files) == (3, 1)
+    assert [path.rsplit("/", 1)[1] for path in reads] == ["000000000002_new.parquet"]
+    assert read_partition_stats(str(tmp_path / "predictions"), "eos3b5e").new_files == 0
+
+
+def test_uncompacted_partition(tmp_path: Path):
+    partition = tmp_path / "predictions" / "model_id=eos3b5e"
+    write_file(partition / "key_bucket=A" / "a.parquet", ["AA", "AB"])
+    write_file(partition / "key_bucket=A" / "b.parquet", ["AB", "AC"])
+
+    stats = read_partition_stats(str(tmp_path / "predictions"), "eos3b5e")
+
+    assert (stats.files, stats.rows, stats.unique_keys, stats.new_files) == (2, 4, 3, 2)
+
+    # the counts of generation 0 are kept in the partition directory, and deleted with that generation
+    assert (partition / KEY_COUNTS_FILE).exists()
+    compact_partition(str(partition))
+    compact_partition(str(partition))
+    assert not (partition / KEY_COUNTS_FILE).exists()
+
+
+def test_get_metadata(tmp_path: Path):
+    write_file(tmp_path / "predictions" / "model_id=eos3b5e" / "key_bucket=A" / "a.parquet", ["AA", "AB"])
+
+    metadata = get_metadata(
+        str(tmp_path),
+        "meta/eos3b5e.json",
+        "s3://bucket/meta/eos3b5e.json",
+        "eos3b5e",
+        1700000000,
+        1700000600,
+        prediction_table="predictions",
+        filesystem=pafs.LocalFileSystem(),
+    )
+
+    assert metadata.preds_in_store
+    assert (metadata.total_unique_preds, metadata.total_rows, metadata.total_files) == (2, 2, 1)
+    assert metadata.pipeline_latest_duration == 600
+    assert metadata.pipeline_meta_s3_uri == "s3://bucket/meta/eos3b5e.json"
+
+    missing = get_metadata(
+        str(tmp_path),
+        "meta/x.json",
+        "",
+        "eos0none",
+        0,
+        0,
+        prediction_table="predictions",
+        filesystem=pafs.LocalFileSystem(),
+    )
+    assert not missing.preds_in_store
+    assert missing.total_unique_preds == 0
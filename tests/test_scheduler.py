@@ -0,0 +1,110 @@
+import threading
+import time
+from pathlib import Path
+
+from precalculator.scheduler import LocalLeaseStore, WorkScheduler, build_manifest
+
+
+def test_build_manifest_covers_every_row_once():
+    manifest = build_manifest(25, unit_size=10)
+
+    assert [(u.start_row, u.end_row) for u in manifest.units] == [(0, 10), (10, 20), (20, 25)]
+    assert build_manifest(0).units == []
+
+
+def test_local_lease_store_is_atomic(tmp_path: Path):
+    store = LocalLeaseStore(str(tmp_path))
+
+    version = store.create("a", b"1")
+    assert version is not None
+    assert store.create("a", b"2") is None
+
+    assert store.replace("a", b"3", "stale") is None
+    assert store.replace("a", b"3", version) is not None
+    assert store.read("a")[0] == b"3"
+
+
+def test_workers_process_every_unit_exactly_once(tmp_path: Path):
+    store = LocalLeaseStore(str(tmp_path))
+    manifest = build_manifest(1000, unit_size=10)
+    processed = []
+    lock = threading.Lock()
+
+    def worker(worker_id: str, delay: float) -> None:
+        scheduler = WorkScheduler(store, manifest, worker_id, poll_seconds=0.01)
+        for unit in scheduler:
+            time.sleep(delay)
+            with lock:
+                processed.append((worker_id, unit.unit_id))
+            assert scheduler.complete(unit)
+
+    threads = [threading.Thread(target=worker, args=(f"w{i}", 0.001 * i)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    unit_ids = sorted(unit_id for _, unit_id in processed)
+    assert unit_ids == sorted(unit.unit_id for unit in manifest.units)
+
+    # the fastest worker takes on more units than the slowest one
+    counts = {worker_id: sum(w == worker_id for w, _ in processed) for worker_id in ("w0", "w3")}
+    assert counts["w0"] > counts["w3"]
+
+
+def test_expired_lease_is_reclaimed(tmp_path: Path):
+    store = LocalLeaseStore(str(tmp_path))
+    manifest = build_manifest(10, unit_size=10)
+
+    crashed = WorkScheduler(store, manifest, "crashed", lease_seconds=0)
+    unit = crashed.claim()
+    assert unit is not None
+
+    survivor = WorkScheduler(store, manifest, "survivor")
+    assert survivor.claim() == unit
+    assert survivor.complete(unit)
+
+    # the crashed worker lost its lease, and the done unit is never handed out again
+    assert not crashed.complete(unit)
+    assert WorkScheduler(store, manifest, "late", lease_seconds=0).claim() is None
+
+
+def test_first_published_manifest_wins(tmp_path: Path):
+    store = LocalLeaseStore(str(tmp_path))
+
+    WorkScheduler(store, build_manifest(100, unit_size=10), "w1")
+    scheduler = WorkScheduler(store, build_manifest(100, unit_size=50), "w2")
+
+    assert scheduler.manifest.unit_size == 10
+
+
+def test_idle_workers_wait_for_leased_units(tmp_path: Path):
+    store = LocalLeaseStore(str(tmp_path))
+    manifest = build_manifest(30, unit_size=10)
+
+    # claims a unit and dies without completing it
+    crashed = WorkScheduler(store, manifest, "crashed", lease_seconds=0.5)
+    abandoned = crashed.claim()
+
+    survivor = WorkScheduler(store, manifest, "survivor", poll_seconds=0.05)
+    processed = []
+    for unit in survivor:
+        processed.append(unit.unit_id)
+        assert survivor.complete(unit)
+
+    assert sorted(processed) == [unit.unit_id for unit in manifest.units]
+    assert processed[-1] == abandoned.unit_id
+
+
+def test_held_lease_outlives_its_duration(tmp_path: Path):
+    store = LocalLeaseStore(str(tmp_path))
+    manifest = build_manifest(10, unit_size=10)
+
+    scheduler = WorkScheduler(store, manifest, "slow", lease_seconds=0.2)
+    unit = scheduler.claim()
+
+    with scheduler.hold(unit):
+        time.sleep(0.6)
+        assert WorkScheduler(store, manifest, "other").claim() is None
+
+    assert scheduler.complete(unit)
@@ -0,0 +1,68 @@
+from pathlib import Path
+
+import pytest
+
+from precalculator.shards import build_row_index, read_shard, shard_bounds
+
+
+@pytest.fixture
+def library(tmp_path: Path) -> Path:
+    path = tmp_path / "reference_library.csv"
+    path.write_text("smiles\n" + "".join(f"CCO{i:04d}\n" for i in range(103)))
+    return path
+
+
+def test_shard_bounds_cover_every_row_once():
+    for total in (0, 1, 49, 50, 101, 2003):
+        for denominator in (1, 7, 50):
+            rows = []
+            for numerator in range(1, denominator + 1):
+                start, end = shard_bounds(total, denominator, numerator)
+                rows.extend(range(start, end))
+            assert rows == list(range(total))
+
+
+def test_shard_bounds_rejects_invalid_numerator():
+    with pytest.raises(ValueError):
+        shard_bounds(10, 2, 3)
+
+
+def test_read_shard_matches_full_read(library: Path):
+    content = library.read_bytes()
+    lines = content.splitlines(keepends=True)
+    index = build_row_index(str(library), stride=10)
+
+    assert index.total_rows == 103
+    assert index.file_size == len(content)
+
+    requested = []
+
+    def fetch_range(first: int, last: int) -> bytes:
+        requested.append((first, last))
+        return content[first:last]
+
+    for numerator in range(1, 5):
+        start, end = shard_bounds(index.total_rows, 4, numerator)
+        assert read_shard(index, fetch_range, start, end) == lines[0] + b"".join(lines[1 + start : 1 + end])
+
+    # no request reads more than a shard plus one stride either side
+    row_length = len(lines[1])
+    assert max(last - first for first, last in requested) <= (26 + 2 * 10) * row_length
+
+
+def test_read_empty_shard_returns_header(library: Path):
+    index = build_row_index(str(library))
+    content = library.read_bytes()
+
+    assert read_shard(index, lambda first, last: content[first:last], 5, 5) == b"smiles\n"
+
+
+def test_row_index_matches_only_the_indexed_file(library: Path):
+    index = build_row_index(str(library))
+
+    assert index.matches(index.file_size)
+    assert not index.matches(index.file_size + 1)
+
+    index.etag = '"abc"'
+    assert index.matches(index.file_size, '"abc"')
+    assert not index.matches(index.file_size, '"def"')
@@ -0,0 +1,264 @@
+import io
+import sys
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from config.app import DataLakeConfig, WorkerConfig
+from precalculator.dataset import OUTPUT_TEXT_TYPE, OUTPUT_TYPE, read_model_predictions
+from precalculator.layout import key_buckets
+from precalculator.membership import MEMBERSHIP_FILE, BloomFilter
+from precalculator.models import Prediction, SchemaValidationError, validate_dataframe_schema, validate_predictions
+from precalculator.shards import build_row_index
+from precalculator.writer import INDEX_SUFFIX, INPUT_FILE_NAME, PredictionWriter, to_prediction_frame
+
+MODEL_ID = "eos3b5e"
+BUCKET = "precalcs"
+DATA_CONFIG = DataLakeConfig(
+    s3_bucket_name=BUCKET,
+    s3_input_prefix="input",
+    s3_output_prefix="output",
+    s3_upload_prefix="upload",
+    athena_database="precalcs",
+    athena_prediction_table="predictions",
+    athena_request_table="requests",
+)
+
+
+class FakeS3:
+    class exceptions:  # noqa: N801
+        class NoSuchKey(Exception):  # noqa: N818
+            pass
+
+    def __init__(self, objects: dict[str, bytes]):
+        self.objects = objects
+
+    def head_object(self, Bucket: str, Key: str) -> dict:  # noqa: N803, ARG002
+        return {"ContentLength": len(self.objects[Key]), "ETag": f'"{hash(self.objects[Key])}"'}
+
+    def get_object(
+        self, Bucket: str, Key: str, Range: Optional[str] = None, IfMatch: Optional[str] = None  # noqa: N803
+    ) -> dict:
+        if Key not in self.objects:
+            raise self.exceptions.NoSuchKey(Key)
+        if IfMatch is not None:
+            assert IfMatch == self.head_object(Bucket, Key)["ETag"]
+
+        body = self.objects[Key]
+        if Range is not None:
+            first, last = (int(value) for value in Range.removeprefix("bytes=").split("-"))
+            body = body[first : last + 1]
+        return {"Body": io.BytesIO(body)}
+
+
+def make_writer(s3: FakeS3, **worker_options: object) -> PredictionWriter:
+    writer = PredictionWriter(
+        DATA_CONFIG, WorkerConfig(git_sha="test", denominator=2, numerator=1, **worker_options), MODEL_ID, dev=False
+    )
+    writer.s3 = s3
+    return writer
+
+
+def test_to_prediction_frame_keeps_typed_outputs():
+    df = pd.read_csv("tests/fixtures/test_output.csv")
+    df["n_atoms"] = range(len(df))
+
+    predictions = to_prediction_frame(df, MODEL_ID)
+
+    assert list(predictions.columns) == ["key", "input", "output", "output_text", "model_id"]
+    assert predictions["output"].dtype == pd.ArrowDtype(OUTPUT_TYPE)
+    assert predictions["key"].dtype == pd.ArrowDtype(pa.string())
+    assert predictions["input"].dtype == pd.ArrowDtype(pa.string())
+    assert predictions["model_id"].dtype == "category"
+    assert (predictions["model_id"] == MODEL_ID).all()
+
+    first = dict(predictions["output"].iloc[0])
+    assert first == {"mw": df["mw"].iloc[0], "n_atoms": 0.0}
+
+    table = pa.Table.from_pandas(predictions, preserve_index=False)
+    assert table.schema.field("output").type == OUTPUT_TYPE
+
+
+def test_to_prediction_frame_from_arrow_csv():
+    df = pd.read_csv("tests/fixtures/test_output.csv", engine="pyarrow", dtype_backend="pyarrow")
+    df["failed"] = pd.array([None] * len(df), dtype=pd.ArrowDtype(pa.null()))
+
+    predictions = to_prediction_frame(df, MODEL_ID)
+
+    first = dict(predictions["output"].iloc[0])
+    assert first["mw"] == df["mw"].iloc[0]
+    assert first["failed"] is None
+    assert predictions.index.equals(pd.RangeIndex(len(df)))
+
+
+def test_to_prediction_frame_keeps_text_outputs():
+    df = pd.read_csv("tests/fixtures/test_output.csv", engine="pyarrow", dtype_backend="pyarrow")
+    df["label"] = ["active", None] * (len(df) // 2) + ["inactive"] * (len(df) % 2)
+
+    predictions = to_prediction_frame(df, MODEL_ID)
+
+    assert predictions["output_text"].dtype == pd.ArrowDtype(OUTPUT_TEXT_TYPE)
+    assert dict(predictions["output"].iloc[0]) == {"mw": df["mw"].iloc[0]}
+    assert [dict(row) for row in predictions["output_text"].iloc[:2]] == [{"label": "active"}, {"label": None}]
+    validate_predictions(predictions, MODEL_ID)
+
+    only_text = to_prediction_frame(df[["key", "input", "label"]], MODEL_ID)
+    assert dict(only_text["output"].iloc[0]) == {}
+    validate_predictions(only_text, MODEL_ID)
+
+
+def test_validate_predictions():
+    predictions = to_prediction_frame(pd.read_csv("tests/fixtures/test_output.csv"), MODEL_ID)
+
+    validate_predictions(predictions, MODEL_ID)
+    # categorical model IDs and slices of the output map are valid too
+    validate_predictions(predictions.iloc[1:3].astype({"model_id": "category"}), MODEL_ID)
+
+
+def test_validate_predictions_reports_every_error():
+    predictions = to_prediction_frame(pd.read_csv("tests/fixtures/test_output.csv"), MODEL_ID)
+    predictions.loc[0, "key"] = "not-a-key"
+    predictions.loc[1, "input"] = None
+
+    with pytest.raises(SchemaValidationError) as error:
+        validate_predictions(predictions.assign(extra=1), "eos4e40")
+
+    assert error.value.errors == [
+        "Unexpected column: extra",
+    ]
+
+    with pytest.raises(SchemaValidationError) as error:
+        validate_predictions(predictions, "eos4e40")
+
+    assert error.value.errors == [
+        "Column input has 1 null values",
+        "Column key has 1 values that are not InChIKeys, e.g. ['not-a-key']",
+        f"Column model_id has values ['{MODEL_ID}'], expected only eos4e40",
+    ]
+
+
+def test_validate_dataframe_schema_checks_object_values():
+    df = pd.DataFrame(
+        {"key": ["A"], "input": [{"smiles": "C"}], "output": [{"mw": 1.0}], "output_text": [{}], "model_id": [MODEL_ID]}
+    )
+
+    with pytest.raises(SchemaValidationError) as error:
+        validate_dataframe_schema(df, Prediction)
+
+    assert len(error.value.errors) == 1
+    assert error.value.errors[0].startswith("Column input has type struct")
+
+
+def test_validate_predictions_checks_output_shape():
+    predictions = to_prediction_frame(pd.read_csv("tests/fixtures/test_output.csv"), MODEL_ID)
+    outputs = [[("mw", 1.0)], [("mw", 1.0), ("n_atoms", 2.0)]] + [[("mw", 1.0)]] * (len(predictions) - 2)
+    predictions["output"] = pd.array(pa.array(outputs, OUTPUT_TYPE), dtype=pd.ArrowDtype(OUTPUT_TYPE))
+
+    with pytest.raises(SchemaValidationError, match="between 1 and 2 outputs per row"):
+        validate_predictions(predictions, MODEL_ID)
+
+
+def test_stale_row_index_is_ignored(tmp_path: Path):
+    library = tmp_path / INPUT_FILE_NAME
+    library.write_text("smiles\n" + "".join(f"CCO{i:04d}\n" for i in range(10)))
+    index = build_row_index(str(library), stride=2)
+
+    s3 = FakeS3(
+        {INPUT_FILE_NAME: library.read_bytes(), INPUT_FILE_NAME + INDEX_SUFFIX: index.model_dump_json().encode()}
+    )
+    writer = make_writer(s3)
+
+    assert writer._get_row_index(INPUT_FILE_NAME) == index  # noqa: SLF001
+    # ranges are read from the version of the file that was checked
+    assert writer._fetch_range(0, 7) == b"smiles\n"  # noqa: SLF001
+
+    # the library was replaced after its index was built
+    s3.objects[INPUT_FILE_NAME] += b"CCO9999\n"
+    assert writer._get_row_index(INPUT_FILE_NAME) is None  # noqa: SLF001
+
+
+def test_filter_existing_reads_the_partition_once(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    writer = make_writer(FakeS3({}))
+    reads = []
+
+    def read_existing_inputs() -> pd.Series:
+        reads.append(1)
+        return pd.Series(["CCO", "CCN"])
+
+    monkeypatch.setattr(writer, "_read_existing_inputs", read_existing_inputs)
+
+    for inputs, remaining in ((["CCO", "CCC"], ["CCC"]), (["CCN", "CCCC"], ["CCCC"])):
+        path = tmp_path / "input.csv"
+        pd.DataFrame({"smiles": inputs}).to_csv(path, index=False)
+
+        assert writer.filter_existing(str(path)) == 1
+        assert pd.read_csv(path)["smiles"].tolist() == remaining
+
+    assert len(reads) == 1
+
+
+def test_filter_existing_skips_the_read_for_new_inputs(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    membership = BloomFilter.for_capacity(10)
+    membership.update(["CCO", "CCN"])
+    key = f"predictions/model_id={MODEL_ID}/{MEMBERSHIP_FILE}"
+    writer = make_writer(FakeS3({key: membership.to_bytes()}))
+    monkeypatch.setattr(writer, "_read_existing_inputs", lambda: pytest.fail("the partition was read"))
+
+    path = tmp_path / "input.csv"
+    pd.DataFrame({"smiles": ["CCCC", "CCCCC"]}).to_csv(path, index=False)
+
+    assert writer.filter_existing(str(path)) == 2
+
+
+def test_write_to_local_dataset(tmp_path: Path):
+    writer = PredictionWriter(
+        DATA_CONFIG,
+        WorkerConfig(git_sha="test", denominator=1, numerator=1),
+        MODEL_ID,
+        dev=False,
+        dataset_path=str(tmp_path / "predictions"),
+    )
+    partition = tmp_path / "predictions" / f"model_id={MODEL_ID}"
+    partition.mkdir(parents=True)
+    (partition / MEMBERSHIP_FILE).write_bytes(BloomFilter.for_capacity(10).to_bytes())
+
+    keys = ["AAAAAAAAAAAAAA-UHFFFAOYSA-N", "BBBBBBBBBBBBBB-UHFFFAOYSA-N"]
+    outputs = pd.DataFrame({"key": keys, "input": ["CCO", "CCN"], "value": [0.1, 0.2]})
+    writer.write_to_lake(to_prediction_frame(outputs, MODEL_ID))
+    writer.write_to_lake(to_prediction_frame(outputs.assign(value=[0.3, 0.4]), MODEL_ID))
+
+    files = sorted(partition.glob("key_bucket=*/*.parquet"))
+    assert sorted({f.parent.name for f in files}) == [f"key_bucket={bucket}" for bucket in key_buckets(keys)]
+    assert [f.name[:13] for f in files[:2]] == ["000000000001_", "000000000002_"]
+    assert not (partition / MEMBERSHIP_FILE).exists()
+
+    predictions = read_model_predictions(str(tmp_path / "predictions"), MODEL_ID, keys, column="key")
+    assert sorted(dict(output)["value"] for output in predictions["output"]) == [0.3, 0.4]
+
+
+def test_failed_model_run_raises_and_leaves_no_output(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    writer = make_writer(FakeS3({}))
+    output_path = tmp_path / "output.csv"
+    output_path.write_text("key,input,value\nAAAAAAAAAAAAAA-UHFFFAOYSA-N,CCO,0.1\n")  # from the previous unit
+
+    failing = [sys.executable, "-c", "raise SystemExit(1)"]
+    monkeypatch.setattr(writer, "_ersilia_run_command", lambda input_path, output_path: failing)  # noqa: ARG005
+    with pytest.raises(RuntimeError, match="exit code 1"):
+        writer._run_model(str(tmp_path / "input.csv"), str(output_path))  # noqa: SLF001
+
+    assert not output_path.exists()
+
+
+def test_parallel_instances_are_served_separately():
+    writer = make_writer(FakeS3({}))
+
+    commands = [writer._instance_command(i, f"chunks/part {i}.csv", f"out_{i}.csv") for i in range(2)]  # noqa: SLF001
+
+    assert all(command[:2] == ["sh", "-c"] for command in commands)
+    assert "serve eos3b5e --disable-local-cache --port 3000 &&" in commands[0][2]
+    assert "--port 3001" in commands[1][2]
+    assert "-i 'chunks/part 1.csv' -o out_1.csv" in commands[1][2]
+    assert commands[0][2].endswith("close; exit $status")